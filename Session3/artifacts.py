@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pdf_builder import build_pdf, PdfBuildStats, Section
+
+ARTIFACT_DIR = os.path.join(tempfile.gettempdir(), "yt2pdf_artifacts")
+
+
+@lru_cache(maxsize=1024)
+def _file_digest(path: str, mtime_ns: int, size: int) -> str:
+    # mtime_ns/size are only part of the cache key, so a rewritten file is hashed again
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_digest(path: Optional[str]) -> Optional[str]:
+    if not path or not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    return _file_digest(os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def pdf_content_key(title: str, video_url: str, sections: List[Section], **build_kwargs) -> str:
+    """Hash of everything that ends up in the PDF: text, timestamps, screenshot bytes and build options."""
+    payload = {
+        "title": title,
+        "url": video_url,
+        "sections": [
+            [s.title, s.start, s.end, s.summary, list(s.key_points or []), file_digest(s.screenshot_path)]
+            for s in sections
+        ],
+        "build": build_kwargs,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ArtifactCache:
+    """
+    Content-addressed file cache: <root>/<key><suffix>. An artifact is written to a
+    temp file and renamed into place, so readers never see a partial file and two
+    sessions producing the same content end up sharing one file. Least recently used
+    artifacts are evicted once the cache holds more than max_entries or max_bytes.
+    """
+
+    def __init__(self, root: str = ARTIFACT_DIR, max_bytes: int = 500 * 1024 * 1024, max_entries: int = 200):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, key: str, suffix: str) -> str:
+        return os.path.join(self.root, f"{key}{suffix}")
+
+    def get_or_build(self, key: str, build: Callable[[str], object], suffix: str = ".pdf") -> Tuple[str, object]:
+        """
+        Return (path, build_result). build(tmp_path) is only called on a miss; on a hit
+        build_result is None and the artifact is marked as recently used.
+        """
+        path = self.path_for(key, suffix)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            try:
+                os.utime(path)
+                return path, None
+            except FileNotFoundError:
+                pass  # a miss, or evicted by another process: build it (again)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                result = build(tmp)
+                os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        self.evict(keep=path)
+        return path, result
+
+    def evict(self, keep: str = None):
+        """
+        Remove least recently used artifacts until the limits hold. An artifact whose key is being
+        looked up or built (its key lock is held) is skipped; an evicted key's lock is dropped.
+        """
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.root):
+                p = os.path.join(self.root, name)
+                if name.endswith(".tmp") or p == keep or not os.path.isfile(p):
+                    continue
+                st = os.stat(p)
+                entries.append((st.st_mtime, st.st_size, p))
+            entries.sort()
+            total = sum(size for _, size, _ in entries) + (os.path.getsize(keep) if keep and os.path.exists(keep) else 0)
+            count = len(entries) + (1 if keep else 0)
+            for _, size, p in entries:
+                if total <= self.max_bytes and count <= self.max_entries:
+                    break
+                key = os.path.basename(p).split(".", 1)[0]
+                key_lock = self._key_locks.get(key)
+                if key_lock is not None and not key_lock.acquire(blocking=False):
+                    continue  # in use
+                try:
+                    os.remove(p)
+                    self._key_locks.pop(key, None)
+                except OSError:
+                    continue
+                finally:
+                    if key_lock is not None:
+                        key_lock.release()
+                total -= size
+                count -= 1
+
+
+def cached_build_pdf(cache: ArtifactCache, title: str, video_url: str, sections: List[Section],
+                     **build_kwargs) -> Tuple[str, Optional[PdfBuildStats]]:
+    """
+    build_pdf through the artifact cache. Returns (pdf_path, stats); stats is None when an
+    identical PDF was already in the cache. The file can still be evicted afterwards, so a
+    reader that gets FileNotFoundError should call this again.
+    """
+    key = pdf_content_key(title, video_url, sections, **build_kwargs)
+
+    def build(tmp_path):
+        return build_pdf(tmp_path, title=title, video_url=video_url, sections=sections, **build_kwargs)
+
+    path, stats = cache.get_or_build(key, build, suffix=".pdf")
+    if stats is not None:
+        stats.path = path
+    return path, stats
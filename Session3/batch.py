@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import threading
+from contextlib import nullcontext
+from dataclasses import asdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from utils import extract_video_id
+from youtube import ytdlp_extract, ytdlp_get_stream_url, ytdlp_playlist_urls, fetch_transcript
+from transcript import compact_transcript, ColumnarTranscript
+from gemini import init_gemini, call_gemini_sections
+from pdf_builder import build_pdf
+from pipeline import Stage, run_stages, parse_sections, capture_screenshots
+from sprites import SpriteCache, SpriteSheet
+from tracing import Tracer, span
+from scheduler import default_scheduler
+from thumbnails import PDF_THUMB
+
+
+class VideoJob:
+    """
+    On-disk state for one video of a batch run, kept in <jobs_dir>/<video_id>/.
+    job.json records status/duration/error per stage; the output of each finished
+    stage lives next to it in <stage>.json so an interrupted run can pick it up again.
+    """
+
+    def __init__(self, jobs_dir: str, url: str):
+        self.url = url
+        self.video_id = extract_video_id(url)
+        self.dir = os.path.join(jobs_dir, self.video_id)
+        self.path = os.path.join(self.dir, "job.json")
+        self.warnings: List[str] = []
+        self._lock = threading.Lock()
+        os.makedirs(self.dir, exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.state = json.load(f)
+        else:
+            self.state = {"url": url, "video_id": self.video_id, "stages": {}}
+
+    def is_done(self, stage: str) -> bool:
+        return self.state["stages"].get(stage, {}).get("status") == "done"
+
+    def load_output(self, stage: str):
+        with open(os.path.join(self.dir, f"{stage}.json")) as f:
+            return json.load(f)
+
+    def record(self, stage: str, status: str, duration: float, output=None, error: str = None, persist=True):
+        with self._lock:
+            if status == "done" and persist:
+                _write_json(os.path.join(self.dir, f"{stage}.json"), output)
+            self.state["stages"][stage] = {"status": status, "duration": round(duration, 3), "error": error}
+            _write_json(self.path, self.state)
+
+
+def _write_json(path: str, data):
+    # write-then-rename so a killed run never leaves a half-written state file behind
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _resumable(job: VideoJob, name: str, fn, limit, persist=True, complete=None):
+    """
+    Wrap a stage fn so finished stages are loaded from disk and new ones run under `limit`.
+    When complete(output) is false (e.g. screenshots without a stream URL) the output is used
+    for this run but recorded as "incomplete", so a resumed run tries the stage again.
+    """
+
+    def run(inputs):
+        if persist and job.is_done(name):
+            return job.load_output(name)
+        t = time.perf_counter()
+        try:
+            with limit:
+                out = fn(inputs)
+        except Exception as e:
+            job.record(name, "failed", time.perf_counter() - t, error=str(e))
+            raise
+        if complete is not None and not complete(out):
+            job.record(name, "incomplete", time.perf_counter() - t)
+        else:
+            job.record(name, "done", time.perf_counter() - t, output=out, persist=persist)
+        return out
+
+    return run
+
+
+def process_video(job: VideoJob, out_dir: str, limits: Dict[str, Any], lang="en", use_auto=True,
+                  model="gemini-1.5-flash", max_sections=8, screenshots=True, screenshot_resolution=720,
+                  compact_granularity=10.0, media_cache=None, keyframe_snap=1.0, frame_select_k=0,
+                  search_index=None, image_max_px=PDF_THUMB[0], timeline_thumbs=0) -> str:
+    """
+    Run (or resume) the pipeline for one video and return the PDF path.
+    A Chrome trace of the run is written to <job dir>/trace.json. With a
+    search_index.SearchIndex, the transcript and sections are indexed once the PDF is built.
+    image_max_px and timeline_thumbs are as in build_pdf and run_pipeline.
+    """
+    tracer = Tracer()
+    shots_dir = os.path.join(job.dir, "shots")
+    seek = {"keyframes": None, "snap": 0.0}
+    pdf_path = os.path.join(out_dir, f"{job.video_id}.pdf")
+
+    def metadata_stage(_):
+        info = ytdlp_extract(job.url) or {}
+        return {"title": info.get("title")}
+
+    def transcript_stage(_):
+        segs = fetch_transcript(job.video_id, lang=lang, use_auto=use_auto)
+        return ColumnarTranscript.from_segments(segs).to_dict()
+
+    def gemini_stage(inputs):
+        # from_dict also reads transcript.json files written as a list of segments
+        segs = ColumnarTranscript.from_dict(inputs["transcript"])
+        transcript_text, stats = compact_transcript(segs, granularity=compact_granularity)
+        with job._lock:
+            job.state["compaction"] = str(stats)
+        sections_json = call_gemini_sections(init_gemini(model), transcript_text, max_sections=max_sections,
+                                             priority="batch")
+        return sections_json.get("sections", [])
+
+    def stream_url_stage(_):
+        # Stream URLs expire, so this stage is never persisted and is skipped once screenshots
+        # (and the timeline) exist
+        if (not screenshots or job.is_done("screenshots")) and (not timeline_thumbs or job.is_done("timeline")):
+            return None
+        try:
+            if media_cache is not None:
+                path, seek["keyframes"] = media_cache.fetch(job.url, job.video_id)
+                seek["snap"] = keyframe_snap
+                return path
+            return ytdlp_get_stream_url(job.url, resolution=screenshot_resolution)
+        except Exception as e:
+            job.warnings.append(f"Failed to resolve stream URL for screenshots: {e}")
+            return None
+
+    def screenshots_stage(inputs):
+        sections = parse_sections(inputs["gemini"])
+        if inputs["stream_url"] and sections:
+            capture_screenshots(inputs["stream_url"], sections, shots_dir, warn=job.warnings.append,
+                                limit=limits["ffmpeg"], frame_select_k=frame_select_k, tracer=tracer, **seek)
+        return [s.screenshot_path for s in sections]
+
+    def timeline_stage(inputs):
+        if not inputs["stream_url"]:
+            return None
+        try:
+            with span(tracer, "timeline_sprites", "ffmpeg", thumbs=timeline_thumbs):
+                return asdict(SpriteCache().get(job.video_id, inputs["stream_url"], max_thumbs=timeline_thumbs))
+        except Exception as e:
+            job.warnings.append(f"Timeline sprite generation failed: {e}")
+            return None
+
+    def pdf_stage(inputs):
+        sections = parse_sections(inputs["gemini"])
+        for s, path in zip(sections, inputs.get("screenshots") or []):
+            s.screenshot_path = path
+        title = inputs["metadata"]["title"] or f"YouTube Video {job.video_id}"
+        timeline = SpriteSheet(**inputs["timeline"]) if inputs.get("timeline") else None
+        stats = build_pdf(pdf_path, title=title, video_url=job.url, sections=sections, continuous=True,
+                          image_max_px=image_max_px, timeline=timeline)
+        with job._lock:
+            job.state["pdf_stats"] = {"bytes": stats.bytes, "seconds": round(stats.seconds, 3)}
+        if search_index is not None:
+            try:
+                segs = ColumnarTranscript.from_dict(job.load_output("transcript"))
+                search_index.add_video(job.video_id, title, job.url, segs, sections)
+            except Exception as e:
+                job.warnings.append(f"Search indexing failed: {e}")
+        return pdf_path
+
+    stages = [
+        Stage("metadata", _resumable(job, "metadata", metadata_stage, limits["network"])),
+        Stage("transcript", _resumable(job, "transcript", transcript_stage, limits["network"])),
+        Stage("gemini", _resumable(job, "gemini", gemini_stage, limits["llm"]), deps=("transcript",)),
+    ]
+    pdf_deps = ("metadata", "gemini")
+    if screenshots or timeline_thumbs:
+        stages.append(Stage("stream_url", _resumable(job, "stream_url", stream_url_stage, limits["network"],
+                                                     persist=False)))
+    if screenshots:
+        stages += [
+            # ffmpeg concurrency is limited per screenshot inside capture_screenshots
+            Stage("screenshots", _resumable(job, "screenshots", screenshots_stage, nullcontext(),
+                                            complete=lambda paths: any(paths) or not paths),
+                  deps=("gemini", "stream_url")),
+        ]
+        pdf_deps += ("screenshots",)
+    if timeline_thumbs:
+        stages.append(Stage("timeline", _resumable(job, "timeline", timeline_stage, limits["ffmpeg"],
+                                                   complete=lambda out: out is not None), deps=("stream_url",)))
+        pdf_deps += ("timeline",)
+    stages.append(Stage("pdf", _resumable(job, "pdf", pdf_stage, nullcontext()), deps=pdf_deps))
+
+    if job.is_done("pdf") and os.path.exists(pdf_path):
+        return pdf_path
+    job.state["stages"].pop("pdf", None)
+    lease = media_cache.lease(job.video_id) if media_cache is not None else nullcontext()
+    try:
+        with lease:
+            return run_stages(stages, max_workers=len(stages), tracer=tracer)["pdf"]
+    finally:
+        tracer.export(os.path.join(job.dir, "trace.json"))
+
+
+def expand_urls(urls: List[str], failed: Dict[str, str] = None) -> List[str]:
+    """
+    Expand playlist URLs and drop duplicate videos, keeping the first occurrence.
+    An input URL that cannot be expanded (or parsed) is skipped; its error goes into `failed`.
+    """
+    expanded, seen = [], set()
+    for url in urls:
+        try:
+            candidates = ytdlp_playlist_urls(url) if "list=" in url else [url]
+            ids = [extract_video_id(u) for u in candidates]
+        except Exception as e:
+            if failed is not None:
+                failed[url] = str(e)
+            continue
+        for u, vid in zip(candidates, ids):
+            if vid not in seen:
+                seen.add(vid)
+                expanded.append(u)
+    return expanded
+
+
+def run_batch(urls: List[str], out_dir: str, jobs_dir: str = None, max_videos: int = 4,
+              network_workers: int = 4, llm_workers: int = 2, ffmpeg_workers: int = 4, **pipeline_kwargs) -> Dict[str, Any]:
+    """
+    Summarize many videos concurrently. Network (yt-dlp/transcripts), LLM and ffmpeg work each
+    have their own concurrency limit shared across all videos. Re-running with the same
+    jobs_dir resumes: stages already recorded as done are loaded from disk instead of re-run.
+    Writes <out_dir>/batch_report.json and returns the report.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    jobs_dir = jobs_dir or os.path.join(out_dir, ".jobs")
+    limits = {
+        "network": threading.BoundedSemaphore(network_workers),
+        "llm": threading.BoundedSemaphore(llm_workers),
+        "ffmpeg": threading.BoundedSemaphore(ffmpeg_workers),
+    }
+
+    def run_one(url):
+        t = time.perf_counter()
+        entry = {"url": url, "video_id": None, "status": "failed", "pdf": None, "error": None}
+        job = None
+        try:
+            job = VideoJob(jobs_dir, url)
+            entry["video_id"] = job.video_id
+            resumed = [name for name in job.state["stages"] if job.is_done(name) and name != "stream_url"]
+            entry["pdf"] = process_video(job, out_dir, limits, **pipeline_kwargs)
+            entry["status"] = "done"
+            entry["resumed_stages"] = resumed
+            entry["warnings"] = job.warnings
+            entry["compaction"] = job.state.get("compaction")
+            entry["pdf_stats"] = job.state.get("pdf_stats")
+        except Exception as e:
+            entry["error"] = str(e)
+        entry["duration"] = round(time.perf_counter() - t, 3)
+        if job is not None:
+            entry["stages"] = job.state["stages"]
+        print(f"[{entry['status']}] {url} in {entry['duration']:.1f}s" + (f": {entry['error']}" if entry["error"] else ""))
+        return entry
+
+    t0 = time.perf_counter()
+    failed = {}
+    urls = expand_urls(urls, failed)
+    entries = []
+    for url, error in failed.items():
+        print(f"[failed] {url}: {error}")
+        entries.append({"url": url, "video_id": None, "status": "failed", "pdf": None, "error": error, "duration": 0.0})
+    print(f"Processing {len(urls)} videos")
+    with ThreadPoolExecutor(max_workers=max_videos, thread_name_prefix="video") as pool:
+        entries += pool.map(run_one, urls)
+
+    report = {
+        "total": len(entries),
+        "done": sum(e["status"] == "done" for e in entries),
+        "failed": sum(e["status"] == "failed" for e in entries),
+        "duration": round(time.perf_counter() - t0, 3),
+        "gemini": default_scheduler().metrics(),
+        "videos": entries,
+    }
+    _write_json(os.path.join(out_dir, "batch_report.json"), report)
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"{report['done']}/{report['total']} videos done, {report['failed']} failed in {report['duration']:.1f}s"]
+    for e in report["videos"]:
+        stage_times = ", ".join(f"{k}={v['duration']:.1f}s" for k, v in (e.get("stages") or {}).items()
+                                if v.get("status") == "done")
+        lines.append(f"  {e['video_id'] or e['url']:<12} {e['status']:<7} {e['duration']:>7.1f}s  {stage_times}")
+        if e.get("compaction"):
+            lines.append(f"      transcript: {e['compaction']}")
+        if e["error"]:
+            lines.append(f"      error: {e['error']}")
+    g = report.get("gemini")
+    if g:
+        lines.append(f"Gemini: {g['ok']}/{g['calls']} calls ok, {g['retries']} retries, {g['failed']} failed, "
+                     f"max queue depth {g['max_queue_depth']}, wait p95 {g['wait_p95_s/batch']:.1f}s, "
+                     f"latency p95 {g['latency_p95_s']:.1f}s")
+    return "\n".join(lines)
@@ -0,0 +1,327 @@
+"""
+Offline benchmarks for yt2pdf. Nothing touches YouTube or Gemini: transcripts, the Gemini
+model and the video come from fakes.py, so numbers are reproducible run to run.
+
+    python bench.py parse --minutes 10 60 180 --sections 4 8 16
+    python bench.py transcript --minutes 60 180 600
+    python bench.py screenshots --sections 8 16 32
+    python bench.py pdf --sections 8 32
+    python bench.py sprites --minutes 10 60
+    python bench.py pipeline --minutes 10 60 --sections 8 --llm-latency 2 --stream
+    python bench.py all --json out/bench.json
+    python bench.py startup
+    python bench.py scheduler --rpm 120 --fail-rate 0.2
+"""
+import io
+import os
+import json
+import time
+import sys
+import shutil
+import argparse
+import subprocess
+import tempfile
+import statistics
+from contextlib import redirect_stdout
+from typing import Any, Callable, Dict, List
+
+from fakes import FakeTranscriptSource, FakeGenerativeModel, make_test_video, offline
+from gemini import call_gemini_sections, parse_sections_reply
+from pipeline import run_pipeline, parse_sections, capture_screenshots
+from media_cache import probe_keyframes
+from pdf_builder import build_pdf
+from tracing import Tracer
+from sprites import build_sprites
+from scheduler import GeminiScheduler, set_default_scheduler
+from concurrent.futures import ThreadPoolExecutor
+from transcript import ColumnarTranscript
+from youtube import segments_to_text
+
+
+def timeit(fn: Callable[[], Any], repeat: int = 3, warmup: int = 1) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+    runs = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t)
+    return {"median_s": statistics.median(runs), "min_s": min(runs), "max_s": max(runs)}
+
+
+def bench_parse(minutes: float, n_sections: int, repeat: int) -> List[Dict[str, Any]]:
+    """Reply parsing through call_gemini_sections (model latency 0), blocking and streamed."""
+    model = FakeGenerativeModel(n_sections=n_sections, duration=minutes * 60)
+    transcript_text = "\n".join(f"[{s.start:.0f}] {s.text}" for s in FakeTranscriptSource(minutes).segments())
+    reply = model.reply_text()
+    rows = [
+        dict(case="parse_sections_reply", **timeit(lambda: parse_sections_reply(reply), repeat)),
+        dict(case="call_gemini_sections", **timeit(
+            lambda: call_gemini_sections(model, transcript_text, max_sections=n_sections), repeat)),
+        dict(case="call_gemini_sections/stream", **timeit(
+            lambda: call_gemini_sections(model, transcript_text, max_sections=n_sections,
+                                         on_section=lambda s: None), repeat)),
+    ]
+    for r in rows:
+        r.update(minutes=minutes, sections=n_sections, reply_bytes=len(reply))
+    return rows
+
+
+def bench_scheduler(n_interactive: int, n_batch: int, rpm: float, fail_rate: float,
+                    llm_latency: float) -> List[Dict[str, Any]]:
+    """
+    A burst of batch calls with interactive calls arriving behind them, through one rate-limited
+    scheduler and a fake model that fails with quota errors at fail_rate.
+    """
+    scheduler = GeminiScheduler(rpm=rpm, tpm=1e9, max_concurrency=4, base_delay=0.2, max_delay=2.0)
+    model = FakeGenerativeModel(n_sections=4, first_token_latency=llm_latency, fail_rate=fail_rate)
+    text = "\n".join(f"[00:{i % 60:02d}] hello" for i in range(200))
+
+    def one(priority):
+        t = time.perf_counter()
+        try:
+            call_gemini_sections(model, text, max_sections=4, scheduler=scheduler, priority=priority)
+            ok = True
+        except Exception:
+            ok = False
+        return priority, time.perf_counter() - t, ok
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_interactive + n_batch) as pool:
+        futs = [pool.submit(one, "batch") for _ in range(n_batch)]
+        time.sleep(0.05)
+        futs += [pool.submit(one, "interactive") for _ in range(n_interactive)]
+        results = [f.result() for f in futs]
+    rows = []
+    for priority in ("interactive", "batch"):
+        times = [d for p, d, _ in results if p == priority]
+        if times:
+            rows.append(dict(case=f"scheduler/{priority}", median_s=statistics.median(times), min_s=min(times),
+                             max_s=max(times), calls=len(times),
+                             failed=sum(not ok for p, _, ok in results if p == priority)))
+    m = scheduler.metrics()
+    total = time.perf_counter() - t0
+    rows.append(dict(case="scheduler/total", median_s=total, min_s=total, max_s=total, retries=m["retries"],
+                     max_queue_depth=m["max_queue_depth"], model_calls=model.calls, quota_errors=model.failures))
+    return rows
+
+
+def bench_transcript(minutes: float, repeat: int) -> List[Dict[str, Any]]:
+    """Segment list vs. ColumnarTranscript: prompt text building and a time-range lookup."""
+    segs = FakeTranscriptSource(minutes, seg_seconds=1.5).segments()
+    col = ColumnarTranscript.from_segments(segs)
+    t0, t1 = minutes * 30, minutes * 30 + 120  # two minutes from the middle
+    rows = [
+        dict(case="transcript/text/list", **timeit(lambda: segments_to_text(segs), repeat)),
+        dict(case="transcript/text/columnar", **timeit(col.to_text, repeat)),
+        dict(case="transcript/slice/list", **timeit(
+            lambda: [s for s in segs if s.start + s.dur > t0 and s.start < t1], repeat)),
+        dict(case="transcript/slice/columnar", **timeit(lambda: col.slice_time(t0, t1), repeat)),
+        dict(case="transcript/from_segments", **timeit(lambda: ColumnarTranscript.from_segments(segs), repeat)),
+    ]
+    for r in rows:
+        r.update(minutes=minutes, segments=len(segs))
+    return rows
+
+
+def bench_screenshots(video: str, duration: float, n_sections: int, workdir: str, repeat: int,
+                      workers: int = 4) -> List[Dict[str, Any]]:
+    """Midpoint screenshots seeking by timestamp vs. guided by the keyframe index."""
+    raw = FakeGenerativeModel(n_sections=n_sections, duration=duration).reply_text()
+    sections = parse_sections(parse_sections_reply(raw)["sections"])
+    keyframes = probe_keyframes(video)
+    shots = os.path.join(workdir, f"shots_{n_sections}")
+    rows = []
+    for case, kwargs in (("screenshots", {}), ("screenshots/keyframes", {"keyframes": keyframes, "snap": 1.0})):
+        res = timeit(lambda: capture_screenshots(video, sections, shots, max_workers=workers, **kwargs),
+                     repeat, warmup=0)
+        rows.append(dict(case=case, minutes=duration / 60, sections=n_sections,
+                         per_shot_s=res["median_s"] / n_sections, **res))
+    return rows
+
+
+def bench_sprites(video: str, duration: float, n_thumbs: int, workdir: str, repeat: int) -> List[Dict[str, Any]]:
+    """Timeline sprite sheets in one ffmpeg pass, decoding keyframes only vs. every frame."""
+    rows = []
+    for case, key_only in (("sprites/keyframes", True), ("sprites/all_frames", False)):
+        out = os.path.join(workdir, f"sprites_{n_thumbs}_{case.split('/')[1]}")
+        res = timeit(lambda: build_sprites(video, out, duration=duration, max_thumbs=n_thumbs,
+                                           keyframes_only=key_only), repeat, warmup=0)
+        rows.append(dict(case=case, minutes=duration / 60, thumbs=n_thumbs,
+                         per_thumb_ms=res["median_s"] * 1e3 / n_thumbs, **res))
+    return rows
+
+
+def bench_pdf(video: str, duration: float, n_sections: int, workdir: str, repeat: int) -> List[Dict[str, Any]]:
+    raw = FakeGenerativeModel(n_sections=n_sections, duration=duration).reply_text()
+    sections = parse_sections(parse_sections_reply(raw)["sections"])
+    capture_screenshots(video, sections, os.path.join(workdir, f"pdf_shots_{n_sections}"))
+    out = os.path.join(workdir, f"bench_{n_sections}.pdf")
+    rows = []
+    for case, max_px in (("build_pdf", 1280), ("build_pdf/full_res", None)):
+        def build():
+            # drop cached thumbnails so every repeat pays for them, as a fresh run would
+            shutil.rmtree(os.path.join(workdir, f"pdf_shots_{n_sections}", "thumbs"), ignore_errors=True)
+            build_pdf(out, "Benchmark", "https://youtu.be/benchmark0001", sections, continuous=True,
+                      image_max_px=max_px)
+
+        res = timeit(build, repeat)
+        rows.append(dict(case=case, minutes=duration / 60, sections=n_sections,
+                         pdf_bytes=os.path.getsize(out), **res))
+    return rows
+
+
+def bench_pipeline(video: str, minutes: float, n_sections: int, workdir: str, repeat: int,
+                   llm_latency: float, llm_cps: float, stream: bool) -> List[Dict[str, Any]]:
+    """run_pipeline end to end with a simulated Gemini latency, plus the gemini and screenshots stage times."""
+    transcripts = FakeTranscriptSource(minutes, rolling=True)
+    model = FakeGenerativeModel(n_sections=n_sections, duration=minutes * 60,
+                                first_token_latency=llm_latency, chars_per_second=llm_cps)
+    tracers = []
+
+    def run():
+        tracer = Tracer()
+        tracers.append(tracer)
+        with redirect_stdout(io.StringIO()):
+            run_pipeline("https://www.youtube.com/watch?v=benchmark0001", model="fake",
+                         max_sections=n_sections, workdir=tempfile.mkdtemp(dir=workdir),
+                         stream=stream, warn=lambda msg: None, tracer=tracer)
+
+    with offline(transcripts, model, video_path=video):
+        res = timeit(run, repeat)
+    spans = {r["name"]: r["total_s"] for r in tracers[-1].summary()}
+    return [dict(case="run_pipeline/stream" if stream else "run_pipeline", minutes=minutes, sections=n_sections,
+                 gemini_s=spans.get("gemini"), screenshots_s=spans.get("screenshots"), **res)]
+
+
+# Modules the entry points import, and the third-party packages they used to import at load time
+STARTUP_MODULES = ["pipeline", "jobs", "artifacts", "batch"]
+HEAVY_DEPS = ["google.generativeai", "youtube_transcript_api", "reportlab.platypus", "PIL.Image"]
+
+
+def _import_seconds(modules: List[str]) -> float:
+    code = ("import time; t = time.perf_counter()\n" + "".join(f"import {m}\n" for m in modules) +
+            "print(time.perf_counter() - t)")
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _new_transcript_api(youtube):
+    # _transcript_api keeps one client per thread; forget it so the next call builds a new one
+    youtube._local.transcript_api = None
+    return youtube._transcript_api()
+
+
+def bench_startup(repeat: int) -> List[Dict[str, Any]]:
+    """
+    Cold import time of the app modules in a fresh interpreter, as they are now (heavy
+    packages deferred) and with the heavy packages imported eagerly as before; then the
+    per-run setup of Gemini model / transcript client / PDF styles, uncached vs. reused.
+    """
+    rows = []
+    for case, modules in (("import/lazy", STARTUP_MODULES), ("import/eager", STARTUP_MODULES + HEAVY_DEPS)):
+        try:
+            runs = [_import_seconds(modules) for _ in range(repeat)]
+        except subprocess.CalledProcessError as e:
+            print(f"Skipping {case}: {e.stderr.strip().splitlines()[-1]}")
+            continue
+        rows.append(dict(case=case, median_s=statistics.median(runs), min_s=min(runs), max_s=max(runs)))
+
+    import gemini
+    import youtube
+    import pdf_builder
+
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")  # building a model does not call the API
+    setups = [
+        ("setup/gemini_model", lambda: gemini._cached_model.__wrapped__("gemini-1.5-flash", os.environ["GOOGLE_API_KEY"]),
+         lambda: gemini.init_gemini("gemini-1.5-flash")),
+        ("setup/transcript_api", lambda: _new_transcript_api(youtube), youtube._transcript_api),
+        ("setup/pdf_styles", pdf_builder._styles.__wrapped__, pdf_builder._styles),
+    ]
+    for case, uncached, cached in setups:
+        try:
+            rows.append(dict(case=f"{case}/new", **timeit(uncached, repeat)))
+            rows.append(dict(case=f"{case}/reused", **timeit(cached, repeat)))
+        except ImportError as e:
+            print(f"Skipping {case}: {e}")
+    return rows
+
+
+def _num(v) -> str:
+    return "-" if v is None else f"{v:g}"
+
+
+def format_rows(rows: List[Dict[str, Any]]) -> str:
+    lines = [f"{'case':<30}{'min':>6}{'sect':>6}{'median':>12}{'best':>12}  extra"]
+    for r in rows:
+        extra = ", ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in r.items()
+                          if k not in ("case", "minutes", "sections", "median_s", "min_s", "max_s") and v is not None)
+        lines.append(f"{r['case']:<30}{_num(r.get('minutes')):>6}{_num(r.get('sections')):>6}"
+                     f"{r['median_s'] * 1e3:>10.2f}ms{r['min_s'] * 1e3:>10.2f}ms  {extra}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline yt2pdf benchmarks")
+    parser.add_argument("what", choices=["parse", "transcript", "screenshots", "sprites", "pdf", "pipeline", "startup",
+                                           "scheduler", "all"])
+    parser.add_argument("--minutes", type=float, nargs="+", default=[10, 60],
+                        help="Transcript (and test video) lengths")
+    parser.add_argument("--sections", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Fake Gemini time to first token (s)")
+    parser.add_argument("--llm-cps", type=float, default=2000.0, help="Fake Gemini output speed (chars/s)")
+    parser.add_argument("--rpm", type=float, default=120, help="Scheduler bench: requests per minute")
+    parser.add_argument("--fail-rate", type=float, default=0.2, help="Scheduler bench: fake quota error rate")
+    parser.add_argument("--stream", action="store_true", help="Stream the fake Gemini reply in the pipeline bench")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "yt2pdf_bench"),
+                        help="Test videos are generated here once and reused")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    todo = (["startup", "parse", "transcript", "screenshots", "sprites", "pdf", "pipeline", "scheduler"]
+            if args.what == "all" else [args.what])
+    videos = {}
+    if set(todo) & {"screenshots", "sprites", "pdf", "pipeline"}:
+        for m in args.minutes:
+            videos[m] = make_test_video(os.path.join(args.workdir, f"testsrc_{m:g}min.mp4"), m * 60)
+
+    # the other benches measure our own code, not Gemini rate limits
+    set_default_scheduler(GeminiScheduler(rpm=1e9, tpm=1e12, max_concurrency=64))
+    rows = []
+    if "scheduler" in todo:
+        rows += bench_scheduler(4, 16, args.rpm, args.fail_rate, args.llm_latency)
+    if "startup" in todo:
+        rows += bench_startup(args.repeat)
+    if "transcript" in todo:
+        for m in args.minutes:
+            rows += bench_transcript(m, args.repeat)
+    if "sprites" in todo:
+        for m in args.minutes:
+            rows += bench_sprites(videos[m], m * 60, 200, args.workdir, args.repeat)
+    for what in todo:
+        if what in ("startup", "transcript", "sprites", "scheduler"):
+            continue
+        for m in args.minutes:
+            for n in args.sections:
+                if what == "parse":
+                    rows += bench_parse(m, n, args.repeat)
+                elif what == "screenshots":
+                    rows += bench_screenshots(videos[m], m * 60, n, args.workdir, args.repeat)
+                elif what == "pdf":
+                    rows += bench_pdf(videos[m], m * 60, n, args.workdir, args.repeat)
+                else:
+                    rows += bench_pipeline(videos[m], m, n, args.workdir, args.repeat,
+                                           args.llm_latency, args.llm_cps, args.stream)
+    print(format_rows(rows))
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Compile many summarized videos into one PDF: a master table of contents, then each video's
+summary as its own part.
+
+    python compile_pdf.py out/course/.jobs --out out/course.pdf --title "My course"
+
+Videos are rendered one at a time into per-video fragments through the artifact cache (so
+only one video's flowables and images are in memory while rendering, and an unchanged video is
+not rendered again), then the fragments are merged with pypdf. The merged document is held in
+memory until it is written, so merging needs memory proportional to the compiled PDF.
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+from artifacts import ArtifactCache, cached_build_pdf, ARTIFACT_DIR
+from pdf_builder import Section
+from sprites import SpriteSheet
+from thumbnails import PDF_THUMB
+from utils import ensure_dir
+
+
+# Own cache so a large compilation does not evict its earlier fragments (or the web UI's PDFs) before the merge
+FRAGMENT_DIR = os.path.join(ARTIFACT_DIR, "fragments")
+
+
+@dataclass
+class CompiledVideo:
+    video_id: str
+    title: str
+    url: str
+    sections: List[Section]
+    timeline: object = None  # optional sprites.SpriteSheet
+
+
+@dataclass
+class _Fragment:
+    title: str
+    path: str
+    pages: int
+    section_titles: List[str]
+    section_pages: List[Optional[int]]  # page of each section within the fragment
+
+
+@dataclass
+class CompileStats:
+    path: str
+    videos: int
+    pages: int
+    bytes: int
+    seconds: float
+    render_seconds: float
+    merge_seconds: float
+    fragments_built: int
+    fragments_reused: int
+    peak_rss_mb: Optional[float] = None
+    start_rss_mb: Optional[float] = None
+    failed: List[str] = field(default_factory=list)
+
+    def __str__(self):
+        rss = "n/a" if self.peak_rss_mb is None else f"{self.peak_rss_mb:.0f} MB (was {self.start_rss_mb:.0f} MB)"
+        return (f"{self.path}: {self.videos} videos, {self.pages} pages, {self.bytes / 1e6:.2f} MB in "
+                f"{self.seconds:.2f}s (render {self.render_seconds:.2f}s, merge {self.merge_seconds:.2f}s); "
+                f"fragments {self.fragments_built} built, {self.fragments_reused} reused; peak RSS {rss}")
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far, or None where the resource module is missing (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024  # bytes on macOS, KiB on Linux
+
+
+def _section_pages(reader, prefix: str, n_sections: int) -> List[Optional[int]]:
+    # build_pdf names each section's anchor <prefix>section_<i>; find the page it landed on
+    pages = {}
+    for name, dest in reader.named_destinations.items():
+        name = str(name).lstrip("/")
+        if name.startswith(f"{prefix}section_"):
+            try:
+                pages[name] = reader.get_destination_page_number(dest)
+            except Exception:
+                continue
+    return [pages.get(f"{prefix}section_{i}") for i in range(1, n_sections + 1)]
+
+
+def _render_fragment(cache: ArtifactCache, video: CompiledVideo, **build_kwargs):
+    from pypdf import PdfReader
+
+    prefix = f"{video.video_id}_"
+    path, stats = cached_build_pdf(cache, video.title, video.url, video.sections, continuous=True,
+                                   timeline=video.timeline, anchor_prefix=prefix, **build_kwargs)
+    reader = PdfReader(path)
+    fragment = _Fragment(video.title, path, len(reader.pages), [s.title for s in video.sections],
+                         _section_pages(reader, prefix, len(video.sections)))
+    return fragment, stats is None
+
+
+def _toc_lines(fragments: Sequence[_Fragment], with_sections: bool):
+    """(text, level, page offset after the TOC) for every TOC line."""
+    lines, offset = [], 0
+    for n, f in enumerate(fragments, 1):
+        lines.append((f"{n}. {f.title}", 0, offset))
+        if with_sections:
+            for i, (t, p) in enumerate(zip(f.section_titles, f.section_pages), 1):
+                if p is not None:
+                    lines.append((f"{n}.{i} {t}", 1, offset + p))
+        offset += f.pages
+    return lines
+
+
+def _draw_toc(path: str, title: str, lines, page_size, margin: float = 54, line_h: float = 16,
+              title_h: float = 48):
+    """
+    Draw the master TOC with reportlab's canvas (no flowables, so the layout is known up front)
+    and return (toc page count, links) where links are (toc page, rect, target page).
+    """
+    from reportlab.pdfgen import canvas
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    width, height = page_size
+    per_page = max(1, int((height - 2 * margin - title_h) // line_h))
+    toc_pages = max(1, math.ceil(len(lines) / per_page))
+    fonts = {0: ("Helvetica-Bold", 11, 0), 1: ("Helvetica", 9.5, 18)}
+    c = canvas.Canvas(path, pagesize=page_size)
+    links = []
+    for page in range(toc_pages):
+        c.setFont("Helvetica-Bold", 18)
+        c.drawCentredString(width / 2, height - margin - 18, title if page == 0 else f"{title} (continued)")
+        y = height - margin - title_h
+        for text, level, offset in lines[page * per_page:(page + 1) * per_page]:
+            font, size, indent = fonts[level]
+            target = toc_pages + offset
+            label = str(target + 1)
+            x0, x1 = margin + indent, width - margin - stringWidth(label, font, size) - 12
+            while text and stringWidth(text, font, size) > x1 - x0:
+                text = text[:-2] + "…"
+            c.setFont(font, size)
+            c.setFillColorRGB(0, 0, 0.8)
+            c.drawString(x0, y, text)
+            c.setFillColorRGB(0, 0, 0)
+            c.drawRightString(width - margin, y, label)
+            links.append((page, (x0, y - 3, width - margin, y + size), target))
+            y -= line_h
+        c.showPage()
+    c.save()
+    return toc_pages, links
+
+
+def compile_pdf(out_path: str, videos: Iterable[CompiledVideo], title: str = "Video summaries",
+                cache: Optional[ArtifactCache] = None, page_size=None, toc_sections: bool = True,
+                warn=print, **build_kwargs) -> CompileStats:
+    """
+    Write one PDF covering every video: a master table of contents (videos and, with
+    toc_sections, their sections, each linking to its page) followed by each video's
+    summary, with a bookmark tree for videos and sections.
+
+    videos can be a generator (see videos_from_jobs): each video is rendered into a fragment
+    through the artifact cache and dropped before the next one is loaded, so rendering is
+    bounded by one video. The pypdf writer then holds every page of the output (compressed
+    streams, not decoded images) until the final write, so merge memory grows with the size of
+    the compiled PDF. Fragments are keyed by content, so recompiling after adding a video only
+    renders the new one.
+    build_kwargs go to build_pdf (image_max_px, image_quality). A video that fails to render
+    is reported through warn and left out.
+    """
+    from pypdf import PdfWriter
+    from pypdf.annotations import Link
+    from reportlab.lib.pagesizes import A4
+
+    t0 = time.perf_counter()
+    start_rss = peak_rss_mb()
+    cache = cache or ArtifactCache(FRAGMENT_DIR, max_bytes=2 * 1024 ** 3, max_entries=1000)
+    page_size = page_size or A4
+    fragments, failed, reused = [], [], 0
+    for video in videos:
+        try:
+            fragment, hit = _render_fragment(cache, video, page_size=page_size, **build_kwargs)
+        except Exception as e:
+            warn(f"Skipping {video.video_id} in {out_path}: {e}")
+            failed.append(video.video_id)
+            continue
+        fragments.append(fragment)
+        reused += hit
+    render_seconds = time.perf_counter() - t0
+
+    t = time.perf_counter()
+    ensure_dir(out_path)
+    tmp = f"{out_path}.tmp"
+    toc_path = f"{out_path}.toc.tmp"
+    try:
+        toc_pages, links = _draw_toc(toc_path, title, _toc_lines(fragments, toc_sections), page_size)
+        writer = PdfWriter()
+        writer.append(toc_path, import_outline=False)
+        writer.add_outline_item("Contents", 0)
+        for f in fragments:
+            start = len(writer.pages)
+            writer.append(f.path, import_outline=False)
+            parent = writer.add_outline_item(f.title, start)
+            for t_section, p in zip(f.section_titles, f.section_pages):
+                if p is not None:
+                    writer.add_outline_item(t_section, start + p, parent=parent)
+        for page, rect, target in links:
+            writer.add_annotation(page_number=page, annotation=Link(rect=rect, target_page_index=target))
+        n_pages = len(writer.pages)
+        with open(tmp, "wb") as fh:
+            writer.write(fh)
+        writer.close()
+        os.replace(tmp, out_path)
+    finally:
+        for p in (tmp, toc_path):
+            if os.path.exists(p):
+                os.remove(p)
+    return CompileStats(
+        path=out_path, videos=len(fragments), pages=n_pages, bytes=os.path.getsize(out_path),
+        seconds=time.perf_counter() - t0, render_seconds=render_seconds, merge_seconds=time.perf_counter() - t,
+        fragments_built=len(fragments) - reused, fragments_reused=reused,
+        peak_rss_mb=peak_rss_mb(), start_rss_mb=start_rss, failed=failed,
+    )
+
+
+def videos_from_jobs(jobs_dir: str, video_ids: Optional[Sequence[str]] = None) -> Iterator[CompiledVideo]:
+    """
+    Yield the finished videos of a batch run (see batch.VideoJob) one at a time, in video_ids
+    order (default: sorted by id). Videos without sections are skipped.
+    """
+    from pipeline import parse_sections
+
+    for video_id in video_ids if video_ids is not None else sorted(os.listdir(jobs_dir)):
+        d = os.path.join(jobs_dir, video_id)
+        try:
+            with open(os.path.join(d, "job.json")) as f:
+                state = json.load(f)
+            with open(os.path.join(d, "gemini.json")) as f:
+                sections = parse_sections(json.load(f))
+        except (OSError, ValueError):
+            continue  # not a job dir, or the job did not get that far
+        if not sections:
+            continue
+        title = None
+        if os.path.exists(os.path.join(d, "metadata.json")):
+            with open(os.path.join(d, "metadata.json")) as f:
+                title = (json.load(f) or {}).get("title")
+        if os.path.exists(os.path.join(d, "screenshots.json")):
+            with open(os.path.join(d, "screenshots.json")) as f:
+                for s, path in zip(sections, json.load(f) or []):
+                    s.screenshot_path = path
+        timeline = None
+        if os.path.exists(os.path.join(d, "timeline.json")):
+            with open(os.path.join(d, "timeline.json")) as f:
+                data = json.load(f)
+            timeline = SpriteSheet(**data) if data else None
+        yield CompiledVideo(video_id, title or f"YouTube Video {video_id}", state.get("url", ""), sections,
+                            timeline=timeline)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the videos of a batch run into one PDF.")
+    parser.add_argument("jobs_dir", help="A batch run's job dir, e.g. out/course/.jobs")
+    parser.add_argument("--out", required=True, help="Output PDF path")
+    parser.add_argument("--title", default="Video summaries")
+    parser.add_argument("--report", default=None,
+                        help="batch_report.json to take the video order from (default: <jobs_dir>/../batch_report.json)")
+    parser.add_argument("--no-toc-sections", action="store_true", help="List only videos in the table of contents")
+    parser.add_argument("--pdf-image-max-px", type=int, default=PDF_THUMB[0])
+    args = parser.parse_args()
+
+    report = args.report or os.path.join(os.path.dirname(os.path.abspath(args.jobs_dir)), "batch_report.json")
+    video_ids = None
+    if os.path.exists(report):
+        with open(report) as f:
+            video_ids = [e["video_id"] for e in json.load(f)["videos"] if e.get("video_id")]
+    stats = compile_pdf(args.out, videos_from_jobs(args.jobs_dir, video_ids), title=args.title,
+                        toc_sections=not args.no_toc_sections, image_max_px=args.pdf_image_max_px or None)
+    print(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import random
+import subprocess
+from contextlib import ExitStack, contextmanager
+from typing import List, Optional
+from unittest import mock
+
+from youtube import TranscriptSegment
+from utils import human_time
+
+_WORDS = (
+    "so today we are going to look at how the model learns from data and why the loss goes down "
+    "first let us define the problem then walk through the code step by step and finally run a demo "
+    "notice that the gradient depends on every parameter which is why we batch the inputs together"
+).split()
+
+
+class FakeTranscriptSource:
+    """
+    Stands in for youtube.fetch_transcript: a deterministic transcript of `minutes` minutes
+    with one segment every seg_seconds. rolling=True repeats the tail of the previous
+    segment at the start of the next, like YouTube auto-captions.
+    """
+
+    def __init__(self, minutes: float = 10, seg_seconds: float = 3.0, words_per_seg: int = 8,
+                 rolling: bool = False, seed: int = 0):
+        self.minutes = minutes
+        self.seg_seconds = seg_seconds
+        self.words_per_seg = words_per_seg
+        self.rolling = rolling
+        self.seed = seed
+        self.calls = 0
+
+    def segments(self) -> List[TranscriptSegment]:
+        rng = random.Random(self.seed)
+        segs, prev = [], []
+        n = int(self.minutes * 60 / self.seg_seconds)
+        for i in range(n):
+            words = [rng.choice(_WORDS) for _ in range(self.words_per_seg)]
+            if i % 5 == 4:
+                words[-1] += "."
+            text = " ".join((prev[-3:] if self.rolling else []) + words)
+            segs.append(TranscriptSegment(start=i * self.seg_seconds, dur=self.seg_seconds, text=text))
+            prev = words
+        return segs
+
+    def __call__(self, video_id: str, lang: str = "en", use_auto: bool = False) -> List[TranscriptSegment]:
+        self.calls += 1
+        return self.segments()
+
+
+class ResourceExhausted(Exception):
+    """Same name as google.api_core's 429 error, so scheduler.is_transient treats it alike."""
+
+
+class _Chunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """
+    Stands in for genai.GenerativeModel. Replies with n_sections evenly spaced sections over
+    `duration` seconds, fenced as ```json like Gemini does. Latency is modelled as
+    first_token_latency seconds plus len(reply) / chars_per_second, spread over chunk_chars
+    sized chunks when streamed. Set reply to return a fixed text instead. fail_rate is the
+    chance that a call raises ResourceExhausted (a quota error) after first_token_latency.
+    """
+
+    def __init__(self, n_sections: int = 8, duration: float = 600.0, first_token_latency: float = 0.0,
+                 chars_per_second: Optional[float] = None, chunk_chars: int = 80, reply: Optional[str] = None,
+                 fail_rate: float = 0.0, seed: int = 0):
+        self.n_sections = n_sections
+        self.duration = duration
+        self.first_token_latency = first_token_latency
+        self.chars_per_second = chars_per_second
+        self.chunk_chars = chunk_chars
+        self.reply = reply
+        self.fail_rate = fail_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+
+    def reply_text(self) -> str:
+        if self.reply is not None:
+            return self.reply
+        step = self.duration / max(self.n_sections, 1)
+        sections = []
+        for i in range(self.n_sections):
+            start, end = i * step, (i + 1) * step
+            sections.append({
+                "title": f"Part {i + 1}: how the \"loss\" goes down",
+                "start": f"[{human_time(start)}]",
+                "end": f"[{human_time(end)}]",
+                "summary": "We define the problem, walk through the code and run a short demo. " * 2,
+                "key_points": [f"Point {k + 1} about part {i + 1}" for k in range(4)],
+            })
+        return "```json\n" + json.dumps({"sections": sections}, indent=2) + "\n```"
+
+    def _sleep_for(self, n_chars: int):
+        if self.chars_per_second:
+            time.sleep(n_chars / self.chars_per_second)
+
+    def generate_content(self, content, safety_settings=None, stream: bool = False):
+        self.calls += 1
+        txt = self.reply_text()
+        time.sleep(self.first_token_latency)
+        if self.fail_rate and self._rng.random() < self.fail_rate:
+            self.failures += 1
+            raise ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+        if not stream:
+            self._sleep_for(len(txt))
+            return _Chunk(txt)
+        return self._stream(txt)
+
+    def _stream(self, txt: str):
+        for i in range(0, len(txt), self.chunk_chars):
+            chunk = txt[i:i + self.chunk_chars]
+            self._sleep_for(len(chunk))
+            yield _Chunk(chunk)
+
+
+def make_test_video(path: str, duration: float, size: str = "640x360", rate: int = 10, gop: int = 20) -> str:
+    """
+    Generate a local test clip (ffmpeg testsrc, keyframe every `gop` frames) unless it already
+    exists with the same parameters, and return its path.
+    """
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp.mp4"
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc=duration={duration:.0f}:size={size}:rate={rate}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", str(gop), "-pix_fmt", "yuv420p",
+        tmp,
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    os.replace(tmp, path)
+    return path
+
+
+@contextmanager
+def offline(transcripts: FakeTranscriptSource, model: FakeGenerativeModel, video_path: Optional[str] = None,
+            title: str = "Offline benchmark video"):
+    """
+    Patch the pipeline's network calls: transcripts come from `transcripts`, every Gemini
+    model is `model`, metadata is just a title, and the stream URL is video_path (None
+    makes screenshots fail over like an unresolvable stream).
+    """
+    import pipeline
+
+    def stream_url(url, resolution=720):
+        if video_path is None:
+            raise RuntimeError("no local video for offline run")
+        return video_path
+
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(pipeline, "fetch_transcript", transcripts))
+        stack.enter_context(mock.patch.object(pipeline, "init_gemini", lambda model_name, api_key=None: model))
+        stack.enter_context(mock.patch.object(pipeline, "ytdlp_extract", lambda url: {"title": title}))
+        stack.enter_context(mock.patch.object(pipeline, "ytdlp_get_stream_url", stream_url))
+        yield
@@ -0,0 +1,124 @@
+import re
+import subprocess
+from contextlib import nullcontext
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+THUMB_SIZE = (64, 36)
+_PTS_RE = re.compile(r"pts_time:\s*([-\d.]+)")
+
+
+@dataclass
+class Candidate:
+    ts: float
+    thumb: object  # PIL "L" image of THUMB_SIZE
+    sharpness: float
+
+
+def sample_window(start: float, end: float, central: float = 0.6, max_window: float = 60.0):
+    """The middle `central` fraction of a section, at most max_window seconds long, around the midpoint."""
+    mid = (start + end) / 2.0
+    half = min(max(0.0, end - start) * central, max_window) / 2.0
+    return max(0.0, mid - half), mid + half
+
+
+def sample_candidates(source: str, start: float, end: float, k: int = 8, size=THUMB_SIZE,
+                      central: float = 0.6, max_window: float = 60.0) -> List[Candidate]:
+    """
+    Decode up to k low-resolution grayscale frames from the middle of [start, end] in a
+    single sequential ffmpeg pass. Only keyframes are decoded (-skip_frame nokey), which
+    also means each winner can later be extracted at full resolution with a seek that
+    lands exactly on it and decodes one frame.
+    """
+    from PIL import Image as PILImage
+
+    w0, w1 = sample_window(start, end, central, max_window)
+    step = max((w1 - w0) / max(k, 1), 0.001)
+    w, h = size
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats",
+        "-skip_frame", "nokey",
+        "-ss", f"{w0:.3f}", "-t", f"{max(w1 - w0, 0.001):.3f}",
+        "-i", source,
+        "-an",
+        "-vf", f"select=isnan(prev_selected_t)+gte(t-prev_selected_t\\,{step:.3f}),"
+               f"scale={w}:{h},format=gray,showinfo",
+        "-vsync", "vfr",
+        "-frames:v", str(k),
+        "-f", "rawvideo", "-",
+    ]
+    proc = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    times = [float(t) for t in _PTS_RE.findall(proc.stderr.decode("utf-8", "ignore"))]
+    frame_bytes = w * h
+    candidates = []
+    for i, t in enumerate(times):
+        buf = proc.stdout[i * frame_bytes:(i + 1) * frame_bytes]
+        if len(buf) < frame_bytes:
+            break
+        thumb = PILImage.frombytes("L", size, buf)
+        # output timestamps restart at 0 after the input seek
+        candidates.append(Candidate(ts=w0 + t, thumb=thumb, sharpness=sharpness(thumb)))
+    return candidates
+
+
+def sharpness(img) -> float:
+    """Variance of the Laplacian: low for blurry frames, fades and flat (e.g. black) frames."""
+    from PIL import ImageFilter, ImageStat
+
+    lap = img.filter(ImageFilter.Kernel((3, 3), [0, 1, 0, 1, -4, 1, 0, 1, 0], scale=1, offset=128))
+    return ImageStat.Stat(lap).var[0]
+
+
+def difference(a, b) -> float:
+    """Mean absolute pixel difference of two thumbnails, 0..255."""
+    from PIL import ImageChops, ImageStat
+
+    return ImageStat.Stat(ImageChops.difference(a, b)).mean[0]
+
+
+def pick_representative(per_section: Sequence[List[Candidate]], dissimilarity_weight: float = 0.5) -> List[Optional[float]]:
+    """
+    Choose one timestamp per section. Each candidate scores its sharpness (normalized within
+    the section) plus dissimilarity_weight times how different it is from the previous
+    section's winner and the next section's candidates, so neighbouring sections do not
+    end up with near-identical screenshots. Sections without candidates get None.
+    """
+    chosen: List[Optional[float]] = []
+    prev_thumb = None
+    for idx, cands in enumerate(per_section):
+        if not cands:
+            chosen.append(None)
+            prev_thumb = None
+            continue
+        max_sharp = max(c.sharpness for c in cands) or 1.0
+        next_cands = per_section[idx + 1] if idx + 1 < len(per_section) else []
+
+        def score(c: Candidate) -> float:
+            neighbours = ([prev_thumb] if prev_thumb is not None else []) + [n.thumb for n in next_cands]
+            dissim = min((difference(c.thumb, n) for n in neighbours), default=255.0) / 255.0
+            return c.sharpness / max_sharp + dissimilarity_weight * dissim
+
+        best = max(cands, key=score)
+        chosen.append(best.ts)
+        prev_thumb = best.thumb
+    return chosen
+
+
+def select_frames(source: str, sections, k: int = 8, max_workers: int = 4, warn=print, limit=None) -> List[Optional[float]]:
+    """
+    Representative timestamp for every section (None where sampling failed, meaning: use the midpoint).
+    Sections are sampled concurrently; picking is a cheap pass over the thumbnails.
+    """
+    def sample(i_s):
+        i, s = i_s
+        try:
+            with limit or nullcontext():
+                return sample_candidates(source, s.start, s.end, k=k)
+        except Exception as e:
+            warn(f"Frame sampling failed for section {i}, using the midpoint: {e}")
+            return []
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ffmpeg-sample") as pool:
+        per_section = list(pool.map(sample, enumerate(sections, 1)))
+    return pick_representative(per_section)
@@ -2,8 +2,12 @@ import os
 import re
 import json
 import base64
-from typing import Dict, Any
-import google.generativeai as genai
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from scheduler import GeminiScheduler, default_scheduler
+from transcript import count_tokens
 
 #(always use zero padding, e.g. [01:05], [00:45:12])
 
@@ -59,12 +63,33 @@ If you cannot follow the exact formatting, reply with ONLY the JSON inside the f
 
 
 
+_configure_lock = threading.Lock()
+
+
+@lru_cache(maxsize=16)
+def _cached_model(model_name: str, api_key: str):
+    # google.generativeai is slow to import, so it is only loaded by the first run that needs it
+    import google.generativeai as genai
+    from google.generativeai import client as genai_client
+
+    # genai.configure() is process-wide and a GenerativeModel creates its client lazily from whatever
+    # key was configured last, so the client is created (and bound to this model) under the lock
+    with _configure_lock:
+        genai.configure(api_key=api_key)
+        model = genai.GenerativeModel(model_name)
+        model._client = genai_client.get_default_generative_client()
+        return model
+
+
 def init_gemini(model_name: str, api_key: str = None):
+    """
+    GenerativeModel for model_name. Models are created once per (model, key) and reused by
+    later runs in the process (CLI batches, Streamlit reruns and jobs).
+    """
     api_key = api_key or os.getenv("GOOGLE_API_KEY")
     if not api_key:
         raise RuntimeError("Missing GOOGLE_API_KEY. Set env var first.")
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel(model_name)
+    return _cached_model(model_name, api_key)
 
 
 def _extract_json_candidate_from_text(txt: str) -> str:
@@ -115,18 +140,144 @@ def _repair_summary_field(json_text: str) -> str:
     return repaired
 
 
-def call_gemini_sections(model, transcript_text: str, max_sections: int = 8) -> Dict[str, Any]:
+class SectionStreamParser:
+    """
+    Incremental parser for a streamed Gemini reply. feed() takes raw text chunks and
+    returns the objects of the "sections" array that were completed by that chunk,
+    tracking brace depth and string/escape state so braces inside strings are ignored.
+    Objects that do not parse (even after the summary repair) are skipped; the
+    full reply is still parsed at the end, so this only has to be right early.
+    """
+
+    _HEADER_RE = re.compile(r'"sections"\s*:\s*\[')
+
+    def __init__(self):
+        self.buf = ""
+        self.pos = None  # scan position, set once the array header has been seen
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.obj_start = None
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self.buf += chunk
+        if self.done:
+            return []
+        if self.pos is None:
+            m = self._HEADER_RE.search(self.buf)
+            if not m:
+                return []
+            self.pos = m.end()
+
+        out = []
+        buf = self.buf
+        i = self.pos
+        while i < len(buf):
+            c = buf[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+            elif c == '"':
+                self.in_string = True
+            elif c == "{":
+                if self.depth == 0:
+                    self.obj_start = i
+                self.depth += 1
+            elif c == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    obj = self._parse_object(buf[self.obj_start:i + 1])
+                    if obj is not None:
+                        out.append(obj)
+            elif c == "]" and self.depth == 0:
+                self.done = True
+                i += 1
+                break
+            i += 1
+        self.pos = i
+        return out
+
+    @staticmethod
+    def _parse_object(text: str):
+        for candidate in (text, _repair_summary_field(text)):
+            try:
+                obj = json.loads(candidate)
+                if isinstance(obj, dict):
+                    return obj
+            except Exception:
+                pass
+        return None
+
+
+def _build_content(transcript_text: str, max_sections: int):
     sys_prompt = SECTION_SCHEMA_INSTRUCTIONS.format(max_sections=max_sections)
     # content = [{"role": "user", "parts": [sys_prompt, "\n\nTRANSCRIPT:\n", transcript_text]}]
-    content = [
+    return [
         {"role": "user", "parts": [
             sys_prompt,
             "\n\nTRANSCRIPT:\n",
             transcript_text,
         ]}
     ]
-    resp = model.generate_content(content, safety_settings=None)
-    txt = resp.text.strip()
+
+
+def _generate_streamed(model, content, on_section) -> str:
+    """Stream the reply, calling on_section for each section as soon as it is complete. Returns the full text."""
+    parser = SectionStreamParser()
+    parts = []
+    for chunk in model.generate_content(content, safety_settings=None, stream=True):
+        try:
+            text = chunk.text
+        except ValueError:
+            # chunks without text parts (e.g. the final finish_reason chunk)
+            continue
+        parts.append(text)
+        for section in parser.feed(text):
+            on_section(section)
+    return "".join(parts)
+
+
+# rough reply size per section (title, summary, key points, base64 copy), for token-rate budgeting
+REPLY_TOKENS_PER_SECTION = 300
+
+
+def call_gemini_sections(model, transcript_text: str, max_sections: int = 8, on_section=None,
+                         scheduler: GeminiScheduler = None, priority: str = "interactive") -> Dict[str, Any]:
+    """
+    Ask Gemini for the key sections of a transcript and return the parsed JSON.
+    If on_section is given, the reply is streamed and on_section is called with each
+    section dict as soon as it has been generated; the returned dict is still parsed
+    from the complete reply.
+
+    The request goes through `scheduler` (default: the process-wide one), which applies the
+    request/token rate limits, runs "interactive" calls ahead of "batch" ones and retries
+    transient errors. A streamed call is only retried if no section was delivered yet.
+    """
+    content = _build_content(transcript_text, max_sections)
+    scheduler = scheduler or default_scheduler()
+    # estimated (see count_tokens), so leave some headroom in --gemini-tpm
+    tokens = count_tokens(transcript_text) + max_sections * REPLY_TOKENS_PER_SECTION
+    delivered = []
+
+    def deliver(section):
+        delivered.append(section)
+        on_section(section)
+
+    def generate() -> str:
+        if on_section is None:
+            return model.generate_content(content, safety_settings=None).text.strip()
+        return _generate_streamed(model, content, deliver).strip()
+
+    txt = scheduler.call(generate, tokens=tokens, priority=priority, retry_if=lambda e: not delivered)
+    return parse_sections_reply(txt)
+
+
+def parse_sections_reply(txt: str) -> Dict[str, Any]:
     # print(f"Raw gemini text: {txt}")
     if 'json' in txt:
         txt = txt[8:-3]
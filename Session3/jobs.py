@@ -0,0 +1,128 @@
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from utils import extract_video_id
+from pipeline import run_pipeline
+from tracing import Tracer
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+def job_key(url: str, params: Dict[str, Any]) -> str:
+    """Identical requests share a key: same video (however the URL is written) and same parameters."""
+    return json.dumps([extract_video_id(url), params], sort_keys=True, default=str)
+
+
+class Job:
+    """
+    Handle for one pipeline run in a JobQueue. Fields are written by the worker thread;
+    readers should go through snapshot() for a consistent view.
+    """
+
+    def __init__(self, key: str, url: str, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.url = url
+        self.params = params
+        self.status = QUEUED
+        self.stages: Dict[str, str] = {}  # stage name -> start/done/failed
+        self.sections: List[Any] = []  # streamed sections, in arrival order
+        self.warnings: List[str] = []
+        self.timings: List[Any] = []
+        self.compaction: List[Any] = []
+        self.tracer = Tracer()
+        self.timeline: List[Any] = []  # SpriteSheet, when timeline_thumbs was requested
+        self.result = None  # (title, sections, video_id, segs) once done
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def _on_stage(self, name: str, event: str):
+        with self._lock:
+            self.stages[name] = event
+
+    def _on_section(self, section):
+        with self._lock:
+            self.sections.append(section)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "id": self.id, "status": self.status, "stages": dict(self.stages),
+                "sections": list(self.sections), "warnings": list(self.warnings),
+                "timings": list(self.timings), "compaction": list(self.compaction),
+                "result": self.result, "error": self.error, "trace_summary": self.tracer.summary(),
+                "timeline": list(self.timeline),
+                "elapsed": (self.finished or time.time()) - self.created,
+            }
+
+
+class JobQueue:
+    """
+    Runs pipelines on a worker pool outside the Streamlit script thread. submit() returns
+    a Job handle straight away; an identical request that is still queued or running gets
+    the existing handle instead of starting a second pipeline.
+    """
+
+    def __init__(self, max_workers: int = 2, keep_finished: int = 100):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="yt2pdf-job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._inflight: Dict[str, Job] = {}
+        self._keep_finished = keep_finished
+
+    def submit(self, url: str, **params) -> Job:
+        key = job_key(url, params)
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is not None:
+                return job
+            job = Job(key, url, params)
+            self._jobs[job.id] = job
+            self._inflight[key] = job
+            self._prune()
+        self._pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(not j.done for j in self._jobs.values())
+
+    def _run(self, job: Job):
+        with job._lock:
+            job.status = RUNNING
+        try:
+            result = run_pipeline(job.url, warn=job.warnings.append, timings=job.timings,
+                                  compaction_stats=job.compaction, on_section=job._on_section,
+                                  progress=job._on_stage, tracer=job.tracer, timeline=job.timeline,
+                                  **job.params)
+            with job._lock:
+                job.result = result
+                job.status = DONE
+                job.finished = time.time()
+        except Exception as e:
+            with job._lock:
+                job.error = str(e)
+                job.status = FAILED
+                job.finished = time.time()
+        finally:
+            with self._lock:
+                self._inflight.pop(job.key, None)
+
+    def _prune(self):
+        finished = sorted((j for j in self._jobs.values() if j.done), key=lambda j: j.finished or 0)
+        for j in finished[:max(0, len(finished) - self._keep_finished)]:
+            del self._jobs[j.id]
@@ -1,18 +1,23 @@
 import os
-import re
-import tempfile
 import argparse
 
-from utils import extract_video_id, ffmpeg_screenshot, human_time, parse_timecode, normalize_timecode
-from youtube import ytdlp_extract, ytdlp_get_stream_url, fetch_transcript, segments_to_text
-from gemini import init_gemini, call_gemini_sections
-from pdf_builder import build_pdf, Section
+from pdf_builder import build_pdf
+from pipeline import run_pipeline, format_timings
+from batch import run_batch, format_report
+from compile_pdf import compile_pdf, videos_from_jobs
+from media_cache import MediaCache, MEDIA_CACHE_DIR
+from tracing import Tracer
+from search_index import SearchIndex, SEARCH_DB
+from scheduler import GeminiScheduler, set_default_scheduler, default_scheduler
 
 
 def main():
     parser = argparse.ArgumentParser(description="Convert a YouTube video into a summarized PDF with screenshots.")
-    parser.add_argument('--url', required=True)
-    parser.add_argument('--out', required=True)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--url')
+    source.add_argument('--urls-file', help="Batch mode: text file with one video or playlist URL per line")
+    source.add_argument('--playlist', help="Batch mode: playlist URL")
+    parser.add_argument('--out', required=True, help="Output PDF path, or output directory in batch mode")
     parser.add_argument('--lang', default='en')
     parser.add_argument('--use-auto', action='store_true', default=True, help="Use auto-generated transcripts")
     parser.add_argument('--model', default='gemini-1.5-flash')
@@ -20,60 +25,137 @@ def main():
     parser.add_argument('--screenshots', action='store_true', default=True)
     parser.add_argument('--screenshot-resolution', type=int, default=720,
                         help="Minimum vertical resolution for screenshots (e.g., 720, 1080)")
+    parser.add_argument('--pdf-image-max-px', type=int, default=1280,
+                        help="Embed screenshots in the PDF downscaled to at most this many px (0 = full resolution)")
+    parser.add_argument('--local-media', action='store_true',
+                        help="Download the video once into a local cache and take screenshots from it "
+                             "using a keyframe index instead of seeking into the remote stream")
+    parser.add_argument('--media-cache-dir', default=MEDIA_CACHE_DIR)
+    parser.add_argument('--media-cache-gb', type=float, default=5.0, help="Evict cached videos beyond this size")
+    parser.add_argument('--keyframe-snap', type=float, default=1.0,
+                        help="With --local-media, use a keyframe this many seconds from the section midpoint "
+                             "if there is one (0 = always decode to the exact midpoint)")
+    parser.add_argument('--frame-select', type=int, default=0, metavar='K',
+                        help="Pick each screenshot as the sharpest, most distinct of K low-res keyframe candidates "
+                             "from the middle of the section instead of the exact midpoint (0 = off)")
+    parser.add_argument('--gemini-rpm', type=float, default=60, help="Gemini requests per minute, for all videos")
+    parser.add_argument('--gemini-tpm', type=float, default=1_000_000, help="Gemini tokens per minute, for all videos")
+    parser.add_argument('--timeline', type=int, default=0, metavar='N',
+                        help="Append a timeline of N thumbnails of the whole video to the PDF (one ffmpeg pass)")
+    parser.add_argument('--trace', default=None, metavar='PATH',
+                        help="Write a Chrome trace (chrome://tracing / ui.perfetto.dev) of every stage to PATH")
+    parser.add_argument('--search-db', default=SEARCH_DB,
+                        help="Add transcripts and sections to this search index (see search_index.py)")
+    parser.add_argument('--no-index', action='store_true', help="Do not add the video(s) to the search index")
     parser.add_argument('--workdir', default=None)
+    parser.add_argument('--stream', action='store_true',
+                        help="Stream the Gemini reply and start each section's screenshot as soon as it is generated")
+    parser.add_argument('--compact-granularity', type=float, default=10.0,
+                        help="Merge caption segments into transcript lines of about this many seconds before "
+                             "sending them to Gemini (0 = only remove rolling-caption overlap)")
+    parser.add_argument('--no-compact', action='store_true', help="Send every caption segment to Gemini as-is")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="Number of pipeline stages / screenshots allowed to run concurrently")
+    parser.add_argument('--jobs-dir', default=None,
+                        help="Batch mode: where per-video job state is kept (default: <out>/.jobs). "
+                             "Re-run with the same dir to resume.")
+    parser.add_argument('--compile', default=None, metavar='PATH',
+                        help="Batch mode: also compile every video into one PDF with a master table of contents")
+    parser.add_argument('--max-videos', type=int, default=4, help="Batch mode: videos processed at once")
+    parser.add_argument('--network-workers', type=int, default=4, help="Batch mode: concurrent yt-dlp/transcript calls")
+    parser.add_argument('--llm-workers', type=int, default=2, help="Batch mode: concurrent Gemini calls")
+    parser.add_argument('--ffmpeg-workers', type=int, default=4, help="Batch mode: concurrent ffmpeg processes")
     args = parser.parse_args()
+    if args.trace and not args.url:
+        parser.error("--trace is for a single --url; batch runs write <jobs dir>/<video_id>/trace.json")
 
-    video_id = extract_video_id(args.url)
-    info = ytdlp_extract(args.url)
-    title = info.get('title') or f"YouTube Video {video_id}"
+    set_default_scheduler(GeminiScheduler(rpm=args.gemini_rpm, tpm=args.gemini_tpm,
+                                          max_concurrency=max(args.llm_workers, 1)))
+    search_index = None if args.no_index else SearchIndex(args.search_db)
+    media_cache = None
+    if args.local_media:
+        media_cache = MediaCache(args.media_cache_dir, max_bytes=int(args.media_cache_gb * 1024 ** 3))
 
-    segs = fetch_transcript(video_id, lang=args.lang, use_auto=args.use_auto)
-    transcript_text = segments_to_text(segs)
-    print(f"Got transcripts from youtube video")
-
-    model = init_gemini(args.model)
-    print(f"Getting sections and summary from Gemini")
-    sections_json = call_gemini_sections(model, transcript_text, max_sections=args.max_sections)
-    raw_sections = sections_json.get('sections', [])
-    print(f"\n\nGemini raw sections: {raw_sections}")
-
-    sections = []
-    for r in raw_sections:
-        s = Section(
-            title=str(r.get("title", "")).strip() or "Untitled Section",
-            start=parse_timecode(r.get("start", 0)),
-            end=parse_timecode(r.get("end", 0)),
-            summary=str(r.get("summary", "")).strip(),
-            key_points=[re.sub(r"\s+", " ", str(p)).strip() for p in r.get("key_points", [])][:6],
-            raw_start=normalize_timecode(r.get("start", "")),  # store human-readable
-            raw_end=normalize_timecode(r.get("end", ""))
+    if not args.url:
+        if args.playlist:
+            urls = [args.playlist]
+        else:
+            with open(args.urls_file) as f:
+                urls = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        report = run_batch(
+            urls, args.out,
+            jobs_dir=args.jobs_dir,
+            max_videos=args.max_videos,
+            network_workers=args.network_workers,
+            llm_workers=args.llm_workers,
+            ffmpeg_workers=args.ffmpeg_workers,
+            lang=args.lang,
+            use_auto=args.use_auto,
+            model=args.model,
+            max_sections=args.max_sections,
+            screenshots=args.screenshots,
+            screenshot_resolution=args.screenshot_resolution,
+            compact_granularity=None if args.no_compact else args.compact_granularity,
+            media_cache=media_cache,
+            keyframe_snap=args.keyframe_snap,
+            frame_select_k=args.frame_select,
+            search_index=search_index,
+            image_max_px=args.pdf_image_max_px or None,
+            timeline_thumbs=args.timeline,
         )
-        sections.append(s)
+        print(format_report(report))
+        if args.compile:
+            video_ids = [e["video_id"] for e in report["videos"] if e["status"] == "done"]
+            jobs_dir = args.jobs_dir or os.path.join(args.out, ".jobs")
+            print(compile_pdf(args.compile, videos_from_jobs(jobs_dir, video_ids),
+                              title=os.path.basename(os.path.normpath(args.out)) or "Video summaries",
+                              image_max_px=args.pdf_image_max_px or None))
+        return
 
-    if args.screenshots:
-        workdir = args.workdir or tempfile.mkdtemp(prefix=f"yt2pdf_{video_id}")
-        shots_dir = os.path.join(workdir, 'shots')
-        os.makedirs(shots_dir, exist_ok=True)
+    timings = []
+    timeline = []
+    tracer = Tracer()
+    title, sections, video_id, segs = run_pipeline(
+        args.url,
+        lang=args.lang,
+        use_auto=args.use_auto,
+        model=args.model,
+        max_sections=args.max_sections,
+        screenshots=args.screenshots,
+        screenshot_resolution=args.screenshot_resolution,
+        workdir=args.workdir,
+        timings=timings,
+        max_workers=args.workers,
+        screenshot_workers=args.workers,
+        stream=args.stream,
+        compact_granularity=None if args.no_compact else args.compact_granularity,
+        media_cache=media_cache,
+        keyframe_snap=args.keyframe_snap,
+        frame_select_k=args.frame_select,
+        tracer=tracer,
+        timeline_thumbs=args.timeline,
+        timeline=timeline,
+    )
+    print(f"\nStage timings:\n{format_timings(timings)}\n")
 
+    # Pass a flag to pdf_builder so it uses continuous layout
+    with tracer.span("pdf_build", "cpu") as info:
+        stats = build_pdf(args.out, title=title, video_url=args.url, sections=sections, continuous=True,
+                          image_max_px=args.pdf_image_max_px or None, timeline=timeline[0] if timeline else None)
+        info["bytes"] = stats.bytes
+    if search_index is not None:
+        # the PDF is already written: an indexing error (locked DB, SQLite without FTS5) only warns
         try:
-            stream_url = ytdlp_get_stream_url(args.url, resolution=args.screenshot_resolution)
+            with tracer.span("search_index", "cpu") as info:
+                info["rows"] = search_index.add_video(video_id, title, args.url, segs, sections)
         except Exception as e:
-            print(f"Failed to resolve stream URL for screenshots: {e}")
-            stream_url = None
-
-        if stream_url:
-            for i, s in enumerate(sections, 1):
-                mid = max(0, (s.start + s.end) / 2.0)
-                shot_path = os.path.join(shots_dir, f"section_{i:02d}.jpg")
-                try:
-                    ffmpeg_screenshot(stream_url, mid, shot_path)
-                    s.screenshot_path = shot_path
-                except Exception as e:
-                    print(f"⚠️ Failed screenshot section {i}: {e}")
-
-    # Pass a flag to pdf_builder so it uses continuous layout
-    build_pdf(args.out, title=title, video_url=args.url, sections=sections, continuous=True)
-    print(f"Done. Wrote {args.out}")
+            print(f"Search indexing failed: {e}")
+    print(f"Time breakdown:\n{tracer.format_summary()}\n")
+    print(default_scheduler().format_metrics())
+    if args.trace:
+        tracer.export(args.trace)
+        print(f"Wrote trace to {args.trace}")
+    print(f"Done. Wrote {stats}")
 
 
 if __name__ == "__main__":
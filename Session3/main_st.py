@@ -1,98 +1,85 @@
 import os
-import re
 import html as html_escape
+import json
 import base64
-import tempfile
+import time
+from functools import lru_cache
 import streamlit as st
 import streamlit.components.v1 as components
 
-from utils import extract_video_id, ffmpeg_screenshot, human_time, parse_timecode, normalize_timecode
-from youtube import ytdlp_extract, ytdlp_get_stream_url, fetch_transcript, segments_to_text
-from gemini import init_gemini, call_gemini_sections
-from pdf_builder import build_pdf, Section
+from utils import human_time
+from artifacts import ArtifactCache, cached_build_pdf
+from thumbnails import make_thumbnail, WEB_THUMB
+from pipeline import format_timings
+from jobs import JobQueue, QUEUED, RUNNING, DONE, FAILED
+from search_index import SearchIndex
+from scheduler import default_scheduler
 
-
-def run_pipeline(url, lang="en", use_auto=False, model="gemini-1.5-flash",
-                 max_sections=8, screenshots=True, screenshot_resolution=720):
-    """
-    Returns: (title, sections, video_id)
-    Sections are pdf_builder.Section objects with optional screenshot_path.
-    """
-    video_id = extract_video_id(url)
-    info = ytdlp_extract(url)
-    title = info.get("title") or f"YouTube Video {video_id}"
-
-    print(f"Getting transcripts")
-    segs = fetch_transcript(video_id, lang=lang, use_auto=use_auto)
-    transcript_text = segments_to_text(segs)
-    print(f"Got transcripts for video")
-    print(transcript_text)
-
-    model_obj = init_gemini(model)
-    sections_json = call_gemini_sections(model_obj, transcript_text, max_sections=max_sections)
-    print(f"Got section summary from Gemini")
-    raw_sections = sections_json.get("sections", [])
-    print(f"Gemini sections: {raw_sections}")
-
-    sections = []
-    for r in raw_sections:
-        s = Section(
-            title=str(r.get("title", "")).strip() or "Untitled Section",
-            start=parse_timecode(r.get("start", 0)),
-            end=parse_timecode(r.get("end", 0)),
-            summary=str(r.get("summary", "")).strip(),
-            key_points=[re.sub(r"\s+", " ", str(p)).strip() for p in r.get("key_points", [])][:6],
-            raw_start=normalize_timecode(r.get("start", "")),  # store human-readable
-            raw_end=normalize_timecode(r.get("end", ""))
-        )
-        sections.append(s)
-
-    if screenshots and sections:
-        workdir = tempfile.mkdtemp(prefix="yt2pdf_")
-        shots_dir = os.path.join(workdir, "shots")
-        os.makedirs(shots_dir, exist_ok=True)
-
-        try:
-            stream_url = ytdlp_get_stream_url(url, resolution=screenshot_resolution)
-        except Exception as e:
-            st.warning(f"Failed to resolve stream URL for screenshots: {e}")
-            stream_url = None
-
-        if stream_url:
-            for i, s in enumerate(sections, 1):
-                mid = max(0, (s.start + s.end) / 2.0)
-                shot_path = os.path.join(shots_dir, f"section_{i:02d}.jpg")
-                try:
-                    ffmpeg_screenshot(stream_url, mid, shot_path)
-                    s.screenshot_path = shot_path
-                except Exception as e:
-                    st.warning(f"Failed screenshot section {i}: {e}")
-
-    return title, sections, video_id, segs
+POLL_SECONDS = 1.0
+TIMELINE_THUMBS = 200
+STAGE_ICONS = {"start": "⏳", "done": "✅", "failed": "❌"}
 
 
 def _image_to_data_uri(path: str) -> str:
-    """Return a data:image/...;base64,... for a local image file. Returns empty string on failure."""
+    """
+    Return a data:image/jpeg;base64,... for a web-sized thumbnail of a local image file.
+    Returns empty string on failure.
+    """
     if not path or not os.path.exists(path):
         return ""
     try:
-        with open(path, "rb") as f:
-            data = f.read()
-        b64 = base64.b64encode(data).decode("utf-8")
-        # best-effort mime type based on extension
-        ext = os.path.splitext(path)[1].lower()
-        if ext in (".jpg", ".jpeg"):
-            mime = "image/jpeg"
-        elif ext == ".png":
-            mime = "image/png"
-        else:
-            mime = "image/jpeg"
-        return f"data:{mime};base64,{b64}"
+        thumb = make_thumbnail(path, *WEB_THUMB)
+        return _data_uri_cached(thumb, os.stat(thumb).st_mtime_ns)
     except Exception:
         return ""
 
 
-def embed_player_with_sections(video_id: str, sections, player_width=720, player_height=405):
+@lru_cache(maxsize=256)
+def _data_uri_cached(path: str, mtime_ns: int) -> str:
+    # mtime_ns is only part of the cache key, so a rewritten file gets re-encoded
+    with open(path, "rb") as f:
+        data = f.read()
+    b64 = base64.b64encode(data).decode("utf-8")
+    # best-effort mime type based on extension
+    ext = os.path.splitext(path)[1].lower()
+    mime = "image/png" if ext == ".png" else "image/jpeg"
+    return f"data:{mime};base64,{b64}"
+
+
+def timeline_html(timeline) -> str:
+    """
+    Scrubbable strip of the sprite-sheet thumbnails under the player. Each sheet is embedded
+    once as a CSS background; every thumbnail is a div showing its tile and seeks on click.
+    """
+    if timeline is None or not timeline.timestamps:
+        return ""
+    sheet_css = []
+    for k, sheet in enumerate(timeline.sheets):
+        if os.path.exists(sheet):
+            uri = _data_uri_cached(sheet, os.stat(sheet).st_mtime_ns)
+            sheet_css.append(f".sheet-{k} {{ background-image: url('{uri}'); }}")
+    tiles = []
+    for i, t in enumerate(timeline.timestamps):
+        sheet, x, y = timeline.tile_box(i)
+        tiles.append(
+            f'<div class="tl-thumb sheet-{sheet}" style="background-position:-{x}px -{y}px" '
+            f'title="{human_time(t)}" onclick="seek({int(t)})"><span>{human_time(t)}</span></div>'
+        )
+    return f"""
+    <style>
+      .timeline {{ display:flex; gap:4px; overflow-x:auto; padding:6px 0 10px 0; margin-bottom:16px; }}
+      .tl-thumb {{ flex:0 0 auto; width:{timeline.tile_w}px; height:{timeline.tile_h}px; border-radius:4px;
+                   cursor:pointer; position:relative; background-repeat:no-repeat; }}
+      .tl-thumb span {{ position:absolute; right:3px; bottom:3px; font-size:11px; color:#fff;
+                        background:rgba(0,0,0,.6); padding:0 3px; border-radius:2px; }}
+      .tl-thumb:hover {{ outline:2px solid #0b5ed7; }}
+      {" ".join(sheet_css)}
+    </style>
+    <div class="timeline">{"".join(tiles)}</div>
+    """
+
+
+def embed_player_with_sections(video_id: str, sections, player_width=720, player_height=405, timeline=None):
     style = """
     <style>
       body { font-family: Arial, Helvetica, sans-serif; margin: 10px; color: #222; }
@@ -148,6 +135,7 @@ def embed_player_with_sections(video_id: str, sections, player_width=720, player
         section_heights.append(total_section_height)
 
     sections_html = "\n".join(sections_html_parts)
+    strip_html = timeline_html(timeline)
 
     html_doc = f"""
     <!doctype html>
@@ -158,6 +146,7 @@ def embed_player_with_sections(video_id: str, sections, player_width=720, player
     </head>
     <body>
       <div class="player-wrap"><div id="player"></div></div>
+      {strip_html}
       <div class="sections">{sections_html}</div>
 
       <script src="https://www.youtube.com/iframe_api"></script>
@@ -183,12 +172,83 @@ def embed_player_with_sections(video_id: str, sections, player_width=720, player
 
     # calculate total iframe height based on actual section heights
     frame_height = player_height + sum(section_heights) + 50
+    if strip_html:
+        frame_height += timeline.tile_h + 40
     components.html(html_doc, height=frame_height, scrolling=False)
 
 
+def render_streamed_section(idx: int, s):
+    st.markdown(f"**{idx}. {s.title}** &nbsp; ⏱️ {human_time(s.start)} – {human_time(s.end)}")
+    st.markdown(s.summary)
+    if s.key_points:
+        st.markdown("\n".join(f"- {p}" for p in s.key_points))
+
+
+@st.cache_resource
+def get_artifact_cache() -> ArtifactCache:
+    return ArtifactCache()
+
+
+@st.cache_resource
+def get_search_index() -> SearchIndex:
+    return SearchIndex()
+
+
+def show_search():
+    """Sidebar search over every video summarized so far; hits link to the timestamp on YouTube."""
+    index = get_search_index()
+    st.sidebar.markdown("#### 🔎 Search library")
+    query = st.sidebar.text_input("Where was it discussed?", key="search_query")
+    kind = st.sidebar.radio("In", ["everything", "sections", "transcripts"], horizontal=True, key="search_kind")
+    if not query:
+        st.sidebar.caption(f"{index.stats()['videos']} videos indexed")
+        return
+    kind = {"sections": "section", "transcripts": "transcript"}.get(kind)
+    hits = index.search(query, limit=20, kind=kind)
+    if not hits:
+        st.sidebar.info("No matches.")
+    for h in hits:
+        label = f" · {html_escape.escape(h.label)}" if h.label else ""
+        st.sidebar.markdown(
+            f"**[{html_escape.escape(h.title)} @ {human_time(h.start_ms / 1000)}]({h.url})**{label}  \n"
+            f"{html_escape.escape(h.snippet)}"
+        )
+
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    # One queue per server process, shared by every session and surviving reruns
+    return JobQueue(max_workers=2)
+
+
+def show_job_progress(snap):
+    """Render a job snapshot: stage progress plus the sections streamed so far."""
+    ttfs = next((t.end for t in snap["timings"] if t.name == "first_section"), None)
+    if snap["status"] == QUEUED:
+        label, state = "Queued, waiting for a free worker...", "running"
+    elif snap["status"] == RUNNING:
+        running = [name for name, ev in snap["stages"].items() if ev == "start"]
+        label, state = f"Running: {', '.join(running) or 'starting'} ({snap['elapsed']:.0f}s)", "running"
+    elif snap["status"] == DONE:
+        label, state = f"Done in {snap['elapsed']:.1f}s", "complete"
+    else:
+        label, state = "Summarization failed", "error"
+    if ttfs is not None:
+        label += f" · first section after {ttfs:.1f}s"
+
+    with st.status(label, state=state, expanded=snap["status"] in (QUEUED, RUNNING)):
+        if snap["stages"]:
+            st.write(" · ".join(f"{STAGE_ICONS.get(ev, '')} {name}" for name, ev in snap["stages"].items()))
+        for i, s in enumerate(snap["sections"], 1):
+            render_streamed_section(i, s)
+    if snap["compaction"]:
+        st.caption(f"Transcript sent to Gemini: {snap['compaction'][0]}")
+
+
 def main():
     st.set_page_config(layout="wide")
     st.title("📺 YouTube ➜ PDF Summarizer with Gemini")
+    show_search()
 
     # --- URL input ---
     if "url" not in st.session_state:
@@ -223,6 +283,17 @@ def main():
     with col3:
         st.session_state.screenshots = st.checkbox("Include screenshots", value=st.session_state.screenshots)
 
+    if "timeline_strip" not in st.session_state:
+        st.session_state.timeline_strip = False
+        st.session_state.timeline_appendix = False
+    with col4:
+        st.session_state.timeline_strip = st.checkbox(
+            "Thumbnail timeline", value=st.session_state.timeline_strip,
+            help="One pass over the whole video renders a strip of thumbnails to scrub through")
+        st.session_state.timeline_appendix = st.checkbox(
+            "Add the timeline to the PDF", value=st.session_state.timeline_appendix,
+            disabled=not st.session_state.timeline_strip)
+
     # --- Actions: Start / Download ---
     st.markdown("#### Actions:")
     action_col1, action_col2, _ = st.columns([1, 1, 6])
@@ -230,20 +301,65 @@ def main():
     pdf_placeholder = action_col2.empty()
 
     # --- Run summarization ---
+    # The pipeline runs on the shared job queue; this script only submits and polls,
+    # so reruns and other sessions never block on (or lose) a running pipeline.
+    jobs = get_job_queue()
     if start_btn and st.session_state.url:
-        with st.spinner("Processing..."):
-            title, sections, video_id, transcript_text = run_pipeline(
-                st.session_state.url,
-                max_sections=st.session_state.max_sections,
-                screenshots=st.session_state.screenshots,
-                screenshot_resolution=st.session_state.screenshot_resolution,
-            )
-            # Save results in session_state
-            st.session_state.title = title
-            st.session_state.sections = sections
-            st.session_state.video_id = video_id
-            st.session_state.transcript_text = transcript_text
-            st.success("Summarization complete!")
+        job = jobs.submit(
+            st.session_state.url,
+            max_sections=st.session_state.max_sections,
+            screenshots=st.session_state.screenshots,
+            screenshot_resolution=st.session_state.screenshot_resolution,
+            timeline_thumbs=TIMELINE_THUMBS if st.session_state.timeline_strip else 0,
+        )
+        st.session_state.job_id = job.id
+
+    if "job_id" in st.session_state:
+        job = jobs.get(st.session_state.job_id)
+        if job is None:
+            del st.session_state["job_id"]
+            st.warning("The summarization job is no longer available, please start it again.")
+        else:
+            snap = job.snapshot()
+            show_job_progress(snap)
+            if snap["status"] == DONE:
+                title, sections, video_id, transcript_text = snap["result"]
+                # Save results in session_state
+                st.session_state.title = title
+                st.session_state.sections = sections
+                st.session_state.video_id = video_id
+                st.session_state.transcript_text = transcript_text
+                st.session_state.timings = snap["timings"]
+                st.session_state.trace_summary = snap["trace_summary"]
+                st.session_state.trace_json = json.dumps(job.tracer.to_chrome_trace())
+                st.session_state.warnings = snap["warnings"]
+                st.session_state.timeline = snap["timeline"][0] if snap["timeline"] else None
+                try:
+                    get_search_index().add_video(video_id, title, st.session_state.url, transcript_text, sections)
+                except Exception as e:
+                    st.session_state.warnings.append(f"Search indexing failed: {e}")
+                del st.session_state["job_id"]
+                st.success("Summarization complete!")
+            elif snap["status"] == FAILED:
+                del st.session_state["job_id"]
+                st.error(f"Summarization failed: {snap['error']}")
+            else:
+                time.sleep(POLL_SECONDS)
+                st.rerun()
+
+    for w in st.session_state.get("warnings", []):
+        st.warning(w)
+    if st.session_state.get("timings"):
+        with st.expander("Stage timings"):
+            st.code(format_timings(st.session_state.timings))
+            if st.session_state.get("trace_summary"):
+                st.markdown("**Time breakdown** (stages, and every transcript/Gemini/ffmpeg step inside them)")
+                st.bar_chart({"seconds": {r["name"]: r["total_s"] for r in st.session_state.trace_summary}})
+                st.dataframe(st.session_state.trace_summary, use_container_width=True)
+                st.download_button("Download Chrome trace", st.session_state.trace_json,
+                                   file_name="yt2pdf_trace.json", mime="application/json")
+            # shared by every session on this server
+            st.caption(default_scheduler().format_metrics())
 
     # --- Render player + sections if available ---
     # if "sections" in st.session_state and st.session_state.sections:
@@ -254,23 +370,37 @@ def main():
                 st.session_state.video_id,
                 st.session_state.sections,
                 player_width = 720,
-                player_height=405
+                player_height=405,
+                timeline=st.session_state.get("timeline"),
             )
 
-        # Generate PDF once and store path
-        if "pdf_path" not in st.session_state:
-            out_path = os.path.join(tempfile.gettempdir(), "yt_summary.pdf")
-            build_pdf(
-                out_path,
+        # PDFs are cached by content, so this only builds when the summary changed and
+        # identical summaries (from any session) share one file
+        def build():
+            return cached_build_pdf(
+                get_artifact_cache(),
                 title=st.session_state.title,
                 video_url=st.session_state.url,
                 sections=st.session_state.sections,
-                continuous=True
+                continuous=True,
+                timeline=st.session_state.get("timeline") if st.session_state.timeline_appendix else None,
             )
-            st.session_state.pdf_path = out_path
-            st.info(f"✅ PDF successfully generated at: `{out_path}`")
 
-        with open(st.session_state.pdf_path, "rb") as f:
+        pdf_path, stats = build()
+        try:
+            pdf_file = open(pdf_path, "rb")
+        except FileNotFoundError:
+            # evicted by another session in between: treat it as a miss
+            pdf_path, stats = build()
+            pdf_file = open(pdf_path, "rb")
+        if st.session_state.get("pdf_path") != pdf_path:
+            st.session_state.pdf_path = pdf_path
+            if stats is not None:
+                st.info(f"✅ PDF successfully generated: {stats}")
+            else:
+                st.info(f"✅ Reusing identical PDF: `{pdf_path}`")
+
+        with pdf_file as f:
             pdf_placeholder.download_button(
                 "📥 Download PDF",
                 f,
@@ -0,0 +1,151 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from youtube import ytdlp_download_best_mp4
+
+MEDIA_CACHE_DIR = os.path.join(tempfile.gettempdir(), "yt2pdf_media")
+
+
+def probe_keyframes(path: str) -> List[float]:
+    """
+    Sorted keyframe timestamps (seconds) of the first video stream. Reads packet flags
+    with ffprobe, so nothing is decoded.
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        path,
+    ]
+    out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True).stdout
+    keyframes = []
+    for line in out.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) >= 2 and "K" in parts[1] and parts[0] not in ("", "N/A"):
+            keyframes.append(float(parts[0]))
+    return sorted(keyframes)
+
+
+def probe_duration(source: str) -> float:
+    """Container duration in seconds (works for local files and stream URLs)."""
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", source]
+    out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True).stdout
+    return float(out.strip())
+
+
+class MediaCache:
+    """
+    Local copies of videos plus a keyframe index, one dir per video id:
+        <root>/<video_id>/media.mp4
+        <root>/<video_id>/index.json   {"keyframes": [...], "bytes": ...}
+    Entries are evicted least-recently-used first once the cache is larger than max_bytes;
+    entries held with lease() (still being read) are never evicted.
+    """
+
+    def __init__(self, root: str = MEDIA_CACHE_DIR, max_bytes: int = 5 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._video_locks: Dict[str, threading.Lock] = {}
+        self._leases: Dict[str, int] = {}  # video_id -> number of readers holding it
+        os.makedirs(root, exist_ok=True)
+
+    def _paths(self, video_id: str) -> Tuple[str, str, str]:
+        d = os.path.join(self.root, video_id)
+        return d, os.path.join(d, "media.mp4"), os.path.join(d, "index.json")
+
+    def _video_lock(self, video_id: str) -> threading.Lock:
+        with self._lock:
+            return self._video_locks.setdefault(video_id, threading.Lock())
+
+    @contextmanager
+    def lease(self, video_id: str):
+        """Keep video_id from being evicted while the block runs (e.g. around fetch() and the screenshots)."""
+        with self._lock:
+            self._leases[video_id] = self._leases.get(video_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._leases[video_id] -= 1
+                if not self._leases[video_id]:
+                    del self._leases[video_id]
+
+    def get(self, video_id: str) -> Optional[Tuple[str, List[float]]]:
+        """(media path, keyframes) if the video is cached, else None. Marks the entry as recently used."""
+        _, media, index = self._paths(video_id)
+        if not (os.path.exists(media) and os.path.exists(index)):
+            return None
+        with open(index) as f:
+            keyframes = json.load(f)["keyframes"]
+        os.utime(index)
+        return media, keyframes
+
+    def put_file(self, video_id: str, src_path: str, move: bool = False) -> Tuple[str, List[float]]:
+        """Add a local video file (e.g. one generated with ffmpeg's testsrc) under video_id and index it."""
+        with self._video_lock(video_id):
+            d, media, index = self._paths(video_id)
+            os.makedirs(d, exist_ok=True)
+            tmp = f"{media}.tmp"
+            (shutil.move if move else shutil.copyfile)(src_path, tmp)
+            os.replace(tmp, media)
+            keyframes = self._write_index(media, index)
+        self.evict(keep=video_id)
+        return media, keyframes
+
+    def fetch(self, url: str, video_id: str) -> Tuple[str, List[float]]:
+        """Return the cached copy of the video, downloading and indexing it first on a miss."""
+        with self._video_lock(video_id):
+            hit = self.get(video_id)
+            if hit:
+                return hit
+            d, media, index = self._paths(video_id)
+            download_dir = os.path.join(d, "download")
+            try:
+                downloaded = ytdlp_download_best_mp4(url, download_dir)
+                os.replace(downloaded, media)
+            finally:
+                shutil.rmtree(download_dir, ignore_errors=True)
+            keyframes = self._write_index(media, index)
+        self.evict(keep=video_id)
+        return media, keyframes
+
+    @staticmethod
+    def _write_index(media: str, index: str) -> List[float]:
+        keyframes = probe_keyframes(media)
+        tmp = f"{index}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"keyframes": keyframes, "bytes": os.path.getsize(media)}, f)
+        os.replace(tmp, index)
+        return keyframes
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        entries = []
+        for video_id in os.listdir(self.root):
+            d, media, index = self._paths(video_id)
+            if os.path.exists(index) and os.path.exists(media):
+                entries.append((os.path.getmtime(index), os.path.getsize(media), video_id))
+        return sorted(entries)
+
+    def evict(self, keep: str = None):
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, video_id in entries:
+                if total <= self.max_bytes:
+                    break
+                if video_id == keep or video_id in self._leases \
+                        or self._video_locks.get(video_id, threading.Lock()).locked():
+                    continue
+                shutil.rmtree(self._paths(video_id)[0], ignore_errors=True)
+                total -= size
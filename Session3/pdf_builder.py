@@ -1,16 +1,11 @@
 import os
-from typing import List
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import inch
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER
-from reportlab.platypus import (
-    SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak,
-    ListFlowable, ListItem
-)
-from PIL import Image as PILImage
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional
 
 from utils import ensure_dir, human_time
+from thumbnails import make_thumbnail, PDF_THUMB
 
 class Section:
     def __init__(self, title, start, end, summary, key_points, screenshot_path=None, raw_start="[00:00]", raw_end="[00:00]"):
@@ -24,15 +19,96 @@ class Section:
         self.raw_end = raw_end
 
 
-def build_pdf(out_path: str, title: str, video_url: str, sections: List[Section], page_size=A4, continuous=False):
-    ensure_dir(out_path)
-    doc = SimpleDocTemplate(out_path, pagesize=page_size, leftMargin=54, rightMargin=54, topMargin=54, bottomMargin=54)
+@dataclass
+class PdfBuildStats:
+    path: str
+    bytes: int
+    seconds: float
+    images: int
+
+    def __str__(self):
+        return f"{self.path}: {self.bytes / 1e6:.2f} MB, {self.images} images, built in {self.seconds:.2f}s"
+
+
+@lru_cache(maxsize=1)
+def _styles():
+    # built once per process; flowables only read their style
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.enums import TA_CENTER
+
     styles = getSampleStyleSheet()
     styles.add(ParagraphStyle(name='TitleCenter', parent=styles['Title'], alignment=TA_CENTER, spaceAfter=18))
     styles.add(ParagraphStyle(name='H2', parent=styles['Heading2'], spaceBefore=12, spaceAfter=6))
     styles.add(ParagraphStyle(name='H3', parent=styles['Heading3'], spaceBefore=8, spaceAfter=4))
     styles.add(ParagraphStyle(name='Body', parent=styles['BodyText'], leading=16))
     styles.add(ParagraphStyle(name='CustomBullet', parent=styles['BodyText'], fontSize=9, leading=12, leftIndent=14, spaceBefore=2))
+    return styles
+
+
+def timestamp_url(video_url: str, seconds: float) -> str:
+    return f"{video_url}{'&' if '?' in video_url else '?'}t={int(seconds)}s"
+
+
+def timeline_appendix(timeline, video_url: str, width: float, styles, cols: int = 5, quality: int = 70,
+                      anchor_prefix: str = ""):
+    """
+    Flowables for a timeline appendix: the sprite-sheet thumbnails in a grid, each captioned
+    with its timestamp linking to that point of the video. Tiles are cut from each sheet in memory.
+    """
+    import io
+    from reportlab.platypus import Paragraph, Image, Table, TableStyle
+    from PIL import Image as PILImage
+
+    tile_w = width / cols - 6
+    tile_h = tile_w * timeline.tile_h / timeline.tile_w
+    cells, sheets = [], {}
+    try:
+        for t, sheet, x, y in timeline.tiles():
+            if sheet not in sheets:
+                sheets[sheet] = PILImage.open(sheet)
+                sheets[sheet].load()
+            buf = io.BytesIO()
+            sheets[sheet].crop((x, y, x + timeline.tile_w, y + timeline.tile_h)).save(buf, "JPEG", quality=quality)
+            buf.seek(0)
+            href = timestamp_url(video_url, t).replace("&", "&amp;")
+            caption = Paragraph(f"<a href='{href}' color='blue'>{human_time(t)}</a>",
+                                styles['CustomBullet'])
+            cells.append([Image(buf, width=tile_w, height=tile_h), caption])
+    finally:
+        for im in sheets.values():
+            im.close()
+    rows = [cells[i:i + cols] for i in range(0, len(cells), cols)]
+    if rows:
+        rows[-1] += [""] * (cols - len(rows[-1]))
+    table = Table(rows, colWidths=[width / cols] * cols)
+    table.setStyle(TableStyle([("VALIGN", (0, 0), (-1, -1), "TOP"), ("ALIGN", (0, 0), (-1, -1), "CENTER")]))
+    return [Paragraph(f"<a name='{anchor_prefix}timeline'/>Timeline", styles['H2']), table]
+
+
+def build_pdf(out_path: str, title: str, video_url: str, sections: List[Section], page_size=None, continuous=False,
+              image_max_px: Optional[int] = PDF_THUMB[0], image_quality: int = PDF_THUMB[1],
+              timeline=None, anchor_prefix: str = "") -> PdfBuildStats:
+    """
+    Screenshots are embedded as size-bounded JPEG derivatives (see thumbnails.py) of at most
+    image_max_px on the long side; pass image_max_px=None to embed the captured files as-is.
+    page_size defaults to A4. reportlab and PIL are imported on the first call, so importing
+    this module (e.g. for Section) stays cheap. Pass a sprites.SpriteSheet as timeline to
+    append a thumbnail timeline of the whole video. anchor_prefix is prepended to the internal
+    link targets (toc, section_<i>, timeline) so several PDFs can be merged into one (compile_pdf.py).
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import inch
+    from reportlab.platypus import (
+        SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak,
+        ListFlowable, ListItem
+    )
+    from PIL import Image as PILImage
+
+    t0 = time.perf_counter()
+    n_images = 0
+    ensure_dir(out_path)
+    doc = SimpleDocTemplate(out_path, pagesize=page_size or A4, leftMargin=54, rightMargin=54, topMargin=54, bottomMargin=54)
+    styles = _styles()
 
     story = []
     story.append(Paragraph(title, styles['TitleCenter']))
@@ -40,27 +116,35 @@ def build_pdf(out_path: str, title: str, video_url: str, sections: List[Section]
     story.append(Spacer(1, 0.4*inch))
 
     # --- Table of Contents ---
-    story.append(Paragraph("<a name='toc'/>Key Sections", styles['H2']))
+    story.append(Paragraph(f"<a name='{anchor_prefix}toc'/>Key Sections", styles['H2']))
     for i, s in enumerate(sections, 1):
-        toc_entry = f"<a href='#section_{i}' color='blue'>{i}. {s.title}</a>  —  {human_time(s.start)}–{human_time(s.end)}"
+        toc_entry = f"<a href='#{anchor_prefix}section_{i}' color='blue'>{i}. {s.title}</a>  —  {human_time(s.start)}–{human_time(s.end)}"
         story.append(Paragraph(toc_entry, styles['Body']))
+    if timeline is not None and timeline.timestamps:
+        story.append(Paragraph(f"<a href='#{anchor_prefix}timeline' color='blue'>Timeline of the whole video</a>",
+                               styles['Body']))
     story.append(PageBreak())
 
     # --- Detailed Sections ---
     for i, s in enumerate(sections, 1):
         # Anchor for internal link target
-        story.append(Paragraph(f"<a name='section_{i}'/>", styles['Body']))
+        story.append(Paragraph(f"<a name='{anchor_prefix}section_{i}'/>", styles['Body']))
         story.append(Paragraph(f"{i}. {s.title}", styles['H2']))
         story.append(Paragraph(f"Timestamp: {human_time(s.start)}–{human_time(s.end)}", styles['Body']))
         story.append(Spacer(1, 0.1*inch))
         if s.screenshot_path and os.path.exists(s.screenshot_path):
             try:
+                img_path = s.screenshot_path
+                if image_max_px:
+                    img_path = make_thumbnail(img_path, image_max_px, image_quality)
+                # keep the same on-page size whatever resolution was embedded
                 with PILImage.open(s.screenshot_path) as im:
-                    width, height = im.size
+                    orig_width, orig_height = im.size
                 max_width = doc.width
-                scale = min(1.0, max_width / width)
-                story.append(Image(s.screenshot_path, width=width*scale, height=height*scale))
+                scale = min(1.0, max_width / orig_width)
+                story.append(Image(img_path, width=orig_width*scale, height=orig_height*scale))
                 story.append(Spacer(1, 0.15*inch))
+                n_images += 1
             except Exception:
                 pass
         # Summary with smaller heading
@@ -74,10 +158,16 @@ def build_pdf(out_path: str, title: str, video_url: str, sections: List[Section]
             story.append(ListFlowable(bullet_items, bulletType='bullet', start='circle'))
         # Back link
         story.append(Spacer(1, 0.2*inch))
-        story.append(Paragraph("<a href='#toc' color='blue'>Back to Key Sections</a>", styles['Body']))
+        story.append(Paragraph(f"<a href='#{anchor_prefix}toc' color='blue'>Back to Key Sections</a>", styles['Body']))
         if not continuous and i < len(sections):
             story.append(PageBreak())
         else:
             story.append(Spacer(1, 0.4*inch))
 
+    if timeline is not None and timeline.timestamps:
+        story.append(PageBreak())
+        story += timeline_appendix(timeline, video_url, doc.width, styles, anchor_prefix=anchor_prefix)
+        n_images += len(timeline.timestamps)
+
     doc.build(story)
+    return PdfBuildStats(out_path, os.path.getsize(out_path), time.perf_counter() - t0, n_images)
@@ -0,0 +1,363 @@
+import os
+import re
+import json
+import time
+import tempfile
+from contextlib import nullcontext
+from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from utils import extract_video_id, ffmpeg_screenshot, parse_timecode, normalize_timecode
+from youtube import ytdlp_extract, ytdlp_get_stream_url, fetch_transcript
+from transcript import compact_transcript, ColumnarTranscript
+from gemini import init_gemini, call_gemini_sections
+from pdf_builder import Section
+from media_cache import MediaCache
+from frame_select import select_frames
+from sprites import SpriteCache
+from tracing import Tracer, span
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[Dict[str, Any]], Any]
+    deps: Sequence[str] = ()
+
+
+@dataclass
+class StageTiming:
+    name: str
+    start: float  # seconds since the pipeline started
+    end: float
+    deps: Sequence[str] = ()
+    ok: bool = True
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+def run_stages(stages: List[Stage], max_workers: int = 4, timings: Optional[List[StageTiming]] = None,
+               t0: Optional[float] = None, progress=None, tracer: Optional[Tracer] = None) -> Dict[str, Any]:
+    """
+    Run stages as a dependency graph. A stage is submitted to the thread pool as
+    soon as all of its deps have finished, so independent I/O overlaps.
+    Each stage fn receives a dict with the results of its deps.
+    Returns a dict of stage name -> result. The first failing stage re-raises.
+    Timings are relative to t0 (a time.perf_counter() value, default: now).
+    progress(stage_name, event) is called from the worker thread with "start", "done" or "failed".
+    With a tracer, every stage is also recorded as a span.
+    """
+    by_name = {s.name: s for s in stages}
+    for s in stages:
+        missing = [d for d in s.deps if d not in by_name]
+        if missing:
+            raise ValueError(f"Stage '{s.name}' depends on unknown stage(s): {missing}")
+
+    t0 = time.perf_counter() if t0 is None else t0
+
+    def timed(stage: Stage, inputs: Dict[str, Any]):
+        start = time.perf_counter() - t0
+        ok = False
+        if progress:
+            progress(stage.name, "start")
+        try:
+            with span(tracer, stage.name, "stage"):
+                out = stage.fn(inputs)
+            ok = True
+            return out
+        finally:
+            if progress:
+                progress(stage.name, "done" if ok else "failed")
+            if timings is not None:
+                timings.append(StageTiming(stage.name, start, time.perf_counter() - t0, tuple(stage.deps), ok))
+
+    results: Dict[str, Any] = {}
+    pending = dict(by_name)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="yt2pdf") as pool:
+        while pending or running:
+            ready = [s for s in pending.values() if all(d in results for d in s.deps)]
+            for s in ready:
+                del pending[s.name]
+                running[pool.submit(timed, s, {d: results[d] for d in s.deps})] = s.name
+            if not running:
+                raise RuntimeError(f"Stage dependency cycle among: {sorted(pending)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                results[name] = fut.result()
+    return results
+
+
+def critical_path(timings: List[StageTiming]) -> List[StageTiming]:
+    """Walk back from the last stage to finish through the dep that finished last."""
+    if not timings:
+        return []
+    by_name = {t.name: t for t in timings}
+    node = max(timings, key=lambda t: t.end)
+    path = [node]
+    while node.deps:
+        node = max((by_name[d] for d in node.deps if d in by_name), key=lambda t: t.end, default=None)
+        if node is None:
+            break
+        path.append(node)
+    return list(reversed(path))
+
+
+def format_timings(timings: List[StageTiming]) -> str:
+    on_path = {t.name for t in critical_path(timings)}
+    lines = [f"{'stage':<14}{'start':>8}{'end':>8}{'dur':>8}"]
+    for t in sorted(timings, key=lambda t: t.start):
+        mark = " *" if t.name in on_path else ""
+        status = "" if t.ok else " (failed)"
+        lines.append(f"{t.name:<14}{t.start:>7.2f}s{t.end:>7.2f}s{t.duration:>7.2f}s{mark}{status}")
+    lines.append("* = critical path")
+    return "\n".join(lines)
+
+
+def parse_sections(raw_sections) -> List[Section]:
+    sections = []
+    for r in raw_sections:
+        s = Section(
+            title=str(r.get("title", "")).strip() or "Untitled Section",
+            start=parse_timecode(r.get("start", 0)),
+            end=parse_timecode(r.get("end", 0)),
+            summary=str(r.get("summary", "")).strip(),
+            key_points=[re.sub(r"\s+", " ", str(p)).strip() for p in r.get("key_points", [])][:6],
+            raw_start=normalize_timecode(r.get("start", "")),  # store human-readable
+            raw_end=normalize_timecode(r.get("end", ""))
+        )
+        sections.append(s)
+    return sections
+
+
+def screenshot_section(source: str, i: int, s: Section, shots_dir: str, warn=print, limit=None,
+                       keyframes=None, snap=0.0, ts=None, tracer: Optional[Tracer] = None) -> Optional[str]:
+    """
+    Grab a frame of section i into shots_dir: at `ts` if given, else the section midpoint.
+    Returns the path, or None on failure.
+    """
+    mid = max(0, (s.start + s.end) / 2.0) if ts is None else ts
+    shot_path = os.path.join(shots_dir, f"section_{i:02d}.jpg")
+    with limit or nullcontext(), span(tracer, "screenshot", "ffmpeg", section=i, ts=round(mid, 3)) as info:
+        try:
+            ffmpeg_screenshot(source, mid, shot_path, keyframes=keyframes, snap=snap)
+            info["bytes"] = os.path.getsize(shot_path)
+            return shot_path
+        except Exception as e:
+            info["outcome"], info["error"] = "error", str(e)[:500]
+            warn(f"Failed screenshot section {i}: {e}")
+            return None
+
+
+def capture_screenshots(source: str, sections: List[Section], shots_dir: str, max_workers: int = 4, warn=print,
+                        limit=None, keyframes=None, snap=0.0, frame_select_k=0, tracer: Optional[Tracer] = None):
+    """
+    Grab the midpoint frame of every section, running the ffmpeg processes concurrently.
+    `limit` is an optional context manager (e.g. a shared Semaphore) held around each ffmpeg call.
+    keyframes/snap are passed to ffmpeg_screenshot for index-guided seeks into a local file.
+    With frame_select_k > 0, each section instead gets the best of k low-res candidate frames
+    (see frame_select.py), extracted at full resolution.
+    """
+    os.makedirs(shots_dir, exist_ok=True)
+    timestamps = [None] * len(sections)
+    if frame_select_k:
+        with span(tracer, "frame_select", "ffmpeg", sections=len(sections), k=frame_select_k):
+            timestamps = select_frames(source, sections, k=frame_select_k, max_workers=max_workers, warn=warn,
+                                       limit=limit)
+
+    def grab(i, s):
+        path = screenshot_section(source, i, s, shots_dir, warn=warn, limit=limit, keyframes=keyframes, snap=snap,
+                                  ts=timestamps[i - 1], tracer=tracer)
+        if path:
+            s.screenshot_path = path
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ffmpeg") as pool:
+        list(pool.map(lambda args: grab(*args), enumerate(sections, 1)))
+    return sections
+
+
+def run_pipeline(url, lang="en", use_auto=False, model="gemini-1.5-flash",
+                 max_sections=8, screenshots=True, screenshot_resolution=720,
+                 workdir=None, warn=print, timings=None, max_workers=4, screenshot_workers=4,
+                 stream=False, on_section=None, compact_granularity=10.0, compaction_stats=None, progress=None,
+                 media_cache: Optional[MediaCache] = None, keyframe_snap=1.0, frame_select_k=0,
+                 tracer: Optional[Tracer] = None, timeline_thumbs=0, timeline=None,
+                 sprite_cache: Optional[SpriteCache] = None, priority="interactive"):
+    """
+    Returns: (title, sections, video_id, segs)
+    Sections are pdf_builder.Section objects with optional screenshot_path; segs is a
+    transcript.ColumnarTranscript (iterate it, or to_segments(), for TranscriptSegments).
+
+    Stage graph:
+        metadata ─────────────────────────────┐
+        transcript ──> gemini ──┐             ├──> result
+        stream_url ─────────────┴─> screenshots
+    Pass a list as `timings` to collect a StageTiming per stage.
+
+    With stream=True (implied by on_section) the Gemini reply is streamed: each section's
+    screenshot starts as soon as that section has been generated, and on_section(Section)
+    is called from a worker thread. A "first_section" timing records time-to-first-section.
+
+    The transcript is compacted to lines of about compact_granularity seconds before the
+    Gemini call (None sends every caption segment); pass a list as `compaction_stats`
+    to collect the CompactionStats. progress is passed through to run_stages.
+
+    With a media_cache, the stream_url stage downloads the video into the cache once
+    (or reuses the cached copy) and screenshots seek into the local file using its keyframe
+    index, taking a keyframe within keyframe_snap seconds of the midpoint when there is one.
+
+    frame_select_k > 0 picks a representative frame per section out of k candidates instead of
+    the midpoint. Picking compares neighbouring sections, so screenshots then wait for the final
+    sections rather than starting while Gemini streams.
+
+    Pass a tracing.Tracer to record every stage and sub-step (transcript compaction, Gemini
+    generation, each screenshot) with its duration, bytes and outcome.
+
+    timeline_thumbs > 0 adds a "timeline" stage next to Gemini: one ffmpeg pass over the video
+    renders that many thumbnails into sprite sheets (sprites.py, cached per video). Pass a list
+    as `timeline` to collect the SpriteSheet; failures only warn.
+
+    The Gemini call goes through the process-wide scheduler (scheduler.py) with `priority`
+    "interactive" or "batch".
+    """
+    video_id = extract_video_id(url)
+    stream = stream or on_section is not None
+    t0 = time.perf_counter()
+    shots_dir = None
+    if screenshots:
+        shots_dir = os.path.join(workdir or tempfile.mkdtemp(prefix=f"yt2pdf_{video_id}"), "shots")
+        os.makedirs(shots_dir, exist_ok=True)
+
+    # Resolved by the stream_url stage; streamed screenshots block on it
+    stream_url = Future()
+    seek = {"keyframes": None, "snap": 0.0}  # filled in when screenshots come from the media cache
+    shot_pool = ThreadPoolExecutor(max_workers=screenshot_workers, thread_name_prefix="ffmpeg") \
+        if (stream and screenshots and not frame_select_k) else None
+    early_shots = []  # (start, end, Future[screenshot path] or None) per streamed section, in arrival order
+
+    def early_shot(i, s):
+        source = stream_url.result()
+        return screenshot_section(source, i, s, shots_dir, warn=warn, tracer=tracer, **seek) if source else None
+
+    def metadata_stage(_):
+        return ytdlp_extract(url)
+
+    def transcript_stage(_):
+        with span(tracer, "fetch_transcript", "network") as info:
+            segs = ColumnarTranscript.from_segments(fetch_transcript(video_id, lang=lang, use_auto=use_auto))
+            info["segments"] = len(segs)
+            info["bytes"] = len(segs.text.encode("utf-8"))
+        return segs
+
+    def gemini_stage(inputs):
+        with span(tracer, "compact_transcript", "cpu") as info:
+            transcript_text, stats = compact_transcript(inputs["transcript"], granularity=compact_granularity)
+            info.update(chars_in=stats.chars_in, chars_out=stats.chars_out, tokens_out=stats.tokens_out)
+        print(f"Transcript compaction: {stats}")
+        if compaction_stats is not None:
+            compaction_stats.append(stats)
+        model_obj = init_gemini(model)
+        started = time.perf_counter() - t0
+
+        def streamed(raw):
+            s = parse_sections([raw])[0]
+            if not early_shots:
+                if timings is not None:
+                    timings.append(StageTiming("first_section", started, time.perf_counter() - t0, ("transcript",)))
+                if tracer is not None:
+                    tracer.mark("first_section", "llm")
+            fut = shot_pool.submit(early_shot, len(early_shots) + 1, s) if shot_pool is not None else None
+            early_shots.append((s.start, s.end, fut))
+            if on_section:
+                on_section(s)
+
+        with span(tracer, "gemini_generate", "llm", model=model, stream=stream) as info:
+            info["bytes_in"] = len(transcript_text.encode("utf-8"))
+            sections_json = call_gemini_sections(model_obj, transcript_text, max_sections=max_sections,
+                                                 on_section=streamed if stream else None, priority=priority)
+            info["bytes"] = len(json.dumps(sections_json).encode("utf-8"))
+            info["sections"] = len(sections_json.get("sections", []))
+        raw_sections = sections_json.get("sections", [])
+        print(f"Gemini sections: {raw_sections}")
+        return parse_sections(raw_sections)
+
+    def stream_url_stage(_):
+        try:
+            if media_cache is not None:
+                with span(tracer, "media_cache_fetch", "network") as info:
+                    url_, seek["keyframes"] = media_cache.fetch(url, video_id)
+                    info["bytes"] = os.path.getsize(url_)
+                    info["keyframes"] = len(seek["keyframes"])
+                seek["snap"] = keyframe_snap
+            else:
+                url_ = ytdlp_get_stream_url(url, resolution=screenshot_resolution)
+        except Exception as e:
+            warn(f"Failed to resolve stream URL for screenshots: {e}")
+            url_ = None
+        stream_url.set_result(url_)
+        return url_
+
+    def timeline_stage(inputs):
+        source = inputs["stream_url"]
+        if not source:
+            return None
+        try:
+            with span(tracer, "timeline_sprites", "ffmpeg", thumbs=timeline_thumbs) as info:
+                sprites = (sprite_cache or SpriteCache()).get(video_id, source, max_thumbs=timeline_thumbs)
+                info["sheets"] = len(sprites.sheets)
+                info["bytes"] = sum(os.path.getsize(p) for p in sprites.sheets)
+        except Exception as e:
+            warn(f"Timeline sprite generation failed: {e}")
+            return None
+        if timeline is not None:
+            timeline.append(sprites)
+        return sprites
+
+    def screenshots_stage(inputs):
+        sections, source = inputs["gemini"], inputs["stream_url"]
+        if not (source and sections):
+            return sections
+        # Reuse frames already grabbed while streaming; the final parse normally matches them one-to-one,
+        # by position. A streamed grab that failed has already warned and is not tried again.
+        missing = []
+        for i, s in enumerate(sections):
+            start, end, fut = early_shots[i] if i < len(early_shots) else (None, None, None)
+            if fut is not None and (start, end) == (s.start, s.end):
+                s.screenshot_path = fut.result()
+            else:
+                missing.append(s)
+        if missing:
+            target = os.path.join(shots_dir, "final") if early_shots else shots_dir
+            capture_screenshots(source, missing, target, max_workers=screenshot_workers, warn=warn,
+                                frame_select_k=frame_select_k, tracer=tracer, **seek)
+        return sections
+
+    stages = [
+        Stage("metadata", metadata_stage),
+        Stage("transcript", transcript_stage),
+        Stage("gemini", gemini_stage, deps=("transcript",)),
+    ]
+    if screenshots or timeline_thumbs:
+        stages.append(Stage("stream_url", stream_url_stage))
+    if screenshots:
+        stages.append(Stage("screenshots", screenshots_stage, deps=("gemini", "stream_url")))
+    if timeline_thumbs:
+        stages.append(Stage("timeline", timeline_stage, deps=("stream_url",)))
+
+    # The cached video must stay on disk until the screenshots and sprites are taken
+    lease = media_cache.lease(video_id) if media_cache is not None else nullcontext()
+    try:
+        with lease:
+            results = run_stages(stages, max_workers=max_workers, timings=timings, t0=t0, progress=progress,
+                                 tracer=tracer)
+    finally:
+        if not stream_url.done():
+            stream_url.set_result(None)  # unblock streamed screenshots if the graph failed early
+        if shot_pool is not None:
+            shot_pool.shutdown(wait=True)
+    title = (results["metadata"] or {}).get("title") or f"YouTube Video {video_id}"
+    return title, results["gemini"], video_id, results["transcript"]
@@ -0,0 +1,200 @@
+import os
+import time
+import heapq
+import random
+import itertools
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+METRIC_SAMPLES = 1024  # wait/latency samples kept per priority for metrics()
+
+_TRANSIENT_ERRORS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+    "InternalServerError", "Aborted", "GatewayTimeout",
+}
+_TRANSIENT_TEXT = ("429", "503", "quota", "rate limit", "resource exhausted", "temporarily", "try again")
+
+
+def is_transient(e: BaseException) -> bool:
+    """Quota, overload and timeout errors that are worth retrying (google.api_core names, or their text)."""
+    if type(e).__name__ in _TRANSIENT_ERRORS or isinstance(e, (TimeoutError, ConnectionError)):
+        return True
+    msg = str(e).lower()
+    return any(t in msg for t in _TRANSIENT_TEXT)
+
+
+class TokenBucket:
+    """rate units per second, bursting up to capacity. Not thread-safe; GeminiScheduler locks around it."""
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.level = capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, n: float) -> float:
+        """Seconds until n units are available (requests larger than capacity wait for a full bucket)."""
+        self._refill()
+        n = min(n, self.capacity)
+        return 0.0 if self.level >= n else (n - self.level) / self.rate
+
+    def take(self, n: float):
+        self._refill()
+        self.level -= min(n, self.capacity)
+
+
+def _percentile(values: Iterable[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+class GeminiScheduler:
+    """
+    Process-wide gate in front of Gemini. Every call waits for
+      - a free slot (max_concurrency calls in flight),
+      - a request token (rpm) and enough tokens for its prompt and reply (tpm),
+    and is admitted in priority order ("interactive" before "batch", FIFO within one).
+    Transient errors (quota, 5xx, timeouts) are retried with full-jitter exponential backoff.
+    metrics() reports queue depth, wait and call latency (over the last METRIC_SAMPLES calls),
+    retries and failures.
+    """
+
+    def __init__(self, rpm: float = 60, tpm: float = 1_000_000, max_concurrency: int = 4, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 30.0, sleep=time.sleep, clock=time.monotonic):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._clock = clock
+        self._requests = TokenBucket(rpm / 60.0, max(1.0, rpm / 60.0 * 10), clock)  # ~10s of burst
+        self._tokens = TokenBucket(tpm / 60.0, tpm / 6.0, clock)
+        self._cond = threading.Condition()
+        self._waiting: List[tuple] = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._active = 0
+        self._max_depth = 0
+        self._counts = {"calls": 0, "ok": 0, "failed": 0, "retries": 0}
+        self._waits: Dict[str, Deque[float]] = {p: deque(maxlen=METRIC_SAMPLES) for p in PRIORITIES}
+        self._latencies: Deque[float] = deque(maxlen=METRIC_SAMPLES)
+
+    def _acquire(self, tokens: float, priority: str) -> float:
+        entry = (PRIORITIES[priority], next(self._seq))
+        t0 = self._clock()
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            self._max_depth = max(self._max_depth, len(self._waiting))
+            try:
+                while True:
+                    if self._waiting[0] == entry and self._active < self.max_concurrency:
+                        wait = max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait(1.0)
+                heapq.heappop(self._waiting)
+                self._requests.take(1)
+                self._tokens.take(tokens)
+                self._active += 1
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                raise
+            finally:
+                self._cond.notify_all()
+            waited = self._clock() - t0
+            self._waits[priority].append(waited)
+            return waited
+
+    def _release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn: Callable[[], Any], tokens: float = 0, priority: str = "interactive",
+             retry_if: Optional[Callable[[BaseException], bool]] = None) -> Any:
+        """
+        Run fn() once admitted, retrying transient failures. retry_if(e) can veto a retry,
+        e.g. once a streamed reply has already been partly delivered.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}, expected one of {list(PRIORITIES)}")
+        with self._cond:
+            self._counts["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            self._acquire(tokens, priority)
+            t = self._clock()
+            try:
+                out = fn()
+            except Exception as e:
+                retry = (attempt < self.max_retries and is_transient(e) and (retry_if is None or retry_if(e)))
+                with self._cond:
+                    self._counts["retries" if retry else "failed"] += 1
+                if not retry:
+                    raise
+            else:
+                with self._cond:
+                    self._counts["ok"] += 1
+                    self._latencies.append(self._clock() - t)
+                return out
+            finally:
+                self._release()
+            self._sleep(self.backoff(attempt))
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            m = dict(self._counts, queue_depth=len(self._waiting), max_queue_depth=self._max_depth,
+                     in_flight=self._active)
+            for p, waits in self._waits.items():
+                m[f"wait_p50_s/{p}"] = round(_percentile(waits, 0.5), 3)
+                m[f"wait_p95_s/{p}"] = round(_percentile(waits, 0.95), 3)
+            m["latency_p50_s"] = round(_percentile(self._latencies, 0.5), 3)
+            m["latency_p95_s"] = round(_percentile(self._latencies, 0.95), 3)
+        return m
+
+    def format_metrics(self) -> str:
+        m = self.metrics()
+        return (f"Gemini: {m['ok']}/{m['calls']} ok, {m['retries']} retries, {m['failed']} failed; "
+                f"queue depth {m['queue_depth']} (max {m['max_queue_depth']}); "
+                f"wait p50/p95 interactive {m['wait_p50_s/interactive']:.2f}/{m['wait_p95_s/interactive']:.2f}s, "
+                f"batch {m['wait_p50_s/batch']:.2f}/{m['wait_p95_s/batch']:.2f}s; "
+                f"latency p50/p95 {m['latency_p50_s']:.2f}/{m['latency_p95_s']:.2f}s")
+
+
+_default: Optional[GeminiScheduler] = None
+_default_lock = threading.Lock()
+
+
+def default_scheduler() -> GeminiScheduler:
+    """The process-wide scheduler, created on first use from GEMINI_RPM / GEMINI_TPM / GEMINI_CONCURRENCY."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = GeminiScheduler(
+                rpm=float(os.getenv("GEMINI_RPM", 60)),
+                tpm=float(os.getenv("GEMINI_TPM", 1_000_000)),
+                max_concurrency=int(os.getenv("GEMINI_CONCURRENCY", 4)),
+            )
+        return _default
+
+
+def set_default_scheduler(scheduler: GeminiScheduler):
+    global _default
+    with _default_lock:
+        _default = scheduler
@@ -0,0 +1,194 @@
+"""
+Full-text search over every summarized video: "where was X discussed?"
+
+    python search_index.py "gradient descent"
+    python search_index.py "batch norm" --kind section --limit 5
+    python search_index.py --add-jobs out/course/.jobs    # index videos processed in batch mode
+"""
+import os
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from utils import human_time
+from transcript import ColumnarTranscript, compact_segments
+
+SEARCH_DB = os.path.join(os.path.expanduser("~"), ".yt2pdf", "search.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT PRIMARY KEY,
+    title TEXT,
+    url TEXT,
+    indexed_at REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5(
+    text,
+    video_id UNINDEXED,
+    kind UNINDEXED,
+    start_ms UNINDEXED,
+    label UNINDEXED,
+    tokenize = 'porter unicode61'
+);
+"""
+
+
+@dataclass
+class SearchHit:
+    video_id: str
+    title: str
+    kind: str  # "transcript" or "section"
+    start_ms: int
+    label: str  # section title, or "" for transcript passages
+    snippet: str
+    score: float
+
+    @property
+    def url(self) -> str:
+        return f"https://www.youtube.com/watch?v={self.video_id}&t={self.start_ms // 1000}s"
+
+    def __str__(self):
+        where = f"{self.title} @ {human_time(self.start_ms / 1000)}"
+        label = f" [{self.label}]" if self.label else ""
+        return f"{where}{label}\n    {self.snippet}\n    {self.url}"
+
+
+def fts_query(text: str) -> str:
+    """Quote every word, so user input is matched literally instead of as FTS5 syntax (AND/OR/NEAR, "-", ":")."""
+    words = text.split()
+    return " ".join('"' + w.replace('"', '""') + '"' for w in words)
+
+
+class SearchIndex:
+    """
+    SQLite FTS5 index of transcript passages and generated sections, one row per passage
+    with the video id and start time in ms. add_video() replaces a video's rows, so
+    re-running a video keeps the index current. Safe to share between threads: each call
+    uses its own connection.
+    """
+
+    def __init__(self, path: str = SEARCH_DB, passage_seconds: float = 30.0):
+        self.path = path
+        self.passage_seconds = passage_seconds
+        self._write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def add_video(self, video_id: str, title: str, url: str, segs: Iterable = (), sections: Iterable = ()) -> int:
+        """
+        (Re)index one video from its transcript (segment list or ColumnarTranscript) and its
+        pdf_builder.Section list. Transcript captions are merged into passages of about
+        passage_seconds, which ranks better than single captions. Returns the number of rows.
+        """
+        rows = []
+        if segs:
+            for p in compact_segments(ColumnarTranscript.from_segments(segs), granularity=self.passage_seconds,
+                                      max_chars=2000):
+                rows.append((p.text, video_id, "transcript", int(p.start * 1000), ""))
+        for s in sections:
+            text = " ".join([s.title, s.summary] + list(s.key_points or []))
+            rows.append((text, video_id, "section", int(s.start * 1000), s.title))
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM passages WHERE video_id = ?", (video_id,))
+            conn.executemany("INSERT INTO passages (text, video_id, kind, start_ms, label) VALUES (?, ?, ?, ?, ?)", rows)
+            conn.execute("INSERT OR REPLACE INTO videos (video_id, title, url, indexed_at) VALUES (?, ?, ?, ?)",
+                         (video_id, title, url, time.time()))
+        return len(rows)
+
+    def remove_video(self, video_id: str):
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM passages WHERE video_id = ?", (video_id,))
+            conn.execute("DELETE FROM videos WHERE video_id = ?", (video_id,))
+
+    def search(self, query: str, limit: int = 20, kind: Optional[str] = None, raw: bool = False) -> List[SearchHit]:
+        """
+        Best matches first (bm25). Words are matched literally unless raw=True, which passes
+        the query through as FTS5 syntax (e.g. 'NEAR(loss gradient)', 'optim*').
+        kind restricts results to "transcript" or "section" rows.
+        """
+        match = query if raw else fts_query(query)
+        if not match:
+            return []
+        sql = """
+            SELECT p.video_id, COALESCE(v.title, p.video_id), p.kind, p.start_ms, p.label,
+                   snippet(passages, 0, '[', ']', '…', 16), bm25(passages)
+            FROM passages p LEFT JOIN videos v ON v.video_id = p.video_id
+            WHERE passages MATCH ?
+        """
+        params: list = [match]
+        if kind:
+            sql += " AND p.kind = ?"
+            params.append(kind)
+        sql += " ORDER BY bm25(passages) LIMIT ?"
+        params.append(limit)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [SearchHit(vid, title, k, int(ms), label, snip, -score)
+                for vid, title, k, ms, label, snip, score in rows]
+
+    def stats(self):
+        with closing(self._connect()) as conn:
+            videos = conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+            passages = conn.execute("SELECT COUNT(*) FROM passages").fetchone()[0]
+        return {"videos": videos, "passages": passages}
+
+
+def add_job_dirs(index: SearchIndex, jobs_dir: str) -> int:
+    """Index every finished batch job (see batch.VideoJob) under jobs_dir. Returns the number of videos."""
+    from pipeline import parse_sections
+
+    n = 0
+    for video_id in sorted(os.listdir(jobs_dir)):
+        d = os.path.join(jobs_dir, video_id)
+        try:
+            with open(os.path.join(d, "job.json")) as f:
+                state = json.load(f)
+            with open(os.path.join(d, "transcript.json")) as f:
+                segs = ColumnarTranscript.from_dict(json.load(f))
+            with open(os.path.join(d, "gemini.json")) as f:
+                sections = parse_sections(json.load(f))
+        except (OSError, ValueError):
+            continue  # not a job dir, or the job did not get that far
+        title = None
+        if os.path.exists(os.path.join(d, "metadata.json")):
+            with open(os.path.join(d, "metadata.json")) as f:
+                title = json.load(f).get("title")
+        index.add_video(video_id, title or video_id, state.get("url", ""), segs, sections)
+        n += 1
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the transcripts and sections of summarized videos.")
+    parser.add_argument("query", nargs="?")
+    parser.add_argument("--db", default=SEARCH_DB)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--kind", choices=["transcript", "section"])
+    parser.add_argument("--raw", action="store_true", help="Pass the query through as FTS5 syntax")
+    parser.add_argument("--add-jobs", metavar="JOBS_DIR", help="Index the videos of a batch run's job dir first")
+    args = parser.parse_args()
+
+    index = SearchIndex(args.db)
+    if args.add_jobs:
+        print(f"Indexed {add_job_dirs(index, args.add_jobs)} videos from {args.add_jobs}")
+    if args.query:
+        t = time.perf_counter()
+        hits = index.search(args.query, limit=args.limit, kind=args.kind, raw=args.raw)
+        for i, h in enumerate(hits, 1):
+            print(f"{i}. {h}")
+        print(f"{len(hits)} hits in {(time.perf_counter() - t) * 1000:.1f} ms ({index.stats()['videos']} videos indexed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import os
+import json
+import glob
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Tuple
+
+from media_cache import probe_duration
+
+SPRITE_DIR = os.path.join(tempfile.gettempdir(), "yt2pdf_sprites")
+TILE_SIZE = (160, 90)
+
+
+@dataclass
+class SpriteSheet:
+    """
+    A timeline of thumbnails tiled into sheets (sprite_001.jpg, ...). Thumbnail i shows the
+    video at about timestamps[i] and sits on sheets[sheet] at pixel (x, y) = tile_box(i).
+    With keyframes_only the frame is the last keyframe before the timestamp.
+    """
+    sheets: List[str]
+    timestamps: List[float]
+    interval: float
+    cols: int
+    rows: int
+    tile_w: int
+    tile_h: int
+    keyframes_only: bool = True
+    duration: float = 0.0
+    build_seconds: float = 0.0
+
+    @property
+    def per_sheet(self) -> int:
+        return self.cols * self.rows
+
+    def tile_box(self, i: int) -> Tuple[int, int, int]:
+        """(sheet index, x, y) of thumbnail i."""
+        sheet, k = divmod(i, self.per_sheet)
+        row, col = divmod(k, self.cols)
+        return sheet, col * self.tile_w, row * self.tile_h
+
+    def tiles(self):
+        """(timestamp, sheet path, x, y) for every thumbnail, in time order."""
+        for i, t in enumerate(self.timestamps):
+            sheet, x, y = self.tile_box(i)
+            yield t, self.sheets[sheet], x, y
+
+    def save(self, path: str):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(asdict(self), f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SpriteSheet":
+        with open(path) as f:
+            return cls(**json.load(f))
+
+
+def timeline_interval(duration: float, max_thumbs: int = 200, min_interval: float = 2.0) -> float:
+    """Seconds between thumbnails so the whole video fits in max_thumbs, but no denser than min_interval."""
+    return max(min_interval, duration / max(max_thumbs, 1))
+
+
+def build_sprites(source: str, out_dir: str, duration: float = None, max_thumbs: int = 200,
+                  tile_size=TILE_SIZE, cols: int = 10, rows: int = 10, keyframes_only: bool = True,
+                  quality: int = 5) -> SpriteSheet:
+    """
+    Decode the video once and write its timeline as tiled JPEG sheets: the fps filter keeps one
+    frame per interval, scale+pad fit it into a fixed tile, and tile packs cols x rows tiles per
+    output image. keyframes_only (-skip_frame nokey) decodes only keyframes, which makes the
+    pass several times faster at the cost of thumbnails being up to one GOP early.
+    """
+    duration = duration if duration is not None else probe_duration(source)
+    interval = timeline_interval(duration, max_thumbs)
+    w, h = tile_size
+    os.makedirs(out_dir, exist_ok=True)
+    for old in glob.glob(os.path.join(out_dir, "sprite_*.jpg")):
+        os.remove(old)
+    t0 = time.perf_counter()
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"]
+    if keyframes_only:
+        cmd += ["-skip_frame", "nokey"]
+    cmd += [
+        "-i", source,
+        "-an", "-sn",
+        "-vf", f"fps=1/{interval:.6f},"
+               f"scale={w}:{h}:force_original_aspect_ratio=decrease,pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,"
+               f"tile={cols}x{rows}",
+        "-q:v", str(quality),
+        os.path.join(out_dir, "sprite_%03d.jpg"),
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    sheets = sorted(glob.glob(os.path.join(out_dir, "sprite_*.jpg")))
+    count = min(int(duration // interval) + 1, len(sheets) * cols * rows)
+    return SpriteSheet(
+        sheets=sheets, timestamps=[round(i * interval, 3) for i in range(count)], interval=interval,
+        cols=cols, rows=rows, tile_w=w, tile_h=h, keyframes_only=keyframes_only, duration=duration,
+        build_seconds=time.perf_counter() - t0,
+    )
+
+
+class SpriteCache:
+    """
+    Sprite sheets per video and settings: <root>/<video_id>/<settings>/index.json plus the
+    sheets. A video is decoded once; later runs and reruns load the index.
+    """
+
+    def __init__(self, root: str = SPRITE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self._video_locks: Dict[str, threading.Lock] = {}
+
+    def get(self, video_id: str, source: str, max_thumbs: int = 200, cols: int = 10, rows: int = 10,
+            keyframes_only: bool = True) -> SpriteSheet:
+        settings = f"n{max_thumbs}_{cols}x{rows}_{'key' if keyframes_only else 'all'}"
+        d = os.path.join(self.root, video_id, settings)
+        index = os.path.join(d, "index.json")
+        with self._lock:
+            lock = self._video_locks.setdefault(video_id, threading.Lock())
+        with lock:
+            if os.path.exists(index):
+                return SpriteSheet.load(index)
+            tmp_dir = f"{d}.{os.getpid()}.tmp"
+            try:
+                sprites = build_sprites(source, tmp_dir, max_thumbs=max_thumbs, cols=cols, rows=rows,
+                                        keyframes_only=keyframes_only)
+                shutil.rmtree(d, ignore_errors=True)
+                os.replace(tmp_dir, d)
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            sprites.sheets = [os.path.join(d, os.path.basename(p)) for p in sprites.sheets]
+            sprites.save(index)
+            return sprites
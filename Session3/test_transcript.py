@@ -0,0 +1,27 @@
+from transcript import compact_segments
+from youtube import TranscriptSegment
+
+
+def _compact(*texts, granularity=0):
+    segs = [TranscriptSegment(start=i * 3.0, dur=3.0, text=t) for i, t in enumerate(texts)]
+    return [s.text for s in compact_segments(segs, granularity=granularity)]
+
+
+def test_single_repeated_word_is_kept():
+    assert _compact("So what do we do.", "We do this thing.") == ["So what do we do.", "We do this thing."]
+    assert _compact("and then", "then we go home") == ["and then", "then we go home"]
+    assert _compact("I think it is", "is important") == ["I think it is", "is important"]
+
+
+def test_short_repeat_is_kept_at_default_granularity():
+    assert _compact("So what do we do.", "We do this thing.", granularity=10) == [
+        "So what do we do. We do this thing."]
+
+
+def test_rolling_caption_overlap_is_dropped():
+    assert _compact("today we look at how the model", "at how the model learns from data") == [
+        "today we look at how the model", "learns from data"]
+
+
+def test_repeat_of_most_of_a_short_segment_is_dropped():
+    assert _compact("thank you", "thank you very much") == ["thank you", "very much"]
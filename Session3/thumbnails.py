@@ -0,0 +1,44 @@
+import os
+import hashlib
+import threading
+
+# (max long-side in px, JPEG quality) per consumer.
+# PDF: the image is drawn ~6.8in wide, so 1280px is ~190 dpi. Web: the HTML thumb is at most 700 css px.
+PDF_THUMB = (1280, 80)
+WEB_THUMB = (960, 75)
+
+
+def thumbnail_path(src_path: str, max_size: int, quality: int, cache_dir: str = None) -> str:
+    """Cache location for a derivative; the name changes whenever the source file or the params change."""
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(src_path)), "thumbs")
+    st = os.stat(src_path)
+    key = f"{os.path.abspath(src_path)}|{st.st_mtime_ns}|{st.st_size}|{max_size}|{quality}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(src_path))[0]
+    return os.path.join(cache_dir, f"{stem}_{max_size}q{quality}_{digest}.jpg")
+
+
+def make_thumbnail(src_path: str, max_size: int, quality: int = 80, cache_dir: str = None) -> str:
+    """
+    Return a JPEG derivative of src_path whose longest side is at most max_size px,
+    recompressed at `quality`. Derivatives are written once next to the source
+    (in a thumbs/ dir, or cache_dir) and reused on later calls.
+    Falls back to the source path if it cannot be decoded.
+    """
+    out_path = thumbnail_path(src_path, max_size, quality, cache_dir)
+    if os.path.exists(out_path):
+        return out_path
+
+    from PIL import Image as PILImage
+
+    try:
+        with PILImage.open(src_path) as im:
+            im = im.convert("RGB")
+            im.thumbnail((max_size, max_size), PILImage.LANCZOS)
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            tmp = f"{out_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            im.save(tmp, format="JPEG", quality=quality, optimize=True, progressive=True)
+    except Exception:
+        return src_path
+    os.replace(tmp, out_path)
+    return out_path
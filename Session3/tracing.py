@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, List, Optional
+
+
+class Tracer:
+    """
+    Collects timed spans (name, category, thread, duration, bytes, outcome) from any thread
+    and exports them in the Chrome trace event format, viewable in chrome://tracing or
+    https://ui.perfetto.dev.
+    """
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.events: List[Dict[str, Any]] = []
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self.t0) * 1e6
+
+    @contextmanager
+    def span(self, name: str, cat: str = "stage", **args):
+        """
+        Time the enclosed block. The yielded dict is recorded as the span's args, so callers
+        can add e.g. info["bytes"] = n. Outcome is "ok", or "error" with the exception text.
+        """
+        info = dict(args)
+        start = self._now_us()
+        try:
+            yield info
+            info.setdefault("outcome", "ok")
+        except BaseException as e:
+            info["outcome"] = "error"
+            info["error"] = str(e)[:500]
+            raise
+        finally:
+            self._add(name, cat, start, self._now_us() - start, info)
+
+    def mark(self, name: str, cat: str = "event", **args):
+        """Record an instant event, e.g. the arrival of the first streamed section."""
+        t = threading.current_thread()
+        with self._lock:
+            self._threads.setdefault(t.ident, t.name)
+            self.events.append({"name": name, "cat": cat, "ph": "i", "s": "p", "ts": round(self._now_us(), 1),
+                                "pid": os.getpid(), "tid": t.ident, "args": args})
+
+    def _add(self, name: str, cat: str, start_us: float, dur_us: float, args: Dict[str, Any]):
+        t = threading.current_thread()
+        with self._lock:
+            self._threads.setdefault(t.ident, t.name)
+            self.events.append({
+                "name": name, "cat": cat, "ph": "X",
+                "ts": round(start_us, 1), "dur": round(dur_us, 1),
+                "pid": os.getpid(), "tid": t.ident, "args": args,
+            })
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self._threads)
+        meta = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": tname}}
+                for tid, tname in threads.items()]
+        return {"traceEvents": meta + events, "displayTimeUnit": "ms"}
+
+    def export(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """One row per span name: count, total/max seconds, bytes and errors, slowest first."""
+        rows: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            events = list(self.events)
+        for e in events:
+            if e["ph"] != "X":
+                continue
+            r = rows.setdefault(e["name"], {"name": e["name"], "cat": e["cat"], "count": 0, "total_s": 0.0,
+                                            "max_s": 0.0, "bytes": 0, "errors": 0})
+            dur = e["dur"] / 1e6
+            r["count"] += 1
+            r["total_s"] += dur
+            r["max_s"] = max(r["max_s"], dur)
+            r["bytes"] += int(e["args"].get("bytes") or 0)
+            r["errors"] += e["args"].get("outcome") == "error"
+        out = sorted(rows.values(), key=lambda r: r["total_s"], reverse=True)
+        for r in out:
+            r["total_s"] = round(r["total_s"], 3)
+            r["max_s"] = round(r["max_s"], 3)
+        return out
+
+    def format_summary(self) -> str:
+        lines = [f"{'span':<22}{'n':>4}{'total':>9}{'max':>9}{'bytes':>12}  errors"]
+        for r in self.summary():
+            lines.append(f"{r['name']:<22}{r['count']:>4}{r['total_s']:>8.2f}s{r['max_s']:>8.2f}s{r['bytes']:>12}  {r['errors']}")
+        return "\n".join(lines)
+
+
+def span(tracer: Optional[Tracer], name: str, cat: str = "stage", **args):
+    """tracer.span(...) if there is a tracer, else a no-op context that still yields an args dict."""
+    return tracer.span(name, cat, **args) if tracer is not None else nullcontext(dict(args))
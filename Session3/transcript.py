@@ -0,0 +1,241 @@
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+from youtube import TranscriptSegment
+
+SENTENCE_END_RE = re.compile(r"[.?!…][\"')\]]*$")
+_WORD_NORM_RE = re.compile(r"[^\w']+")
+
+
+@dataclass
+class CompactionStats:
+    """Sizes before/after compaction. Token counts are count_tokens estimates, not Gemini's own count."""
+    segments_in: int
+    lines_out: int
+    chars_in: int
+    chars_out: int
+    tokens_in: int
+    tokens_out: int
+
+    @property
+    def char_reduction(self) -> float:
+        return 1 - self.chars_out / self.chars_in if self.chars_in else 0.0
+
+    @property
+    def token_reduction(self) -> float:
+        return 1 - self.tokens_out / self.tokens_in if self.tokens_in else 0.0
+
+    def __str__(self):
+        return (f"{self.segments_in} segments -> {self.lines_out} lines, "
+                f"chars {self.chars_in} -> {self.chars_out} (-{100 * self.char_reduction:.0f}%), "
+                f"est. tokens {self.tokens_in} -> {self.tokens_out} (-{100 * self.token_reduction:.0f}%)")
+
+
+_MMSS = [f"{m:02d}:{s:02d}" for m in range(60) for s in range(60)]  # index: seconds within the hour
+
+
+def format_timestamps(seconds: Sequence[float]) -> List[str]:
+    """
+    human_time() for a whole column at once. "mm:ss" comes from a precomputed table
+    instead of being formatted per segment; only the (rare) hours prefix is built.
+    """
+    mmss = _MMSS
+    out = []
+    for x in seconds:
+        t = int(x) if x > 0 else 0
+        out.append(mmss[t] if t < 3600 else f"{t // 3600:02d}:{mmss[t % 3600]}")
+    return out
+
+
+class ColumnarTranscript:
+    """
+    Transcript stored as columns instead of one TranscriptSegment object per caption:
+    start and duration arrays (array('d')), all text in one string, and offsets into it
+    (segment i is text[offsets[i]:offsets[i + 1]]). Segments are kept sorted by start,
+    so time lookups are a bisect.
+
+    Iterating yields TranscriptSegments, so it can be passed wherever a segment list is
+    read; to_segments() / from_segments() convert explicitly.
+    """
+
+    __slots__ = ("starts", "durs", "text", "offsets")
+
+    def __init__(self, starts: array, durs: array, text: str, offsets: array):
+        self.starts = starts
+        self.durs = durs
+        self.text = text
+        self.offsets = offsets
+
+    @classmethod
+    def from_segments(cls, segs: Iterable[TranscriptSegment]) -> "ColumnarTranscript":
+        if isinstance(segs, ColumnarTranscript):
+            return segs
+        segs = sorted(segs, key=lambda s: s.start)
+        starts = array("d", (s.start for s in segs))
+        durs = array("d", (s.dur for s in segs))
+        offsets = array("q", [0])
+        pos = 0
+        for s in segs:
+            pos += len(s.text)
+            offsets.append(pos)
+        return cls(starts, durs, "".join(s.text for s in segs), offsets)
+
+    def to_segments(self) -> List[TranscriptSegment]:
+        return list(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"starts": self.starts.tolist(), "durs": self.durs.tolist(), "text": self.text,
+                "offsets": self.offsets.tolist()}
+
+    @classmethod
+    def from_dict(cls, d: Union[Dict[str, Any], List[Dict[str, Any]]]) -> "ColumnarTranscript":
+        """Inverse of to_dict(); also accepts the older list of segment dicts."""
+        if isinstance(d, list):
+            return cls.from_segments(TranscriptSegment(**s) for s in d)
+        return cls(array("d", d["starts"]), array("d", d["durs"]), d["text"], array("q", d["offsets"]))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def text_at(self, i: int) -> str:
+        return self.text[self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, i: int) -> TranscriptSegment:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return TranscriptSegment(start=self.starts[i], dur=self.durs[i], text=self.text_at(i))
+
+    def __iter__(self) -> Iterator[TranscriptSegment]:
+        starts, durs, text, offsets = self.starts, self.durs, self.text, self.offsets
+        for i in range(len(starts)):
+            yield TranscriptSegment(start=starts[i], dur=durs[i], text=text[offsets[i]:offsets[i + 1]])
+
+    def _range(self, lo: int, hi: int) -> "ColumnarTranscript":
+        base = self.offsets[lo]
+        return ColumnarTranscript(self.starts[lo:hi], self.durs[lo:hi], self.text[base:self.offsets[hi]],
+                                  array("q", (o - base for o in self.offsets[lo:hi + 1])))
+
+    def index_at(self, t: float) -> int:
+        """Index of the segment being spoken at time t (the last one starting at or before t), -1 if none."""
+        return bisect_right(self.starts, t) - 1
+
+    def slice_time(self, start: float, end: float) -> "ColumnarTranscript":
+        """
+        Segments overlapping [start, end): the one in progress at `start` (if it has not
+        ended yet) and every segment starting before `end`. O(log n) plus the copy.
+        """
+        lo = max(self.index_at(start), 0)
+        if lo < len(self) and self.starts[lo] + self.durs[lo] <= start:
+            lo += 1
+        hi = max(bisect_left(self.starts, end), lo)
+        return self._range(lo, hi)
+
+    def to_text(self) -> str:
+        """Same output as youtube.segments_to_text(self.to_segments())."""
+        # one replace over the whole buffer; same length, so the offsets still apply
+        text, offsets = self.text.replace("\n", " "), self.offsets.tolist()
+        return "\n".join([f"[{stamp}] {text[a:b]}"
+                          for stamp, a, b in zip(format_timestamps(self.starts), offsets, offsets[1:])])
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimated token count: tiktoken's cl100k_base (an OpenAI tokenizer) when installed, else ~4
+    chars/token. Gemini tokenizes differently, so this is an approximation of what it will bill;
+    it is used for the compaction stats and the scheduler's tokens-per-minute budget, where
+    calling Gemini's count_tokens would cost a request of its own.
+    """
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+    except Exception:
+        return (len(text) + 3) // 4
+
+
+def _norm(word: str) -> str:
+    return _WORD_NORM_RE.sub("", word.lower())
+
+
+def _overlap(tail: List[str], words: List[str], prev_len: int = 0, max_overlap: int = 30,
+             min_words: int = 3) -> int:
+    """
+    Number of leading `words` that repeat the end of `tail` (rolling captions), or 0. Short
+    matches are ordinary speech ("... we do." / "We do this"), so a repeat only counts when it is
+    at least min_words long, or at least 2 words covering most of the previous segment (prev_len words).
+    """
+    tail_n = [_norm(w) for w in tail[-max_overlap:]]
+    words_n = [_norm(w) for w in words[:max_overlap]]
+    for k in range(min(len(tail_n), len(words_n)), 0, -1):
+        if tail_n[-k:] == words_n[:k]:
+            return k if k >= min_words or (k >= 2 and 2 * k > prev_len) else 0
+    return 0
+
+
+def compact_segments(segs: Iterable[TranscriptSegment], granularity: float = 10.0,
+                     max_chars: int = 500) -> List[TranscriptSegment]:
+    """
+    Merge short caption segments into lines of about `granularity` seconds and drop
+    rolling-caption overlap (words repeated from the end of the previous segment; see _overlap
+    for how long a repeat must be).
+    A line is closed once it spans `granularity` seconds, or at a sentence end once it
+    spans half of that, or when it reaches max_chars. Each line keeps the start time
+    of its first segment, so timestamps stay accurate to within `granularity`.
+    granularity=0 only removes the overlap and keeps one line per segment.
+    """
+    lines: List[TranscriptSegment] = []
+    tail: List[str] = []  # recent words, for overlap detection across segment boundaries
+    cur_start, cur_end, cur_words = None, 0.0, []
+
+    def flush():
+        if cur_words:
+            lines.append(TranscriptSegment(start=cur_start, dur=max(0.0, cur_end - cur_start), text=" ".join(cur_words)))
+
+    prev_len = 0
+    for s in segs:
+        words = s.text.replace("\n", " ").split()
+        n_words = len(words)
+        words = words[_overlap(tail, words, prev_len):]
+        if not words:
+            continue
+        tail = (tail + words)[-30:]
+        prev_len = n_words
+
+        if cur_words:
+            span = s.start - cur_start
+            text_len = sum(len(w) + 1 for w in cur_words)
+            at_sentence_end = SENTENCE_END_RE.search(cur_words[-1]) is not None
+            if (span >= granularity or (at_sentence_end and span >= granularity / 2)
+                    or text_len >= max_chars):
+                flush()
+                cur_words = []
+        if not cur_words:
+            cur_start = s.start
+        cur_words.extend(words)
+        cur_end = s.start + s.dur
+    flush()
+    return lines
+
+
+def compact_transcript(segs: Union[List[TranscriptSegment], ColumnarTranscript], granularity: Optional[float] = 10.0):
+    """
+    Build the prompt transcript text, compacted unless granularity is None.
+    Accepts a segment list or a ColumnarTranscript. Returns (text, CompactionStats).
+    """
+    segs = ColumnarTranscript.from_segments(segs)
+    raw_text = segs.to_text()
+    if granularity is None:
+        lines, text = segs, raw_text
+    else:
+        lines = ColumnarTranscript.from_segments(compact_segments(segs, granularity=granularity))
+        text = lines.to_text()
+    stats = CompactionStats(
+        segments_in=len(segs), lines_out=len(lines),
+        chars_in=len(raw_text), chars_out=len(text),
+        tokens_in=count_tokens(raw_text), tokens_out=count_tokens(text),
+    )
+    return text, stats
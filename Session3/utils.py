@@ -1,6 +1,8 @@
 import os
 import re
+import bisect
 import subprocess
+from typing import Optional, Sequence
 
 
 def ensure_dir(path: str):
@@ -18,17 +20,42 @@ def extract_video_id(url: str) -> str:
     raise ValueError(f"Could not parse a YouTube video ID from URL: {url}")
 
 
-def ffmpeg_screenshot(input_source: str, ts_seconds: float, out_path: str) -> None:
+def keyframe_seek_args(keyframes: Sequence[float], ts_seconds: float, snap: float = 0.0):
+    """
+    ffmpeg seek arguments for ts_seconds, guided by a sorted keyframe index.
+    If a keyframe lies within `snap` seconds, seek straight onto it so the very first
+    decoded frame is the one we want. Otherwise seek the input to the keyframe at or
+    before ts_seconds and decode forward only the remaining offset.
+    """
+    i = bisect.bisect_right(keyframes, ts_seconds) - 1
+    prev_kf = keyframes[i] if i >= 0 else 0.0
+    if snap > 0:
+        candidates = [keyframes[j] for j in (i, i + 1) if 0 <= j < len(keyframes)]
+        nearest = min(candidates, key=lambda k: abs(k - ts_seconds), default=None)
+        if nearest is not None and abs(nearest - ts_seconds) <= snap:
+            return ["-ss", f"{nearest:.6f}"], []
+    return ["-ss", f"{prev_kf:.6f}"], ["-ss", f"{max(0.0, ts_seconds - prev_kf):.6f}"]
+
+
+def ffmpeg_screenshot(input_source: str, ts_seconds: float, out_path: str,
+                      keyframes: Optional[Sequence[float]] = None, snap: float = 0.0) -> None:
     """
     Capture a single frame at ts_seconds from either a local file path
     or a remote media URL (e.g. from yt-dlp -g).
+    Pass the keyframe index of a local file (see media_cache.py) for index-guided seeks;
+    `snap` allows taking a keyframe up to that many seconds away instead of decoding forward.
     """
     ensure_dir(out_path)
+    if keyframes:
+        input_seek, output_seek = keyframe_seek_args(keyframes, ts_seconds, snap)
+    else:
+        input_seek, output_seek = ["-ss", str(ts_seconds)], []
     cmd = [
         "ffmpeg",
         "-y",
-        "-ss", str(ts_seconds),
+        *input_seek,
         "-i", input_source,
+        *output_seek,
         "-frames:v", "1",
         "-qscale:v", "2",  # high quality
         "-an", # disable audio processing
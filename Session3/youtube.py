@@ -1,9 +1,8 @@
 import os
+import threading
 from typing import List, Dict, Any
 from dataclasses import dataclass
 
-from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
-
 from utils import human_time
 
 @dataclass
@@ -81,6 +80,32 @@ def ytdlp_get_stream_url(url: str, resolution: int = 720) -> str:
         raise RuntimeError(f"Could not resolve a suitable stream URL for {url}")
 
 
+def ytdlp_playlist_urls(url: str) -> List[str]:
+    """
+    Expand a playlist (or channel) URL into watch URLs without resolving each video.
+    A plain video URL comes back as a single-item list.
+    """
+    import yt_dlp
+    ydl_opts = {
+        'quiet': True,
+        'skip_download': True,
+        'extract_flat': 'in_playlist',
+        'cachedir': False,
+        'ignoreerrors': True
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False) or {}
+
+    entries = info.get("entries")
+    if entries is None:
+        entries = [info]
+    urls = []
+    for e in entries:
+        if e and e.get("id"):
+            urls.append(f"https://www.youtube.com/watch?v={e['id']}")
+    return urls
+
+
 def ytdlp_download_best_mp4(url: str, out_dir: str) -> str:
     import yt_dlp
     os.makedirs(out_dir, exist_ok=True)
@@ -98,9 +123,25 @@ def ytdlp_download_best_mp4(url: str, out_dir: str) -> str:
         return ydl.prepare_filename(info).rsplit('.', 1)[0] + '.mp4'
 
 
+_local = threading.local()
+
+
+def _transcript_api():
+    """
+    One YouTubeTranscriptApi (and its HTTP session) per thread, imported on first use.
+    requests sessions are not thread-safe, and batch/job workers fetch transcripts concurrently.
+    """
+    if getattr(_local, "transcript_api", None) is None:
+        from youtube_transcript_api import YouTubeTranscriptApi
+        _local.transcript_api = YouTubeTranscriptApi()
+    return _local.transcript_api
+
+
 def fetch_transcript(video_id: str, lang: str = 'en', use_auto: bool = False) -> List[TranscriptSegment]:
+    from youtube_transcript_api import TranscriptsDisabled, NoTranscriptFound
+
     try:
-        ytt = YouTubeTranscriptApi()
+        ytt = _transcript_api()
         transcript_list = ytt.list(video_id)
         t = None
         try:
@@ -0,0 +1,321 @@
+"""
+Benchmarks for the CIFAR-10 training setup, on whatever device is available.
+
+    python bench.py data                           # epoch time of each data path, data loading only
+    python bench.py data --train --batches 20      # including forward/backward of Net
+    python bench.py albumentations --workers 0 2 4 # samples/sec of the albumentations dataset per worker
+    python bench.py autotune --batch-sizes 256 512 # re-run the DataLoader autotuner and show every setting
+    python bench.py steps --batch-size 64          # per-step overhead of syncing metrics every step vs every N
+    python bench.py precision --epochs 5           # fp32 vs bf16 autocast vs channels_last: img/s and accuracy
+    python bench.py compile --batch-sizes 1 64 512 # eager vs torch.compile vs FX-fused, per batch size
+"""
+import json
+import time
+import argparse
+import itertools
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torch.optim as optim
+from torch.utils.data import DataLoader, Dataset
+from torchvision import datasets
+
+import utils
+import optimize
+import dataset_transforms
+from model import Net
+
+
+def time_epoch(loader, step=None, max_batches=0):
+    """
+    Iterate loader once (or for max_batches), calling step(data, target) per batch.
+    Returns (seconds, images, batches).
+    """
+    t = time.perf_counter()
+    images = batches = 0
+    for data, target in loader:
+        if step is not None:
+            step(data, target)
+        images += len(target)
+        batches += 1
+        if max_batches and batches >= max_batches:
+            break
+    return time.perf_counter() - t, images, batches
+
+
+def make_train_step(device):
+    model = Net().to(device)
+    model.train()
+    optimizer = optim.SGD(model.parameters(), lr=0.01, momentum=0.9)
+
+    def step(data, target):
+        data, target = data.to(device), target.to(device)
+        optimizer.zero_grad()
+        loss = F.nll_loss(model(data), target)
+        loss.backward()
+        optimizer.step()
+
+    return step
+
+
+def report_row(name, loader, seconds, images, batches):
+    # Partial runs are scaled up to a full epoch
+    epoch_s = seconds * len(loader) / max(batches, 1)
+    row = {"path": name, "epoch_s": round(epoch_s, 2), "images_per_s": round(images / seconds, 1)}
+    print(f"{name:<34} epoch {row['epoch_s']:>8.2f}s  {row['images_per_s']:>10.1f} img/s")
+    return row
+
+
+def data_loaders(args, device):
+    """(name, loader) for every data path being compared."""
+    cuda = device.type == "cuda"
+    train_transforms, test_transforms = dataset_transforms.create_transformations()
+    train, _ = dataset_transforms.load_dataset(train_transforms, test_transforms)
+    for workers in args.workers:
+        yield f"torchvision PIL, {workers} workers", DataLoader(
+            train, batch_size=args.batch_size, shuffle=True, num_workers=workers, pin_memory=cuda)
+    tensor_train, tensor_test = dataset_transforms.load_tensor_dataset()
+    # flip only matches the torchvision train transforms; the default also shifts and cuts out
+    loader, _ = dataset_transforms.get_tensor_dataloaders(tensor_train, tensor_test, device, args.batch_size,
+                                                          shift=0, cutout=0)
+    yield "uint8 tensor, flip", loader
+    loader, _ = dataset_transforms.get_tensor_dataloaders(tensor_train, tensor_test, device, args.batch_size)
+    yield "uint8 tensor, flip+shift+cutout", loader
+
+
+def bench_data(args, device):
+    step = make_train_step(device) if args.train else None
+    rows = []
+    for name, loader in data_loaders(args, device):
+        for _ in range(args.epochs):
+            rows.append(report_row(name, loader, *time_epoch(loader, step, args.batches)))
+    return rows
+
+
+class PILAlbumentations(Dataset):
+    """The previous CIFAR10Albumentations: a PIL Image per sample, turned back into an array for Albumentations."""
+    def __init__(self, transform):
+        self.cifar10 = datasets.CIFAR10(root='./data', train=True, download=True)
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.cifar10)
+
+    def __getitem__(self, idx):
+        image, label = self.cifar10[idx]
+        return self.transform(image=np.array(image))['image'], label
+
+
+def bench_albumentations(args, device):
+    per_image, _ = dataset_transforms.create_albumentations_transforms()
+    per_batch, _ = dataset_transforms.create_albumentations_transforms(batch_normalize=True)
+    normalize = (dataset_transforms.CIFAR10_MEAN, dataset_transforms.CIFAR10_STD)
+    paths = [
+        ("PIL round trip", PILAlbumentations(per_image)),
+        ("shared array", dataset_transforms.CIFAR10Albumentations('./data', transform=per_image)),
+        ("shared array, batch normalize",
+         dataset_transforms.CIFAR10Albumentations('./data', transform=per_batch, normalize=normalize)),
+    ]
+    rows = []
+    for name, dataset in paths:
+        for workers in args.workers:
+            loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=True, num_workers=workers,
+                                persistent_workers=workers > 0)
+            for _ in range(args.epochs):
+                row = report_row(f"{name}, {workers} workers", loader, *time_epoch(loader, None, args.batches))
+                # the main process does the work when workers == 0
+                row["images_per_s_per_worker"] = round(row["images_per_s"] / max(workers, 1), 1)
+                print(f"{'':<34} {row['images_per_s_per_worker']:>25.1f} img/s per worker")
+                rows.append(row)
+    return rows
+
+
+def bench_autotune(args, device):
+    train_transforms, test_transforms = dataset_transforms.create_transformations()
+    train, _ = dataset_transforms.load_dataset(train_transforms, test_transforms)
+    batch_sizes = args.batch_sizes or (args.batch_size,)
+    step_s = utils.measure_step_time(Net().to(device), device, batch_sizes[0])
+    print(f"Net training step: {step_s * 1e3:.3f} ms/image ({1 / step_s:.1f} img/s)")
+    rows = []
+    best = utils.autotune_dataloader(train, device.type == "cuda", batch_sizes=batch_sizes, workers=args.workers,
+                                     max_batches=args.batches or 20, step_s_per_image=step_s, retune=True, results=rows)
+    print(f"{'batch':>6} {'workers':>7} {'persist':>7} {'prefetch':>8} {'epoch_s':>8} {'img/s':>9}  starving")
+    for r in sorted(rows, key=lambda r: r["epoch_s"]):
+        print(f"{r['batch_size']:>6} {r['num_workers']:>7} {str(r.get('persistent_workers', '-')):>7} "
+              f"{r.get('prefetch_factor', '-'):>8} {r['epoch_s']:>8.2f} {r['images_per_s']:>9.1f}  {r['starving'] if r['valid'] else 'invalid'}")
+    print("chosen:", best)
+    return rows
+
+
+def synthetic_batches(n_batches, batch_size, device):
+    # Random images already on the device, so only the training/eval loop itself is timed
+    return [(torch.randn(batch_size, 3, 32, 32, device=device), torch.randint(0, 10, (batch_size,), device=device))
+            for _ in range(n_batches)]
+
+
+def _synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+
+
+def bench_steps(args, device):
+    n_batches = args.batches or 50
+    batches = synthetic_batches(n_batches, args.batch_size, device)
+    rows = []
+    # sync_every=1 reads loss/accuracy back after every step, like the loop did before
+    for sync_every in sorted({1, args.sync_every}):
+        model = Net().to(device)
+        optimizer = optim.SGD(model.parameters(), lr=0.01, momentum=0.9)
+        utils.train(model, device, batches[:3], optimizer, 0, [], [], sync_every=sync_every)  # warm-up
+        _synchronize(device)
+        t = time.perf_counter()
+        utils.train(model, device, batches, optimizer, 0, [], [], sync_every=sync_every)
+        _synchronize(device)
+        seconds = time.perf_counter() - t
+        rows.append({"path": f"train, sync every {sync_every}", "step_ms": round(seconds / n_batches * 1000, 3),
+                     "images_per_s": round(n_batches * args.batch_size / seconds, 1)})
+    n_images = n_batches * args.batch_size
+    model = Net().to(device)
+    for eval_batch_size in sorted({args.batch_size, 1024}):
+        test_batches = synthetic_batches(max(n_images // eval_batch_size, 1), eval_batch_size, device)
+        utils.test(model, device, test_batches[:1], [], [])  # warm-up
+        t = time.perf_counter()
+        utils.test(model, device, test_batches, [], [])
+        seconds = time.perf_counter() - t
+        rows.append({"path": f"test, batch {eval_batch_size}", "step_ms": round(seconds / len(test_batches) * 1000, 3),
+                     "images_per_s": round(len(test_batches) * eval_batch_size / seconds, 1)})
+    for r in rows:
+        print(f"{r['path']:<34} {r['step_ms']:>9.2f} ms/batch  {r['images_per_s']:>10.1f} img/s")
+    return rows
+
+
+PRECISION_MODES = {
+    "fp32": dict(bf16=False, channels_last=False),
+    "bf16": dict(bf16=True, channels_last=False),
+    "fp32 channels_last": dict(bf16=False, channels_last=True),
+    "bf16 channels_last": dict(bf16=True, channels_last=True),
+}
+
+
+def train_for(args, device, train_loader, test_loader, bf16=False, channels_last=False):
+    """
+    Train a fresh Net for args.epochs epochs (args.batches batches each, if set) and test it.
+    Returns (training images/sec, final test accuracy).
+    """
+    torch.manual_seed(1)
+    model = Net().to(device)
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    optimizer = optim.SGD(model.parameters(), lr=0.01, momentum=0.9)
+    seconds = images = 0
+    for epoch in range(args.epochs):
+        loader = train_loader if not args.batches else list(itertools.islice(train_loader, args.batches))
+        t = time.perf_counter()
+        utils.train(model, device, loader, optimizer, epoch, [], [], bf16=bf16, channels_last=channels_last)
+        _synchronize(device)
+        seconds += time.perf_counter() - t
+        images += sum(len(target) for _, target in loader) if args.batches else len(train_loader.dataset)
+    test_acc = []
+    utils.test(model, device, test_loader, [], test_acc, bf16=bf16, channels_last=channels_last)
+    return images / seconds, test_acc[-1]
+
+
+def bench_precision(args, device):
+    train, test = dataset_transforms.load_tensor_dataset()
+    train_loader, test_loader = dataset_transforms.get_tensor_dataloaders(train, test, device, args.batch_size)
+    rows = []
+    for name, mode in PRECISION_MODES.items():
+        images_per_s, accuracy = train_for(args, device, train_loader, test_loader, **mode)
+        rows.append({"path": name, "images_per_s": round(images_per_s, 1), "test_acc": round(accuracy, 2)})
+    base = rows[0]["images_per_s"]
+    for r in rows:
+        print(f"{r['path']:<20} {r['images_per_s']:>10.1f} img/s  ({r['images_per_s'] / base:.2f}x fp32)  "
+              f"test accuracy {r['test_acc']:.2f}%")
+    return rows
+
+
+def latency_ms(fn, x, repeat=20):
+    """Median milliseconds of fn(x) after one warm-up call; also returns that first call's seconds."""
+    t = time.perf_counter()
+    fn(x)
+    first = time.perf_counter() - t
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn(x)
+        times.append(time.perf_counter() - t)
+    return sorted(times)[len(times) // 2] * 1000, first
+
+
+def bench_compile(args, device):
+    import torch._dynamo
+    torch._dynamo.config.cache_size_limit = 64  # one graph per batch size and train/eval mode
+
+    torch.manual_seed(1)
+    model = Net().to(device).eval()
+    infer = {
+        "eager": model,
+        "torch.compile": optimize.compile_model(model),
+        "fx fused": optimize.fuse_for_inference(model),
+        "fx fused + compile": optimize.compile_model(optimize.fuse_for_inference(model)),
+    }
+    train_model = Net().to(device).train()
+    optimizer = optim.SGD(train_model.parameters(), lr=0.01, momentum=0.9)
+    compiled_train = optimize.compile_model(train_model)
+
+    def train_step(net):
+        def step(batch):
+            data, target = batch
+            optimizer.zero_grad()
+            F.nll_loss(net(data), target).backward()
+            optimizer.step()
+        return step
+
+    rows = []
+    for batch_size in args.batch_sizes or (1, 32, 128, 512):
+        x = torch.randn(batch_size, 3, 32, 32, device=device)
+        target = torch.randint(0, 10, (batch_size,), device=device)
+        with torch.inference_mode():
+            results = {name: latency_ms(fn, x) for name, fn in infer.items()}
+        results["train eager"] = latency_ms(train_step(train_model), (x, target))
+        results["train torch.compile"] = latency_ms(train_step(compiled_train), (x, target))
+        for name, (ms, first) in results.items():
+            base = results["train eager" if name.startswith("train") else "eager"][0]
+            rows.append({"path": name, "batch_size": batch_size, "ms": round(ms, 3), "speedup": round(base / ms, 2),
+                         "first_call_s": round(first, 2)})
+            print(f"batch {batch_size:>4} {name:<22} {ms:>9.3f} ms  {base / ms:>5.2f}x  "
+                  f"first call {first:.2f}s")
+    print(f"Compiled kernels are cached in {optimize.COMPILE_CACHE_DIR}; a second run shows the cached first-call time.")
+    return rows
+
+
+BENCHES = {"data": bench_data, "albumentations": bench_albumentations, "autotune": bench_autotune,
+           "steps": bench_steps, "precision": bench_precision, "compile": bench_compile}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CIFAR-10 data and training paths.")
+    parser.add_argument("bench", choices=sorted(BENCHES))
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=None, help="autotune: batch sizes to try; compile: batch sizes to time")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4],
+                        help="DataLoader worker counts for the torchvision and albumentations paths")
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--batches", type=int, default=0, help="Stop each epoch after this many batches (0: full epoch)")
+    parser.add_argument("--train", action="store_true", help="Include a Net training step per batch")
+    parser.add_argument("--sync-every", type=int, default=50, help="steps: metrics sync interval to compare with 1")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    torch.manual_seed(1)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"device={device} threads={torch.get_num_threads()}")
+    rows = BENCHES[args.bench](args, device)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,67 @@
+import math
+
 import numpy as np
+import torch
 from torch.utils.data import Dataset
 from torchvision import datasets, transforms
 import albumentations as A
 from albumentations.pytorch import ToTensorV2
 
 
+CIFAR10_MEAN = (0.4914, 0.4822, 0.4465)
+CIFAR10_STD = (0.2470, 0.2435, 0.2616)
+
+
 class CIFAR10Albumentations(Dataset):
-    def __init__(self, root, train=True, download=True, transform=None):
-        self.cifar10 = datasets.CIFAR10(root=root, train=train, download=download)
+    """
+    CIFAR-10 for Albumentations, read straight from the uint8 (N, 32, 32, 3) array torchvision keeps in
+    memory instead of building a PIL Image per sample. The images are moved into shared memory once, so
+    DataLoader workers (forked or spawned) all read the same pages instead of holding a copy each.
+
+    With normalize=(mean, std), `transform` should leave out Normalize/ToTensorV2
+    (see create_albumentations_transforms(batch_normalize=True)): the DataLoader then fetches a whole
+    batch through __getitems__, which runs the random per-image transforms and normalizes and converts
+    the batch to a float NCHW tensor in one go.
+    """
+    def __init__(self, root, train=True, download=True, transform=None, normalize=None):
+        cifar10 = datasets.CIFAR10(root=root, train=train, download=download)
+        self.images = torch.from_numpy(cifar10.data).share_memory_()
+        self.targets = torch.tensor(cifar10.targets, dtype=torch.long).share_memory_()
         self.transform = transform
+        if normalize is not None:
+            mean, std = normalize
+            self.mean = np.array(mean, dtype=np.float32) * 255
+            self.std = np.array(std, dtype=np.float32) * 255
+        self.normalize = normalize
 
     def __len__(self):
-        return len(self.cifar10)
-
-    def __getitem__(self, idx):
-        image, label = self.cifar10[idx]
-        # Albumentations expects NumPy arrays, so convert PIL Image
-        image = np.array(image)
+        return len(self.targets)
 
+    def _image(self, idx):
+        image = self.images[idx].numpy()  # a view into the shared array, no copy
         if self.transform:
-            augmented = self.transform(image=image)
-            image = augmented['image']
+            image = self.transform(image=image)['image']
+        return image
+
+    def _to_tensor(self, images):
+        batch = np.stack(images).astype(np.float32)  # NHWC
+        batch -= self.mean
+        batch /= self.std
+        return torch.from_numpy(batch).permute(0, 3, 1, 2).contiguous()
+
+    def __getitem__(self, idx):
+        image = self._image(idx)
+        if self.normalize is not None:
+            image = self._to_tensor([image])[0]
+        return image, int(self.targets[idx])
 
-        return image, label
+    def __getitems__(self, indices):
+        # Called by DataLoader with all indices of a batch; the default collate stacks the result
+        images = [self._image(i) for i in indices]
+        labels = self.targets[indices].tolist()
+        if self.normalize is not None:
+            images = self._to_tensor(images).unbind(0)
+        return list(zip(images, labels))
 
 
 def create_transformations():
@@ -42,21 +81,21 @@ def create_transformations():
     return train_transforms, test_transforms
 
 
-def create_albumentations_transforms():
+def create_albumentations_transforms(batch_normalize=False):
+    # batch_normalize leaves Normalize/ToTensorV2 to CIFAR10Albumentations(normalize=...), per batch
+    to_tensor = [] if batch_normalize else [
+        A.Normalize(mean=(0.4914, 0.4822, 0.4465), std=(0.2471, 0.2435, 0.2616)),  # CIFAR-10 mean/std
+        ToTensorV2(),
+    ]
     train_transforms = A.Compose([
         A.HorizontalFlip(p=0.5),
         A.ShiftScaleRotate(shift_limit=0.0625, scale_limit=0.1, rotate_limit=10, p=0.5),
         # A.RandomBrightnessContrast(p=0.5),
         A.CoarseDropout(p=0.5, max_holes=1, max_height=16, max_width=16, min_holes=1, min_height=16, min_width=16,
                         fill_value=(0.4914, 0.4822, 0.4465), mask_fill_value=None), # CIFAR-10 mean as fill value
-        A.Normalize(mean=(0.4914, 0.4822, 0.4465), std=(0.2471, 0.2435, 0.2616)),  # CIFAR-10 mean/std
-        ToTensorV2(),
-    ])
+    ] + to_tensor)
 
-    test_transforms = A.Compose([
-        A.Normalize(mean=(0.4914, 0.4822, 0.4465), std=(0.2471, 0.2435, 0.2616)),
-        ToTensorV2(),
-    ])
+    test_transforms = A.Compose(to_tensor) if to_tensor else None
 
     return train_transforms, test_transforms
 
@@ -67,7 +106,116 @@ def load_dataset(train_transforms, test_transforms):
     return train, test
 
 
-def load_albumentations_dataset(train_transforms, test_transforms):
-    train = CIFAR10Albumentations(root='./data', train=True, download=True, transform=train_transforms)
-    test = CIFAR10Albumentations(root='./data', train=False, download=True, transform=test_transforms)
-    return train, test
\ No newline at end of file
+def load_albumentations_dataset(train_transforms, test_transforms, normalize=None):
+    train = CIFAR10Albumentations(root='./data', train=True, download=True, transform=train_transforms,
+                                  normalize=normalize)
+    test = CIFAR10Albumentations(root='./data', train=False, download=True, transform=test_transforms,
+                                 normalize=normalize)
+    return train, test
+
+
+class CIFAR10Tensor(Dataset):
+    """
+    The whole split decoded once into one uint8 tensor (N, 3, 32, 32) plus an int64 label tensor.
+    Items are raw uint8 images; use TensorBatchLoader to augment/normalize whole batches at once.
+    """
+    def __init__(self, root, train=True, download=True):
+        cifar10 = datasets.CIFAR10(root=root, train=train, download=download)
+        self.data = torch.from_numpy(cifar10.data).permute(0, 3, 1, 2).contiguous()  # NHWC -> NCHW
+        self.targets = torch.tensor(cifar10.targets, dtype=torch.long)
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getitem__(self, idx):
+        return self.data[idx], self.targets[idx]
+
+
+def random_shift(x, padding=4):
+    # Zero-pad every image by `padding` and cut a 32x32 window at a random offset per image (RandomCrop)
+    n, c, h, w = x.shape
+    x = torch.nn.functional.pad(x, (padding, padding, padding, padding))
+    dy = torch.randint(0, 2 * padding + 1, (n, 1), device=x.device)
+    dx = torch.randint(0, 2 * padding + 1, (n, 1), device=x.device)
+    rows = (torch.arange(h, device=x.device) + dy)[:, None, :, None]
+    cols = (torch.arange(w, device=x.device) + dx)[:, None, None, :]
+    batch = torch.arange(n, device=x.device)[:, None, None, None]
+    channels = torch.arange(c, device=x.device)[None, :, None, None]
+    return x[batch, channels, rows, cols]
+
+
+def random_cutout(x, size=16, p=0.5):
+    # One size x size hole per image (p of the images), centred anywhere so it can be clipped at the border
+    n, _, h, w = x.shape
+    cy = torch.randint(0, h, (n, 1, 1), device=x.device)
+    cx = torch.randint(0, w, (n, 1, 1), device=x.device)
+    ys = torch.arange(h, device=x.device)[None, :, None]
+    xs = torch.arange(w, device=x.device)[None, None, :]
+    top, left = cy - size // 2, cx - size // 2
+    hole = (ys >= top) & (ys < top + size) & (xs >= left) & (xs < left + size)
+    hole &= (torch.rand(n, 1, 1, device=x.device) < p)
+    return x.masked_fill(hole[:, None], 0.0)
+
+
+def batch_transform(x, mean=CIFAR10_MEAN, std=CIFAR10_STD, flip=False, shift=0, cutout=0):
+    """
+    uint8 batch (N, 3, H, W) -> normalized float batch. With flip, half the images are mirrored;
+    shift pads and randomly crops back (pixels); cutout zeroes a square hole after normalizing,
+    i.e. fills it with the dataset mean.
+    """
+    x = x.float().div_(255)
+    if flip:
+        mirror = torch.rand(x.shape[0], device=x.device) < 0.5
+        x = torch.where(mirror[:, None, None, None], x.flip(3), x)
+    if shift:
+        x = random_shift(x, shift)
+    mean = torch.tensor(mean, device=x.device).view(1, -1, 1, 1)
+    std = torch.tensor(std, device=x.device).view(1, -1, 1, 1)
+    x = x.sub_(mean).div_(std)
+    if cutout:
+        x = random_cutout(x, cutout)
+    return x
+
+
+class TensorBatchLoader:
+    """
+    DataLoader replacement for CIFAR10Tensor: the uint8 images are moved to `device` once, each
+    batch is sliced with one index op and transformed as a whole (see batch_transform), so no
+    per-sample PIL or worker processes are involved. Yields (data, target) like a DataLoader.
+    """
+    def __init__(self, dataset, batch_size=512, shuffle=True, device="cpu", drop_last=False, **transform_args):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.device = device
+        self.drop_last = drop_last
+        self.transform_args = transform_args
+        self.data = dataset.data.to(device)
+        self.targets = dataset.targets.to(device)
+
+    def __len__(self):
+        n = len(self.targets)
+        return n // self.batch_size if self.drop_last else math.ceil(n / self.batch_size)
+
+    def __iter__(self):
+        n = len(self.targets)
+        order = torch.randperm(n, device=self.device) if self.shuffle else None
+        for i in range(len(self)):
+            batch = slice(i * self.batch_size, (i + 1) * self.batch_size)
+            idx = batch if order is None else order[batch]
+            data, target = self.data[idx], self.targets[idx]
+            yield batch_transform(data, **self.transform_args), target
+
+
+def load_tensor_dataset():
+    train = CIFAR10Tensor(root='./data', train=True, download=True)
+    test = CIFAR10Tensor(root='./data', train=False, download=True)
+    return train, test
+
+
+def get_tensor_dataloaders(train, test, device, batch_size=512, flip=True, shift=4, cutout=16, eval_batch_size=1024):
+    # Train batches get the same augmentations as the albumentations path (flip, shift, 16px cutout)
+    train_loader = TensorBatchLoader(train, batch_size, shuffle=True, device=device, flip=flip, shift=shift,
+                                     cutout=cutout)
+    test_loader = TensorBatchLoader(test, max(eval_batch_size, batch_size), shuffle=False, device=device)
+    return train_loader, test_loader
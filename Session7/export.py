@@ -0,0 +1,245 @@
+"""
+Inference export of a trained Net: BatchNorm folded into the convolutions, Dropout removed and the
+GAP + 1x1 conv17 head turned into a Linear layer. The result is checked against the original and
+saved as TorchScript.
+
+    python export.py --checkpoint model_cifar.pt --out model_cifar_folded.pt --test-data
+    python export.py --random        # no checkpoint: random BN statistics, for checking/benchmarking
+
+Net's blocks are Conv -> ReLU -> BN, so with the ReLU in between a BN cannot simply be merged into
+the conv before it. Each BN (y = a * relu(z) + b per channel) is folded:
+  - into the next conv when that conv has no padding (or into the head): it just sees scaled and
+    shifted inputs, so its weights are scaled by a and b moves into its bias. With zero padding the
+    padded border would turn into b, so this is only exact for padding=0;
+  - otherwise into the previous conv when every a > 0, since a * relu(z) = relu(a * z); only the
+    "+ b" remains, as a ChannelShift after the ReLU;
+  - otherwise it stays as a per-channel ChannelAffine.
+"""
+import time
+import argparse
+
+import torch
+import torch.nn as nn
+import torch.fx as fx
+import torch.nn.functional as F
+
+from model import Net
+
+
+class ChannelShift(nn.Module):
+    def __init__(self, shift):
+        super().__init__()
+        self.register_buffer("shift", shift.view(1, -1, 1, 1))
+
+    def forward(self, x):
+        return x + self.shift
+
+
+class ChannelAffine(nn.Module):
+    def __init__(self, scale, shift):
+        super().__init__()
+        self.register_buffer("scale", scale.view(1, -1, 1, 1))
+        self.register_buffer("shift", shift.view(1, -1, 1, 1))
+
+    def forward(self, x):
+        return torch.addcmul(self.shift, x, self.scale)
+
+
+class FoldedNet(nn.Module):
+    """Eval-only Net: conv(+bias) -> ReLU [-> shift/affine] blocks, global average pool, Linear."""
+    def __init__(self, features, pool, head):
+        super().__init__()
+        self.features = features
+        self.pool = pool
+        self.head = head
+
+    def forward(self, x):
+        x = self.pool(self.features(x)).flatten(1)
+        return F.log_softmax(self.head(x), dim=-1)
+
+
+def bn_affine(bn):
+    """Eval-mode BatchNorm2d as y = a * x + b per channel."""
+    a = bn.weight.detach() / torch.sqrt(bn.running_var + bn.eps)
+    b = bn.bias.detach() - bn.running_mean * a
+    return a, b
+
+
+def _biased_copy(conv):
+    new = nn.Conv2d(conv.in_channels, conv.out_channels, conv.kernel_size, stride=conv.stride, padding=conv.padding,
+                    dilation=conv.dilation, groups=conv.groups, bias=True, padding_mode=conv.padding_mode)
+    with torch.no_grad():
+        new.weight.copy_(conv.weight)
+        new.bias.copy_(conv.bias if conv.bias is not None else torch.zeros(conv.out_channels))
+    return new.to(conv.weight.device)
+
+
+def _fold_into_next(conv, a, b):
+    # conv sees a * x + b instead of x: scale its weights per input channel, move b into its bias
+    g = conv.groups
+    w = conv.weight.view(g, conv.out_channels // g, conv.in_channels // g, *conv.kernel_size)
+    a, b = a.view(g, 1, -1, 1, 1), b.view(g, 1, -1, 1, 1)
+    with torch.no_grad():
+        conv.bias += (w * b).sum(dim=(2, 3, 4)).reshape(-1)
+        conv.weight.copy_((w * a).view_as(conv.weight))
+
+
+def _blocks(model):
+    """[(conv, bn), ...] in forward order, plus the pool and head conv, read from Net's FX graph."""
+    gm = fx.symbolic_trace(model)
+    modules = [gm.get_submodule(n.target) for n in gm.graph.nodes if n.op == "call_module"]
+    blocks, pool, head, i = [], None, None, 0
+    while i < len(modules):
+        m = modules[i]
+        if isinstance(m, nn.Conv2d) and i + 2 < len(modules) and isinstance(modules[i + 1], nn.ReLU) \
+                and isinstance(modules[i + 2], nn.BatchNorm2d):
+            blocks.append((m, modules[i + 2]))
+            i += 3
+        elif isinstance(m, nn.Dropout):
+            i += 1
+        elif isinstance(m, nn.AvgPool2d) and pool is None:
+            pool = m
+            i += 1
+        elif isinstance(m, nn.Conv2d) and pool is not None and i == len(modules) - 1 and m.kernel_size == (1, 1):
+            head = m
+            i += 1
+        else:
+            raise ValueError(f"Unexpected layer for export: {m}")
+    if pool is None or head is None:
+        raise ValueError("Expected the model to end with AvgPool2d and a 1x1 Conv2d head")
+    return blocks, pool, head
+
+
+def export_inference(model):
+    """Build the folded eval-only FoldedNet from a (trained) Net. The original is left untouched."""
+    model = model.eval()
+    blocks, pool, head_conv = _blocks(model)
+    convs = [_biased_copy(conv) for conv, _ in blocks]
+    head = nn.Linear(head_conv.in_channels, head_conv.out_channels, bias=True).to(head_conv.weight.device)
+    with torch.no_grad():
+        head.weight.copy_(head_conv.weight.view(head_conv.out_channels, -1))
+        head.bias.copy_(head_conv.bias if head_conv.bias is not None else torch.zeros(head_conv.out_channels))
+
+    after_relu = [None] * len(blocks)
+    for i, (_, bn) in enumerate(blocks):
+        a, b = bn_affine(bn)
+        if i + 1 == len(blocks):
+            # average pooling is linear, so the last BN commutes with it and folds into the head
+            with torch.no_grad():
+                head.bias += head.weight @ b
+                head.weight *= a
+        elif all(p == 0 for p in convs[i + 1].padding):
+            _fold_into_next(convs[i + 1], a, b)
+        elif bool((a > 0).all()):
+            with torch.no_grad():
+                convs[i].weight *= a.view(-1, 1, 1, 1)
+                convs[i].bias *= a
+            after_relu[i] = ChannelShift(b)
+        else:
+            after_relu[i] = ChannelAffine(a, b)
+
+    layers = []
+    for conv, extra in zip(convs, after_relu):
+        layers += [conv, nn.ReLU(inplace=True)] + ([extra] if extra is not None else [])
+    return FoldedNet(nn.Sequential(*layers), nn.AvgPool2d(pool.kernel_size), head).eval()
+
+
+def summarize(folded):
+    # one BN per conv in the original
+    shifts = sum(isinstance(m, ChannelShift) for m in folded.modules())
+    affine = sum(isinstance(m, ChannelAffine) for m in folded.modules())
+    convs = sum(isinstance(m, nn.Conv2d) for m in folded.modules())
+    return (f"{convs} convs + linear head; of {convs} BNs {convs - shifts - affine} folded fully, "
+            f"{shifts} left as channel shifts, {affine} kept as affine")
+
+
+@torch.inference_mode()
+def verify(original, exported, inputs, atol=1e-3):
+    """Max absolute difference of the log-probabilities and top-1 agreement; raises beyond atol."""
+    original.eval()
+    diff, agree, n = 0.0, 0, 0
+    for x in inputs:
+        ref, out = original(x), exported(x)
+        diff = max(diff, (ref - out).abs().max().item())
+        agree += (ref.argmax(1) == out.argmax(1)).sum().item()
+        n += len(x)
+    if diff > atol:
+        raise AssertionError(f"Exported model differs from the original by {diff:.2e} (> {atol:.0e})")
+    return diff, agree / n
+
+
+@torch.inference_mode()
+def latency_table(models, device, batch_sizes=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512), repeat=20):
+    """{name: {batch_size: median ms}} for every model in models."""
+    table = {name: {} for name in models}
+    for batch_size in batch_sizes:
+        x = torch.randn(batch_size, 3, 32, 32, device=device)
+        for name, model in models.items():
+            model(x)  # warm-up
+            times = []
+            for _ in range(repeat):
+                t = time.perf_counter()
+                model(x)
+                times.append(time.perf_counter() - t)
+            table[name][batch_size] = sorted(times)[len(times) // 2] * 1000
+    return table
+
+
+def randomize_bn(model, seed=0):
+    # Trained-looking BN statistics (and some negative scales) so that every folding case is exercised
+    g = torch.Generator().manual_seed(seed)
+    with torch.no_grad():
+        for m in model.modules():
+            if isinstance(m, nn.BatchNorm2d):
+                n = m.num_features
+                m.running_mean.copy_(torch.randn(n, generator=g) * 0.5)
+                m.running_var.copy_(torch.rand(n, generator=g) + 0.5)
+                m.weight.copy_(torch.randn(n, generator=g).abs() + 0.5)
+                m.bias.copy_(torch.randn(n, generator=g) * 0.2)
+        model.conv2[2].weight[0] *= -1  # one BN that can only stay affine
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export Net for inference with BatchNorm folded and Dropout removed.")
+    parser.add_argument("--checkpoint", default="model_cifar.pt", help="state_dict saved by main.py")
+    parser.add_argument("--random", action="store_true", help="Use random weights and BN statistics instead")
+    parser.add_argument("--out", default="model_cifar_folded.pt", help="TorchScript output path")
+    parser.add_argument("--atol", type=float, default=1e-3, help="Max allowed |diff| of the log-probabilities")
+    parser.add_argument("--test-data", action="store_true", help="Also compare predictions on the CIFAR-10 test set")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64, 128, 256, 512])
+    args = parser.parse_args()
+
+    device = torch.device("cpu")
+    torch.manual_seed(1)
+    model = Net().to(device)
+    if args.random:
+        randomize_bn(model)
+    else:
+        model.load_state_dict(torch.load(args.checkpoint, map_location=device))
+    model.eval()
+
+    exported = export_inference(model)
+    print("Exported:", summarize(exported))
+    inputs = [torch.randn(256, 3, 32, 32) for _ in range(4)]
+    if args.test_data:
+        import dataset_transforms
+        _, test = dataset_transforms.load_tensor_dataset()
+        inputs = [data for data, _ in dataset_transforms.TensorBatchLoader(test, 1024, shuffle=False, device=device)]
+    diff, agreement = verify(model, exported, inputs, atol=args.atol)
+    print(f"Max |diff| of log-probabilities: {diff:.2e} (atol {args.atol:.0e}), top-1 agreement {agreement * 100:.2f}%")
+
+    scripted = torch.jit.trace(exported, torch.randn(1, 3, 32, 32))
+    scripted.save(args.out)
+    print(f"Saved TorchScript to {args.out}")
+
+    table = latency_table({"original": model, "folded": exported, "folded (TorchScript)": scripted}, device,
+                          args.batch_sizes)
+    print(f"{'batch':>6} " + " ".join(f"{name:>22}" for name in table) + "   speedup")
+    for bs in args.batch_sizes:
+        ms = [table[name][bs] for name in table]
+        print(f"{bs:>6} " + " ".join(f"{m:>19.3f} ms" for m in ms) + f"   {ms[0] / min(ms[1:]):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,18 +4,34 @@ import torch.optim as optim
 
 import utils
 import dataset_transforms
+import optimize
 from model import Net
 
 
 if __name__ == "__main__":
     use_albumentations = False
+    # Keep the whole dataset as one uint8 tensor and augment whole batches (no PIL, no workers)
+    use_tensor_dataset = False
+    # Benchmark DataLoader workers/prefetching on this machine once and reuse the fastest settings
+    autotune_loader = False
+    # Opt-in CPU performance modes: bfloat16 autocast and NHWC (channels_last) tensors.
+    # Compare both against fp32 on the target machine with `python bench.py precision` first.
+    bf16 = False
+    channels_last = False
+    # Train through torch.compile (inductor); compiled kernels are cached in ~/.cache between runs
+    use_compile = False
+    checkpoint_path = "model_cifar.pt"
 
-    if use_albumentations:
-        # Create albumentations transforms
-        train_transforms, test_transforms = dataset_transforms.create_albumentations_transforms()
+    if use_tensor_dataset:
+        train, test = dataset_transforms.load_tensor_dataset()
+    elif use_albumentations:
+        # Create albumentations transforms, normalizing per batch instead of per image
+        train_transforms, test_transforms = dataset_transforms.create_albumentations_transforms(batch_normalize=True)
 
         # Load dataset with albumentations
-        train, test = dataset_transforms.load_albumentations_dataset(train_transforms, test_transforms)
+        train, test = dataset_transforms.load_albumentations_dataset(
+            train_transforms, test_transforms,
+            normalize=(dataset_transforms.CIFAR10_MEAN, dataset_transforms.CIFAR10_STD))
     else:
         # Create torch transforms
         train_transforms, test_transforms = dataset_transforms.create_transformations()
@@ -26,13 +42,19 @@ if __name__ == "__main__":
     # Set random seed and batch size
     use_cuda = utils.init_setup()
     batch_size = 512  # 256
-
-    # Create data loaders
-    train_loader, test_loader = utils.get_dataloaders(train, test, use_cuda, batch_size)
-
     device = torch.device("cuda" if use_cuda else "cpu")
+
     # print(device)
     model_cifar = Net().to(device)
+
+    # Create data loaders
+    if use_tensor_dataset:
+        train_loader, test_loader = dataset_transforms.get_tensor_dataloaders(train, test, device, batch_size)
+    else:
+        # The autotuner compares each loader setting against the model's own training step time
+        step_s = utils.measure_step_time(model_cifar, device, batch_size) if autotune_loader else None
+        train_loader, test_loader = utils.get_dataloaders(train, test, use_cuda, batch_size, autotune=autotune_loader,
+                                                          step_s_per_image=step_s)
     utils.model_summary(model_cifar)
 
     # Train and test accumulator variables
@@ -43,12 +65,20 @@ if __name__ == "__main__":
 
     # Training and test loop
     model_cifar = Net().to(device)
+    if channels_last:
+        model_cifar = model_cifar.to(memory_format=torch.channels_last)
     optimizer = optim.SGD(model_cifar.parameters(), lr=0.01, momentum=0.9)
+    if use_compile:
+        model_cifar = optimize.compile_model(model_cifar)
     EPOCHS = 100
     for epoch in range(EPOCHS):
         print("EPOCH:", epoch)
-        utils.train(model_cifar, device, train_loader, optimizer, epoch, train_losses, train_acc)
-        utils.test(model_cifar, device, test_loader, test_losses, test_acc)
+        utils.train(model_cifar, device, train_loader, optimizer, epoch, train_losses, train_acc,
+                    bf16=bf16, channels_last=channels_last)
+        utils.test(model_cifar, device, test_loader, test_losses, test_acc, bf16=bf16, channels_last=channels_last)
+
+    # Save the weights (of the uncompiled module) for export.py / quantize.py
+    torch.save(getattr(model_cifar, "_orig_mod", model_cifar).state_dict(), checkpoint_path)
 
     # Plot the graphs
     ## For colab, uncomment this:
@@ -0,0 +1,90 @@
+"""
+Faster execution paths for Net, which is a chain of small Conv2d -> ReLU -> BatchNorm2d -> Dropout blocks
+where per-op dispatch dominates at 32x32:
+
+- compile_model: torch.compile with the inductor backend (works on CPU), usable for training and
+  inference. Compiled kernels are cached on disk (COMPILE_CACHE_DIR), so later runs skip most of
+  the compile time.
+- fuse_for_inference: an FX pass for eval-only models that removes Dropout and merges each
+  ReLU -> BatchNorm2d pair into one ReLU + per-channel scale/shift op.
+"""
+import os
+import copy
+
+import torch
+import torch.nn as nn
+import torch.fx as fx
+
+COMPILE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "era4_session7", "inductor")
+
+
+def enable_compile_cache(cache_dir=COMPILE_CACHE_DIR):
+    # Must run before the first compilation: inductor reads its cache dir when it starts up
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", cache_dir)
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    try:
+        import torch._inductor.config as inductor_config
+        inductor_config.fx_graph_cache = True
+    except (ImportError, AttributeError):
+        pass  # older torch: the env vars still apply to the kernel cache
+
+
+def compile_model(model, mode=None, dynamic=False, cache_dir=COMPILE_CACHE_DIR):
+    """
+    torch.compile(model) with the inductor backend and the on-disk cache enabled. mode can be
+    "max-autotune" (slower to compile, sometimes faster kernels) or "reduce-overhead".
+    dynamic=False specializes on the batch size; the last, smaller batch of an epoch compiles once more.
+    """
+    enable_compile_cache(cache_dir)
+    return torch.compile(model, backend="inductor", mode=mode, dynamic=dynamic)
+
+
+class ReLUScaleShift(nn.Module):
+    """relu(x) * scale + shift per channel: an eval-mode ReLU -> BatchNorm2d pair as one fused op."""
+    def __init__(self, bn):
+        super().__init__()
+        scale = bn.weight.detach() / torch.sqrt(bn.running_var + bn.eps)
+        shift = bn.bias.detach() - bn.running_mean * scale
+        self.register_buffer("scale", scale.view(1, -1, 1, 1))
+        self.register_buffer("shift", shift.view(1, -1, 1, 1))
+
+    def forward(self, x):
+        return torch.addcmul(self.shift, torch.relu(x), self.scale)
+
+
+def _module(gm, node):
+    return gm.get_submodule(node.target) if node.op == "call_module" else None
+
+
+def fuse_for_inference(model):
+    """
+    Eval-only copy of model as an FX GraphModule: Dropout calls are removed and every
+    ReLU -> BatchNorm2d pair (whose ReLU output feeds nothing else) becomes one ReLUScaleShift.
+    The result must not be trained: BatchNorm statistics are frozen into buffers.
+    """
+    model = copy.deepcopy(model).eval()
+    gm = fx.symbolic_trace(model)
+    for node in list(gm.graph.nodes):
+        module = _module(gm, node)
+        if isinstance(module, nn.Dropout):
+            node.replace_all_uses_with(node.args[0])
+            gm.graph.erase_node(node)
+    for node in list(gm.graph.nodes):
+        module = _module(gm, node)
+        if not isinstance(module, nn.BatchNorm2d) or not module.track_running_stats:
+            continue
+        relu = node.args[0]
+        if not isinstance(_module(gm, relu), nn.ReLU) or len(relu.users) != 1:
+            continue
+        name = node.target.replace(".", "_") + "_relu_fused"
+        gm.add_submodule(name, ReLUScaleShift(module))
+        with gm.graph.inserting_after(node):
+            fused = gm.graph.call_module(name, args=(relu.args[0],))
+        node.replace_all_uses_with(fused)
+        gm.graph.erase_node(node)
+        gm.graph.erase_node(relu)
+    gm.graph.lint()
+    gm.delete_all_unused_submodules()
+    gm.recompile()
+    return gm
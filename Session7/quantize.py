@@ -0,0 +1,106 @@
+"""
+Static int8 post-training quantization of a trained Net for CPU serving (FX graph mode).
+
+    python quantize.py --checkpoint model_cifar.pt --calib-images 2000 --out model_cifar_int8.pt
+    python quantize.py --fold        # quantize the BN-folded export (export.py) instead of Net itself
+
+Every convolution, including both halves of depthwise_separable_layer, runs in int8. Conv -> ReLU
+pairs are fused into one quantized op. Activation ranges come from a calibration pass over a random
+subset of the training set, normalized like the test set without augmentation. The float and int8
+models are compared on the full test set, with latency per batch size and serialized size.
+"""
+import io
+import copy
+import argparse
+
+import torch
+
+import dataset_transforms
+from export import export_inference, latency_table
+from model import Net
+
+
+def calibration_batches(n_images=2000, batch_size=256, device="cpu", seed=0):
+    """Normalized train images (no augmentation) in random order, about n_images in total."""
+    train, _ = dataset_transforms.load_tensor_dataset()
+    torch.manual_seed(seed)
+    loader = dataset_transforms.TensorBatchLoader(train, batch_size, shuffle=True, device=device)
+    seen = 0
+    for data, _ in loader:
+        if seen >= n_images:
+            break
+        seen += len(data)
+        yield data
+
+
+def quantize_int8(model, calibration, backend="x86"):
+    """
+    int8 copy of an eval-mode float model: prepare_fx inserts observers (with the backend's default
+    qconfig: per-channel weights, histogram activation observers), calibration batches are run through
+    it, and convert_fx swaps in quantized kernels. Falls back to fbgemm on torch builds without x86.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    engine = backend if backend in torch.backends.quantized.supported_engines else "fbgemm"
+    torch.backends.quantized.engine = engine
+    model = copy.deepcopy(model).cpu().eval()
+    prepared = prepare_fx(model, get_default_qconfig_mapping(engine), example_inputs=(torch.randn(1, 3, 32, 32),))
+    with torch.no_grad():
+        for data in calibration:
+            prepared(data.cpu())  # observers run on CPU, like the quantized model
+    return convert_fx(prepared)
+
+
+@torch.inference_mode()
+def accuracy(model, loader):
+    correct = total = 0
+    for data, target in loader:
+        correct += (model(data).argmax(dim=1) == target).sum().item()
+        total += len(target)
+    return 100. * correct / total
+
+
+def model_size_mb(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Static int8 post-training quantization of Net for CPU.")
+    parser.add_argument("--checkpoint", default="model_cifar.pt", help="state_dict saved by main.py")
+    parser.add_argument("--fold", action="store_true", help="Quantize the BN-folded export from export.py")
+    parser.add_argument("--calib-images", type=int, default=2000, help="Training images used for calibration")
+    parser.add_argument("--backend", default="x86", choices=["x86", "fbgemm", "qnnpack"])
+    parser.add_argument("--out", default="model_cifar_int8.pt", help="TorchScript output path")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32, 128, 512])
+    args = parser.parse_args()
+
+    device = torch.device("cpu")
+    model = Net().to(device)
+    model.load_state_dict(torch.load(args.checkpoint, map_location=device))
+    model.eval()
+    float_model = export_inference(model) if args.fold else model
+
+    quantized = quantize_int8(float_model, calibration_batches(args.calib_images, device=device), backend=args.backend)
+    scripted = torch.jit.trace(quantized, torch.randn(1, 3, 32, 32))
+    scripted.save(args.out)
+    print(f"Saved int8 TorchScript ({torch.backends.quantized.engine}) to {args.out}")
+
+    _, test = dataset_transforms.load_tensor_dataset()
+    test_loader = dataset_transforms.TensorBatchLoader(test, 1024, shuffle=False, device=device)
+    float_acc, int8_acc = accuracy(float_model, test_loader), accuracy(scripted, test_loader)
+    float_mb, int8_mb = model_size_mb(float_model), model_size_mb(quantized)
+    print(f"Test accuracy: float {float_acc:.2f}%, int8 {int8_acc:.2f}% ({int8_acc - float_acc:+.2f})")
+    print(f"Model size: float {float_mb:.3f} MB, int8 {int8_mb:.3f} MB ({float_mb / int8_mb:.1f}x smaller)")
+
+    table = latency_table({"float": float_model, "int8": scripted}, device, args.batch_sizes)
+    print(f"{'batch':>6} {'float ms':>10} {'int8 ms':>10}  speedup")
+    for bs in args.batch_sizes:
+        f, q = table["float"][bs], table["int8"][bs]
+        print(f"{bs:>6} {f:>10.3f} {q:>10.3f}  {f / q:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+torch = pytest.importorskip("torch")
+utils = pytest.importorskip("utils")
+
+
+class SlowDataset(torch.utils.data.Dataset):
+    def __init__(self, n, delay=0.002):
+        self.n, self.delay = n, delay
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        time.sleep(self.delay)
+        return torch.tensor(float(i))
+
+
+def test_time_loader_backlog_larger_than_epoch():
+    # 5 batches per epoch, but 2 workers x prefetch 4 would prefetch 8 of them
+    loader = torch.utils.data.DataLoader(SlowDataset(40), batch_size=8, num_workers=2, prefetch_factor=4)
+    restart, per_batch = utils._time_loader(loader, max_batches=16, backlog=8)
+    assert restart is not None
+    # 8 samples x 2 ms over 2 workers: anything near zero means the epoch was used up by the warm-up
+    assert per_batch > 0.004
+
+
+def test_time_loader_without_batches():
+    loader = torch.utils.data.DataLoader(SlowDataset(0), batch_size=8)
+    assert utils._time_loader(loader, max_batches=4, backlog=0) == (None, None)
+
+
+def test_autotune_small_dataset(tmp_path):
+    rows = []
+    args = utils.autotune_dataloader(SlowDataset(40), False, batch_sizes=(8,), workers=(0, 2), prefetch_factors=(4,),
+                                     cache_path=str(tmp_path / "autotune.json"), results=rows)
+    assert all(r["valid"] for r in rows)
+    assert args["batch_size"] == 8
+
+
+def test_autotune_rejects_untimeable_settings(tmp_path):
+    with pytest.raises(ValueError):
+        utils.autotune_dataloader(SlowDataset(0), False, batch_sizes=(8,), workers=(0,),
+                                  cache_path=str(tmp_path / "autotune.json"))
@@ -1,3 +1,10 @@
+import os
+import copy
+import json
+import time
+import socket
+import itertools
+
 import torch
 import torch.nn.functional as F
 # import torch.optim as optim
@@ -21,18 +28,147 @@ def init_setup():
     return cuda
 
 
-def get_dataloaders(train, test, cuda, batch_size=128):
-    # batch_size = 512  # 256
-    cpu_batch_size = 128  # 64
+AUTOTUNE_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "era4_session7", "dataloader_autotune.json")
+_LOADER_KEYS = ("batch_size", "num_workers", "persistent_workers", "prefetch_factor", "pin_memory")
+
+
+def _time_loader(loader, max_batches, backlog, max_passes=3):
+    """
+    (restart seconds, steady-state seconds per batch). The first `backlog` batches (what the workers
+    prefetch: num_workers * prefetch_factor) arrive almost at once, so they are drained as warm-up;
+    the next max_batches batches give the rate the workers actually produce at. The warm-up always
+    leaves at least one batch of the epoch to time; when an epoch has fewer than max_batches left,
+    timing continues on a new pass (warmed up again), for up to max_passes passes. Restart is the
+    time to the first batch of a new pass, which re-spawns the workers unless they are persistent.
+    Returns (None, None) when no batch could be timed.
+    """
+    warmup = min(backlog + 1, len(loader) - 1)
+    n, elapsed = 0, 0.0
+    for _ in range(max_passes):
+        it = iter(loader)
+        for _ in range(warmup):
+            next(it)
+        t = time.perf_counter()
+        while n < max_batches and next(it, None) is not None:
+            n += 1
+        elapsed += time.perf_counter() - t
+        del it
+        if n >= max_batches:
+            break
+    if n == 0:
+        return None, None
+    t = time.perf_counter()
+    next(iter(loader))
+    restart = time.perf_counter() - t
+    return restart, elapsed / n
+
+
+def measure_step_time(model, device, batch_size, repeat=5):
+    """Seconds per image of a forward/backward pass of (a copy of) model, to compare loaders against."""
+    model = copy.deepcopy(model).to(device).train()
+    data = torch.randn(batch_size, 3, 32, 32, device=device)
+    target = torch.randint(0, 10, (batch_size,), device=device)
+    times = []
+    for _ in range(repeat + 1):  # the first pass is warm-up
+        t = time.perf_counter()
+        model.zero_grad()
+        F.nll_loss(model(data), target).backward()
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - t)
+    return sorted(times[1:])[repeat // 2] / batch_size
+
+
+def autotune_dataloader(dataset, cuda, batch_sizes=(128,), workers=None, prefetch_factors=(2, 4), max_batches=20,
+                        step_s_per_image=None, cache_path=AUTOTUNE_CACHE, retune=False, results=None):
+    """
+    Try DataLoader settings (batch size x worker count x persistent_workers x prefetch_factor) for
+    `dataset` on this machine and return the DataLoader kwargs with the shortest estimated epoch.
+    Each setting is timed in steady state (see _time_loader, at least twice the prefetch backlog);
+    a setting for which no batch could be timed is marked valid=False and never picked.
+    step_s_per_image is the training step time (see measure_step_time): a setting is starving when
+    it produces a batch slower than the model consumes one, and an epoch is estimated as the
+    restart time plus the slower of the two per batch. Starving settings are only picked if nothing
+    else is left; without step_s_per_image only the data rate is compared. The choice is cached per
+    host, dataset and candidate set in cache_path; retune=True measures again. Pass a list as
+    results to collect every measurement.
+    """
+    cpus = os.cpu_count() or 1
+    if workers is None:
+        workers = sorted({w for w in (0, 2, 4, cpus // 2, cpus) if w <= cpus})
+    key = "|".join([socket.gethostname(), f"cpus={cpus}", f"cuda={cuda}", type(dataset).__name__, str(len(dataset)),
+                    f"bs={list(batch_sizes)}", f"workers={list(workers)}", f"prefetch={list(prefetch_factors)}"])
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cache = json.load(f)
+    if key in cache and not retune:
+        return dict(cache[key]["loader_args"])
+
+    candidates = []
+    for batch_size, n_workers in itertools.product(batch_sizes, workers):
+        if n_workers == 0:
+            candidates.append(dict(batch_size=batch_size, num_workers=0))
+            continue
+        for persistent, prefetch in itertools.product((False, True), prefetch_factors):
+            candidates.append(dict(batch_size=batch_size, num_workers=n_workers, persistent_workers=persistent,
+                                   prefetch_factor=prefetch))
+    measured = []
+    for args in candidates:
+        if cuda:
+            args["pin_memory"] = True
+        loader = torch.utils.data.DataLoader(dataset, shuffle=True, **args)
+        backlog = args["num_workers"] * args.get("prefetch_factor", 0)
+        restart, per_batch = _time_loader(loader, max(max_batches, 2 * backlog), backlog)
+        del loader  # shuts persistent workers down
+        if per_batch is None:
+            row = dict(args, valid=False, epoch_s=float("inf"), restart_s=None, images_per_s=0.0, starving=False)
+        else:
+            step = (step_s_per_image or 0.0) * args["batch_size"]
+            row = dict(args, valid=True,
+                       epoch_s=round(restart + max(per_batch, step) * (len(dataset) / args["batch_size"] - 1), 3),
+                       restart_s=round(restart, 3), images_per_s=round(args["batch_size"] / per_batch, 1),
+                       starving=step_s_per_image is not None and per_batch > step)
+        measured.append(row)
+        print("autotune:", row)
+    if results is not None:
+        results.extend(measured)
+
+    valid = [r for r in measured if r["valid"]]
+    if not valid:
+        raise ValueError(f"No batch could be timed for any DataLoader setting ({len(dataset)} samples)")
+    best = min(valid, key=lambda r: (r["starving"], r["epoch_s"]))
+    loader_args = {k: v for k, v in best.items() if k in _LOADER_KEYS}
+    cache[key] = {"loader_args": loader_args, "epoch_s": best["epoch_s"], "tuned_at": time.time()}
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    with open(cache_path, "w") as f:
+        json.dump(cache, f, indent=2)
+    return dict(loader_args)
+
+
+def get_dataloaders(train, test, cuda, batch_size=128, autotune=False, eval_batch_size=1024, step_s_per_image=None):
+    """
+    Train loader: shuffled, batch_size images per batch, with num_workers=4 and pinned memory on
+    CUDA, or the settings found by autotune_dataloader (cached per host) when autotune is set;
+    pass step_s_per_image (measure_step_time) so it can tell which settings starve the model.
+    Test loader: evaluation only needs every image once in any order, so it is not shuffled and
+    uses bigger batches (eval_batch_size) with the same workers.
+    """
     # dataloader arguments - something you'll fetch these from cmdprmt
-    dataloader_args = dict(shuffle=True, batch_size=batch_size, num_workers=4, pin_memory=True) if cuda else dict(
-        shuffle=True, batch_size=cpu_batch_size)
+    if autotune:
+        train_args = autotune_dataloader(train, cuda, batch_sizes=(batch_size,), step_s_per_image=step_s_per_image)
+    else:
+        train_args = dict(batch_size=batch_size, num_workers=4, pin_memory=True) if cuda else dict(
+            batch_size=batch_size)
 
     # train dataloader
-    train_loader = torch.utils.data.DataLoader(train, **dataloader_args)
+    train_loader = torch.utils.data.DataLoader(train, shuffle=True, **train_args)
 
     # test dataloader
-    test_loader = torch.utils.data.DataLoader(test, **dataloader_args)
+    test_args = dict(train_args, batch_size=max(eval_batch_size, train_args["batch_size"]))
+    if test_args.get("num_workers", 0) > 0:
+        test_args["persistent_workers"] = True  # test runs every epoch; keep its workers alive
+    test_loader = torch.utils.data.DataLoader(test, shuffle=False, **test_args)
 
     return train_loader, test_loader
 
@@ -45,14 +181,57 @@ def model_summary(model):
     summary(model, input_size=(3, 32, 32))
 
 
-def train(model, device, train_loader, optimizer, epoch, train_losses, train_acc):
+class DeviceMetrics:
+    """
+    Running loss/accuracy kept as tensors on the training device. update() only queues device ops;
+    nothing waits for the device until sync() copies the sums to the host (one transfer for all).
+    """
+    def __init__(self, device):
+        self.loss_sum = torch.zeros((), device=device)
+        self.correct = torch.zeros((), device=device)
+        self.count = 0
+
+    def update(self, loss_sum, output, target):
+        # loss_sum is the batch loss summed over its samples (reduction='sum', or mean * batch size)
+        self.loss_sum += loss_sum.detach()
+        self.correct += (output.detach().argmax(dim=1) == target).sum()
+        self.count += len(target)
+
+    def sync(self):
+        """(average loss, accuracy in %, correct count) so far."""
+        loss_sum, correct = torch.stack([self.loss_sum, self.correct]).tolist()
+        n = max(self.count, 1)
+        return loss_sum / n, 100. * correct / n, int(correct)
+
+
+def autocast(device, bf16=False):
+    # bfloat16 autocast (matmuls/convs in bf16, reductions in fp32); a no-op unless bf16 is set
+    return torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=bf16)
+
+
+def to_device(data, device, channels_last=False):
+    data = data.to(device, non_blocking=True)
+    return data.contiguous(memory_format=torch.channels_last) if channels_last else data
+
+
+def train(model, device, train_loader, optimizer, epoch, train_losses, train_acc, sync_every=50, bf16=False,
+          channels_last=False):
+    """
+    One epoch. Loss and accuracy are accumulated on the device and only read back every sync_every
+    batches (and at the end of the epoch), so the host does not wait for the device after each step.
+    Each sync appends the mean loss of the batches since the previous sync to train_losses and the
+    running epoch accuracy to train_acc (plain floats).
+    bf16 runs the forward pass under bfloat16 autocast (weights and gradients stay float32);
+    channels_last feeds NHWC inputs, for a model already converted with
+    model.to(memory_format=torch.channels_last).
+    """
     model.train()
     pbar = tqdm(train_loader)
-    correct = 0
-    processed = 0
+    epoch_metrics = DeviceMetrics(device)
+    window = DeviceMetrics(device)
     for batch_idx, (data, target) in enumerate(pbar):
         # get samples
-        data, target = data.to(device), target.to(device)
+        data, target = to_device(data, device, channels_last), target.to(device, non_blocking=True)
 
         # Init
         optimizer.zero_grad()
@@ -60,54 +239,54 @@ def train(model, device, train_loader, optimizer, epoch, train_losses, train_acc
         # Because of this, when you start your training loop, ideally you should zero out the gradients so that you do the parameter update correctly.
 
         # Predict
-        y_pred = model(data)
+        with autocast(device, bf16):
+            y_pred = model(data)
 
-        # Calculate loss
-        loss = F.nll_loss(y_pred, target)
-        train_losses.append(loss)
+        # Calculate loss (in float32 also under bf16 autocast)
+        loss = F.nll_loss(y_pred.float(), target)
 
         # Backpropagation
         loss.backward()
         optimizer.step()
 
-        # Update pbar-tqdm
-
-        pred = y_pred.argmax(dim=1, keepdim=True)  # get the index of the max log-probability
-        correct += pred.eq(target.view_as(pred)).sum().item()
-        processed += len(data)
-
-        pbar.set_description(desc= f'Loss={loss.item()} Batch_id={batch_idx} Accuracy={100*correct/processed:0.2f}')
-        train_acc.append(100*correct/processed)
+        # Accumulate on device; sync and update pbar-tqdm every sync_every batches
+        loss_sum = loss.detach() * len(target)
+        epoch_metrics.update(loss_sum, y_pred, target)
+        window.update(loss_sum, y_pred, target)
+        if (batch_idx + 1) % sync_every == 0 or batch_idx + 1 == len(train_loader):
+            window_loss, _, _ = window.sync()
+            _, accuracy, _ = epoch_metrics.sync()
+            window = DeviceMetrics(device)
+            pbar.set_description(desc=f'Loss={window_loss:0.4f} Batch_id={batch_idx} Accuracy={accuracy:0.2f}')
+            train_losses.append(window_loss)
+            train_acc.append(accuracy)
 
     return train_losses, train_acc
 
 
-def test(model, device, test_loader, test_losses, test_acc):
+def test(model, device, test_loader, test_losses, test_acc, bf16=False, channels_last=False):
     model.eval()
-    test_loss = 0
-    correct = 0
-    with torch.no_grad():
+    metrics = DeviceMetrics(device)
+    # inference_mode: no autograd bookkeeping at all (cheaper than no_grad)
+    with torch.inference_mode(), autocast(device, bf16):
         for data, target in test_loader:
-            data, target = data.to(device), target.to(device)
-            output = model(data)
-            test_loss += F.nll_loss(output, target, reduction='sum').item()  # sum up batch loss
-            pred = output.argmax(dim=1, keepdim=True)  # get the index of the max log-probability
-            correct += pred.eq(target.view_as(pred)).sum().item()
+            data, target = to_device(data, device, channels_last), target.to(device, non_blocking=True)
+            output = model(data).float()
+            metrics.update(F.nll_loss(output, target, reduction='sum'), output, target)  # sum up batch loss
 
-    test_loss /= len(test_loader.dataset)
+    test_loss, accuracy, correct = metrics.sync()
     test_losses.append(test_loss)
 
     print('\nTest set: Average loss: {:.4f}, Accuracy: {}/{} ({:.2f}%)\n'.format(
-        test_loss, correct, len(test_loader.dataset),
-        100. * correct / len(test_loader.dataset)))
+        test_loss, correct, metrics.count, accuracy))
 
-    test_acc.append(100. * correct / len(test_loader.dataset))
+    test_acc.append(accuracy)
 
     return test_losses, test_acc
 
 
 def plot_graphs(train_losses, train_acc, test_losses, test_acc):
-    t = [t_items.item() for t_items in train_losses]
+    t = [float(t_items) for t_items in train_losses]  # floats, or loss tensors from older runs
 
     fig, axs = plt.subplots(2, 2, figsize=(15, 10))
     axs[0, 0].plot(t)